@@ -9,14 +9,24 @@ import torch
 
 import mosaic.utils
 from mosaic.hyperrectangle import HyperRectangle
+from plnn.bound_cache import get_bound_cache, dtype_tag
+from plnn.branching import LONGEST_EDGE, choose_dimension
+from plnn.work_queue import WorkQueue, DEPTH_FIRST
+from symbolic.symbolic_interval.interval import outward_cast
 
 
 class DomainExplorer:
-    def __init__(self, safe_property_index: int, device: torch.device, precision, rounding: int):
+    def __init__(self, safe_property_index: int, device: torch.device, precision, rounding: int, order: str = DEPTH_FIRST, queue_key=None, bound_cache: str = None, branching: str = LONGEST_EDGE,
+                 dtype=torch.float64):
         """
 
         :param safe_property_index: the index of the property. This property corresponds to "always on"
         The algorithm will check for lumps in the state space where the given property is always true
+        :param order: the exploration order of the domains, one of plnn.work_queue DEPTH_FIRST, BREADTH_FIRST, BEST_FIRST
+        :param queue_key: priority of a domain for BEST_FIRST (smallest first), the largest area is explored first by default
+        :param bound_cache: path of the on-disk cache of the bounds (see plnn.bound_cache), None to disable it
+        :param branching: strategy choosing the dimension to split, one of plnn.branching.STRATEGIES
+        :param dtype: dtype of the domains, float32 halves the memory of the batches of explore(batched=True) whose bounds are then rounded outward
         """
         self.device = device
         # self.initial_domain = domain
@@ -33,30 +43,67 @@ class DomainExplorer:
         # self.domain_width = domain.select(-1, 1) - domain.select(-1, 0)
         self.precision_constraints = [precision, precision, precision, precision]  # DomainExplorer.generate_precision(self.domain_width, precision)
         self.rounding = rounding
-
-    def explore(self, net: torch.nn.Module, domains: List[HyperRectangle], n_workers: int, debug=True, save=False):
+        self.order = order
+        self.queue_key = queue_key
+        self.bound_cache = bound_cache
+        self.branching = branching
+        self.dtype = dtype
+        self.layer_bounds = dict()  # domain bytes -> bounds of every linear layer of the domain (or of its parent), reused by the bounds of its children
+        self.chunk_size = 1024  # batch size used by explore(batched=True), adapted to the measured task latency
+        self.min_chunk_size = 64
+        self.max_chunk_size = 65536
+        self.target_task_time = 0.5  # seconds
+
+    def adapt_chunk_size(self, batch_size: int, elapsed: float):
+        """Scales the chunk size so that a single remote task takes about target_task_time seconds"""
+        if elapsed <= 0:
+            return
+        throughput = batch_size / elapsed
+        new_size = int(0.5 * self.chunk_size + 0.5 * throughput * self.target_task_time)  # smooth the measurements
+        self.chunk_size = max(self.min_chunk_size, min(self.max_chunk_size, new_size))
+
+    def explore(self, net: torch.nn.Module, domains: List[HyperRectangle], n_workers: int, debug=True, save=False, batched=False):
+        """
+        :param batched: evaluate the domains in large [B,2,d] batches with interval bound propagation (net.get_boundaries_batch) instead of solving one LP per domain,
+        the bounds are looser so more splits might be needed but each remote task does much more work
+        """
         message_queue = []
-        queue = []  # queue of domains to explore
+        queue = WorkQueue(self.order, self.queue_key)  # domains to split
+        to_process = WorkQueue(self.order, self.queue_key)  # domains to evaluate
         total_area = 0
         self.reset()  # reset statistics
         for domain in domains:
             tensor = torch.tensor(domain.to_tuple(), dtype=torch.float64).t()
-            queue.append(tensor)
+            tensor = torch.stack(outward_cast(tensor[0], tensor[1], self.dtype))  # the cast domain contains the original one
+            queue.push(tensor)
             total_area += mosaic.utils.area_tensor(tensor)
         total_area = max(total_area, 1e-16)
         # last_save = time.time()
-        while len(queue) > 0 or len(message_queue) > 0:
-            to_process = self.split_and_queue(queue, net)
-            queue = []
+        while len(queue) > 0 or len(message_queue) > 0 or len(to_process) > 0:
+            to_process.extend(self.split_and_queue(queue.pop_batch(len(queue)), net))
             while len(message_queue) < n_workers and len(to_process) != 0:
-                max_chunk_size = min(30, len(to_process))  # chunks of size 10
-                chunk = to_process[:max_chunk_size]
-                to_process = to_process[(max_chunk_size + 1):]
-                message_queue.insert(0, bab_remote.remote(chunk, self.safe_property_index, net))
+                if batched:
+                    chunk = to_process.pop_batch(self.chunk_size)
+                    message_queue.append(bab_remote_batch.remote(torch.stack(chunk), self.safe_property_index, net, self.bound_cache))
+                else:
+                    chunk = to_process.pop_batch(30)
+                    parent_bounds = [self.layer_bounds.pop(domain_bytes(domain), None) for domain in chunk]
+                    message_queue.append(bab_remote.remote(chunk, self.safe_property_index, net, self.bound_cache, parent_bounds))
             message_ready, message_queue = ray.wait(message_queue, len(message_queue), 0.5)  # retrieve the next ready item, wait at max 0.5 secs
             results = ray.get(message_ready)
             for result in results:
-                for explore, safe, unsafe in result:
+                if batched:
+                    batch, (safe_mask, unsafe_mask, explore_mask), elapsed = result
+                    self.adapt_chunk_size(len(batch), elapsed)
+                    for safe in batch[safe_mask]:
+                        self.safe_domains.append(safe)
+                        self.safe_area += mosaic.utils.area_tensor(safe)
+                    for unsafe in batch[unsafe_mask]:
+                        self.unsafe_domains.append(unsafe)
+                        self.unsafe_area += mosaic.utils.area_tensor(unsafe)
+                    queue.extend(batch[explore_mask])
+                    continue
+                for explore, safe, unsafe, layer_bounds in result:
                     if safe is not None:
                         self.safe_domains.append(safe)
                         self.safe_area += mosaic.utils.area_tensor(safe)
@@ -64,9 +111,11 @@ class DomainExplorer:
                         self.unsafe_domains.append(unsafe)
                         self.unsafe_area += mosaic.utils.area_tensor(unsafe)
                     if explore is not None:
-                        queue.insert(0, explore)
+                        queue.push(explore)
+                        if layer_bounds is not None:
+                            self.layer_bounds[domain_bytes(explore)] = layer_bounds
             if debug:
-                print(f"\rqueue length : {len(queue)}, # safe domains: {len(self.safe_domains)}, # unsafe domains: {len(self.unsafe_domains)}, abstract areas: [unknown:"
+                print(f"\rqueue length : {len(queue) + len(to_process)}, # safe domains: {len(self.safe_domains)}, # unsafe domains: {len(self.unsafe_domains)}, abstract areas: [unknown:"
                       f"{1 - (self.safe_area + self.unsafe_area + self.ignore_area) / total_area:.3%} --> safe:{self.safe_area / total_area:.3%}, unsafe:{self.unsafe_area / total_area:.3%}, ignore:{self.ignore_area / total_area:.3%}]",
                       end="")
         if debug:
@@ -78,7 +127,7 @@ class DomainExplorer:
             with open("./save/unsafe_domains.json", 'w+') as f:
                 f.write(jsonpickle.encode(self.unsafe_domains))
             with open("./save/queue.json", 'w+') as f:
-                f.write(jsonpickle.encode(queue))
+                f.write(jsonpickle.encode(queue.to_list()))
             print(f"Saved at {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime())}")
         # prepare stats
         stats = dict()
@@ -125,15 +174,17 @@ class DomainExplorer:
 
     def split_and_queue(self, queue, net: torch.nn.Module):
         message_queue = []
+        leaves = []  # domains too small to be split further, classified all together at the end
         for normed_domain in queue:
             # check max length
             length, dim = self.max_length(normed_domain)
             length = round(length, self.rounding)
+            parent_bounds = self.layer_bounds.pop(domain_bytes(normed_domain), None)
             if length <= self.precision_constraints[dim]:
-                self.store_approximation(normed_domain, net)
+                leaves.append(normed_domain)
             else:
                 # Genearate new, smaller (normalized) domains using box split.
-                ndoms = self.box_split(normed_domain, self.rounding)
+                ndoms = self.box_split(normed_domain, self.rounding, self.choose_split_dimension(normed_domain, net))
                 for i, ndom_i in enumerate(ndoms):
                     length, dim = self.max_length(ndom_i)
                     length = round(length, self.rounding)
@@ -141,23 +192,40 @@ class DomainExplorer:
                     if length <= self.precision_constraints[dim]:  # or area < min_area:
                         # too short or too small
                         # approximate the interval to the closest datapoint and determine if it is safe or not
-                        self.store_approximation(ndom_i, net)
+                        leaves.append(ndom_i)
                     else:
                         # queue up the next split at the beginning of the list
                         # message_queue.insert(0, bab_remote.remote(ndom_i, self.safe_property_index, net))
                         message_queue.append(ndom_i)
+                        if parent_bounds is not None:
+                            self.layer_bounds[domain_bytes(ndom_i)] = parent_bounds
+        self.store_approximations(leaves, net)
         return message_queue  # these need to be evaluated
 
+    def choose_split_dimension(self, normed_domain, net: torch.nn.Module):
+        """:return: the dimension to split according to self.branching, None for the longest edge"""
+        if self.branching == LONGEST_EDGE:
+            return None
+        lb, ub = normed_domain[0], normed_domain[1]
+        splittable = torch.tensor(np.round((ub - lb).cpu().numpy(), self.rounding) > np.array(self.precision_constraints[:len(lb)]))
+        return choose_dimension(self.branching, net, lb, ub, self.safe_property_index, splittable)
+
     def store_approximation(self, ndom_i, net: torch.nn.Module):
-        area = mosaic.utils.area_tensor(ndom_i)
-        action_values = self.assign_approximate_action(net, ndom_i)
-        value, index = torch.max(action_values, dim=0)
-        if index == self.safe_property_index:
-            self.safe_domains.append(ndom_i)
-            self.safe_area += area
-        else:
-            self.unsafe_domains.append(ndom_i)
-            self.unsafe_area += area
+        self.store_approximations([ndom_i], net)
+
+    def store_approximations(self, leaves: List[torch.Tensor], net: torch.nn.Module):
+        """Classifies the leaves with a single forward pass of the network on the centre of each domain"""
+        if len(leaves) == 0:
+            return
+        batch = torch.stack(leaves)  # [B,2,d]
+        areas = (batch.select(2, 1) - batch.select(2, 0)).prod(dim=1).abs()  # same as mosaic.utils.area_tensor for each domain
+        with torch.no_grad():
+            action_values = net(batch.mean(dim=1).to(torch.get_default_dtype()).to(self.device))
+        safe_mask = (torch.argmax(action_values, dim=1) == self.safe_property_index).cpu()
+        self.safe_domains.extend(batch[safe_mask])
+        self.safe_area += areas[safe_mask].sum().item()
+        self.unsafe_domains.extend(batch[~safe_mask])
+        self.unsafe_area += areas[~safe_mask].sum().item()
         if not self.hasIgnored:
             # print("The value has been ignored succesfully")
             self.hasIgnored = True
@@ -187,15 +255,10 @@ class DomainExplorer:
     @staticmethod
     def approximate_to_single_datapoint(normed_domain: torch.Tensor, precisions: List[float]) -> torch.Tensor:
         # dom_i = domain_lb.unsqueeze(dim=1) + domain_width.unsqueeze(dim=1) * normed_domain
-        mean_dom = torch.mean(normed_domain, dim=0)
-        results = []
-        for i, value in enumerate(mean_dom):
-            # result = mosaic.utils.custom_rounding(value.item(), 3, precisions[i])
-            result = float(value.item())
-            results.append(result)
-        return torch.tensor(results)
+        return torch.mean(normed_domain, dim=0).to(torch.get_default_dtype())
 
     def reset(self):
+        self.layer_bounds = dict()
         self.safe_domains = []
         self.safe_area = 0
         self.unsafe_domains = []
@@ -252,10 +315,10 @@ class DomainExplorer:
         return mosaic.utils.area_tensor(domain) < min_area
 
     @staticmethod
-    def box_split(domain, rounding: int):
+    def box_split(domain, rounding: int, dim: int = None):
         """
         Use box-constraints to split the input domain.
-        Split by dividing the domain into two from its longest edge.
+        Split by dividing the domain into two from its longest edge (or from dim if given).
         Assumes a rectangular domain, which is aligned with the cartesian
         coordinate frame.
 
@@ -266,11 +329,10 @@ class DomainExplorer:
         # Find the longest edge by checking the difference of lower and upper
         # limits in each dimension.
         diff = domain[1, :] - domain[0, :]
-        edgelength, dim = torch.max(diff, 0)
-
-        # Unwrap from tensor containers
-        edgelength = edgelength.item()
-        dim = dim.item()
+        if dim is None:
+            edgelength, dim = torch.max(diff, 0)
+            dim = dim.item()
+        edgelength = diff[dim].item()
 
         # Now split over dimension dim:
         half_length = edgelength / 2
@@ -315,23 +377,56 @@ class DomainExplorer:
 
 
 @ray.remote
-def bab_remote(normed_domains, safe_property_index, net):
+def bab_remote(normed_domains, safe_property_index, net, bound_cache: str = None, parent_bounds: list = None):
+    """
+    :param parent_bounds: for each domain, the bounds of every linear layer of the domain it was split from (or None)
+    :return: a list of (explore, safe, unsafe, layer bounds) tuples, the layer bounds are meant to be passed down to the children of the domains to explore
+    """
     result = []
-    for normed_domain in normed_domains:
-        dom_ub, dom_lb = net.get_boundaries(normed_domain, safe_property_index, False)
+    cache = get_bound_cache(bound_cache)
+    parents = {id(normed_domain): parent for normed_domain, parent in zip(normed_domains, parent_bounds if parent_bounds is not None else [None] * len(normed_domains))}
+    compute_fn = lambda domains: [net.get_boundaries_and_layers(domain, safe_property_index, parents[id(domain)]) for domain in domains]
+    boundaries = compute_fn(normed_domains) if cache is None else cache.cached(net.fingerprint(), safe_property_index, f"lp_layers_{dtype_tag(normed_domains[0].dtype)}", normed_domains, compute_fn)
+    for normed_domain, (dom_ub, dom_lb, layer_bounds) in zip(normed_domains, boundaries):
         assert dom_lb <= dom_ub, "lb must be lower than ub"
         if dom_ub < 0:
             # discard
-            result.append((None, None, normed_domain))
+            result.append((None, None, normed_domain, None))
         if dom_lb >= 0:
             # keep
-            result.append((None, normed_domain, None))
+            result.append((None, normed_domain, None, None))
         if dom_lb <= 0 <= dom_ub:
             # explore
-            result.append((normed_domain, None, None))
+            result.append((normed_domain, None, None, layer_bounds))
     return result
 
 
+@ray.remote
+def bab_remote_batch(normed_domains: torch.Tensor, safe_property_index, net, bound_cache: str = None):
+    """
+    Evaluates a whole batch of domains of shape [B,2,d] at once
+    :return: the batch, the (safe, unsafe, explore) boolean masks of shape [B] and the time spent computing the bounds
+    """
+    start = time.time()
+    cache = get_bound_cache(bound_cache)
+    if cache is None:
+        dom_ub, dom_lb = net.get_boundaries_batch(normed_domains, safe_property_index)
+    else:
+        compute_fn = lambda domains: list(zip(*[bounds.tolist() for bounds in net.get_boundaries_batch(torch.stack(domains), safe_property_index)]))
+        boundaries = cache.cached(net.fingerprint(), safe_property_index, f"ibp_{dtype_tag(normed_domains.dtype)}", list(normed_domains), compute_fn)
+        dom_ub = torch.tensor([ub for ub, lb in boundaries], dtype=torch.float64)
+        dom_lb = torch.tensor([lb for ub, lb in boundaries], dtype=torch.float64)
+    assert bool((dom_lb <= dom_ub).all()), "lb must be lower than ub"
+    safe_mask = dom_lb >= 0  # keep
+    unsafe_mask = dom_ub < 0  # discard
+    explore_mask = (dom_lb <= 0) & (dom_ub >= 0)  # explore
+    return normed_domains, (safe_mask, unsafe_mask, explore_mask), time.time() - start
+
+
+def domain_bytes(domain: torch.Tensor) -> bytes:
+    return domain.detach().cpu().numpy().tobytes()
+
+
 def run_once(f):
     def wrapper(*args, **kwargs):
         if not wrapper.has_run:
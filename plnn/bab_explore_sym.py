@@ -1,4 +1,5 @@
 import bisect
+import math
 import time
 from typing import List, Tuple
 
@@ -9,15 +10,32 @@ import torch
 
 import mosaic.utils
 from mosaic.hyperrectangle import HyperRectangle
+from plnn.bound_cache import get_bound_cache, dtype_tag
+from plnn.branching import LONGEST_EDGE, NEURON, ACTIVE, INACTIVE, choose_dimension, constrained_propagation, neuron_split_scores
+from plnn.interval_network_cache import FORWARD, get_interval_network
+from plnn.work_queue import WorkQueue, DEPTH_FIRST
 from symbolic.symbolic_interval import Symbolic_interval
+from symbolic.symbolic_interval.interval import outward_cast
 
 
 class SymbolicDomainExplorer:
-    def __init__(self, safe_property_index: int, device: torch.device, precision, rounding: int):
+    def __init__(self, safe_property_index: int, device: torch.device, precision, rounding: int, order: str = DEPTH_FIRST, queue_key=None, bound_cache: str = None, branching: str = LONGEST_EDGE,
+                 memory_budget: int = 2 ** 30, bound_method: str = FORWARD, edep_budget: int = None, dtype=torch.float64, neuron_split_depth: int = 4):
         """
 
         :param safe_property_index: the index of the property. This property corresponds to "always on"
         The algorithm will check for lumps in the state space where the given property is always true
+        :param order: the exploration order of the domains, one of plnn.work_queue DEPTH_FIRST, BREADTH_FIRST, BEST_FIRST
+        :param queue_key: priority of a domain for BEST_FIRST (smallest first), the largest area is explored first by default
+        :param bound_cache: path of the on-disk cache of the bounds (see plnn.bound_cache), None to disable it
+        :param branching: strategy choosing the dimension to split, one of plnn.branching.STRATEGIES,
+        or plnn.branching.NEURON to split the unstable ReLUs of the undecided domains before their longest edge (see refine_by_neuron_splits)
+        :param memory_budget: bytes available to the symbolic propagation of a chunk of domains, the chunk size is derived from it
+        :param bound_method: propagation method of the symbolic bounds, one of plnn.interval_network_cache.BOUND_METHODS
+        :param edep_budget: maximum number of error terms of each domain kept by the symbolic intervals (see symbolic_interval.interval.consolidate_edep), None for no limit
+        :param dtype: dtype of the domains and of the symbolic propagation, the bounds are rounded outward (see Symbolic_interval.outward_rounding) below float64.
+        float32 halves the memory of a chunk so the chunks are twice as large
+        :param neuron_split_depth: maximum number of neurons split in a row on each domain by the NEURON branching
         """
         self.device = device
         # self.initial_domain = domain
@@ -31,49 +49,82 @@ class SymbolicDomainExplorer:
         self.ignore_area = 0
         self.precision_constraints = [precision, precision, precision, precision]  # DomainExplorer.generate_precision(self.domain_width, precision)
         self.rounding = rounding
+        self.order = order
+        self.queue_key = queue_key
+        self.bound_cache = bound_cache
+        self.branching = branching
+        self.memory_budget = memory_budget
+        self.bound_method = bound_method
+        self.edep_budget = edep_budget
+        self.dtype = dtype
+        self.neuron_split_depth = neuron_split_depth
+        self.unstable_fraction = 0.1  # expected fraction of unstable ReLUs used by the memory estimate, doubled after every allocation failure
+        self.chunk_size = None
+
+    def adapt_chunk_size(self, net: torch.nn.Module, input_size: int):
+        """Largest number of domains whose symbolic propagation is estimated to fit in memory_budget"""
+        layers = list(net.base_network)
+        low, high = 1, 1
+        itemsize = torch.finfo(self.dtype).bits // 8
+        while high < 10 ** 7 and symbolic_peak_bytes(layers, input_size, high * 2, self.unstable_fraction, itemsize) <= self.memory_budget:
+            high *= 2
+        low, high = high, high * 2
+        while high - low > 1:
+            middle = (low + high) // 2
+            if symbolic_peak_bytes(layers, input_size, middle, self.unstable_fraction, itemsize) <= self.memory_budget:
+                low = middle
+            else:
+                high = middle
+        self.chunk_size = low
+        return self.chunk_size
 
     def explore(self, net: torch.nn.Module, domains: List[HyperRectangle], n_workers: int, debug=True, save=False):
-        message_queue = []
-        queue = []  # queue of domains to explore
+        queue = WorkQueue(self.order, self.queue_key)  # queue of domains to explore
         total_area = 0
         self.reset()  # reset statistics
         tensor = torch.tensor([x.to_tuple() for x in domains], dtype=torch.float64)
+        tensor = torch.stack(outward_cast(tensor[:, :, 0], tensor[:, :, 1], self.dtype), dim=2)  # the cast domains contain the original ones
         lbs = tensor[:, :, 0]
         ubs = tensor[:, :, 1]
         deltas = ubs - lbs
         total_area = sum([x.prod().item() for x in deltas])
-        while tensor is not None:
-            sub_tensors = torch.split(tensor, 50000, dim=0)
-            new_tensor_list = []
-            for sub_tensor in sub_tensors:
-                u, l = self.get_boundaries(net, sub_tensor)
-                queue = []
-                for i, (dom_ub, dom_lb) in enumerate(zip(u, l)):
-                    assert dom_lb <= dom_ub, "lb must be lower than ub"
-                    normed_domain = sub_tensor[i]
-                    if dom_ub < 0:
-                        # unsafe
-                        self.unsafe_domains.append(normed_domain)
-                        self.unsafe_area += mosaic.utils.area_tensor(normed_domain)
-                    if dom_lb > 0:
-                        # safe
-                        self.safe_domains.append(normed_domain)
-                        self.safe_area += mosaic.utils.area_tensor(normed_domain)
-                    if dom_lb <= 0 <= dom_ub:
-                        # explore
-                        to_process = self.split_and_queue([normed_domain], net)
-                        for x in to_process:
-                            queue.insert(0, x)
-                if len(queue) != 0:
-                    new_tensor_list.extend(queue)
-                if debug:
-                    print(f"\rqueue length : {len(queue)}, # safe domains: {len(self.safe_domains)}, # unsafe domains: {len(self.unsafe_domains)}, abstract areas: [unknown:"
-                          f"{1 - (self.safe_area + self.unsafe_area + self.ignore_area) / total_area:.3%} --> safe:{self.safe_area / total_area:.3%}, unsafe:{self.unsafe_area / total_area:.3%}, ignore:{self.ignore_area / total_area:.3%}]",
-                          end="")
-            if len(new_tensor_list) != 0:
-                tensor = torch.stack(new_tensor_list, 0)
+        queue.extend(tensor)
+        self.adapt_chunk_size(net, tensor.shape[1])
+        while len(queue) != 0:
+            sub_tensor = torch.stack(queue.pop_batch(self.chunk_size), 0)
+            u, l = self.get_boundaries(net, sub_tensor)
+            if u.dim() > 1:
+                # the property is the minimum over the distances from the other classes
+                u, l = torch.min(u, dim=1)[0], torch.min(l, dim=1)[0]
+            assert bool((l <= u).all()), "lb must be lower than ub"
+            areas = (sub_tensor.select(2, 1) - sub_tensor.select(2, 0)).prod(dim=1).abs()  # same as mosaic.utils.area_tensor for each domain
+            unsafe_mask = u < 0
+            safe_mask = l > 0
+            explore_mask = (l <= 0) & (u >= 0)
+            self.unsafe_domains.extend(sub_tensor[unsafe_mask])
+            self.unsafe_area += areas[unsafe_mask].sum().item()
+            self.safe_domains.extend(sub_tensor[safe_mask])
+            self.safe_area += areas[safe_mask].sum().item()
+            undecided = sub_tensor[explore_mask]
+            if self.branching == NEURON and len(undecided) != 0:
+                refined_safe = torch.zeros(len(undecided), dtype=torch.bool)
+                refined_unsafe = torch.zeros(len(undecided), dtype=torch.bool)
+                decidable = self.uniform_action_mask(net, undecided)  # the property changes sign in the others, only the input splits can decide them
+                refined_safe[decidable], refined_unsafe[decidable] = self.refine_by_neuron_splits(net, undecided[decidable])
+                undecided_areas = areas[explore_mask]
+                self.unsafe_domains.extend(undecided[refined_unsafe])
+                self.unsafe_area += undecided_areas[refined_unsafe].sum().item()
+                self.safe_domains.extend(undecided[refined_safe])
+                self.safe_area += undecided_areas[refined_safe].sum().item()
+                undecided = undecided[~(refined_safe | refined_unsafe)]
+            if self.branching in (LONGEST_EDGE, NEURON):
+                queue.extend(self.split_and_queue_batch(undecided, net))
             else:
-                tensor = None
+                queue.extend(self.split_and_queue(undecided, net))
+            if debug:
+                print(f"\rqueue length : {len(queue)}, # safe domains: {len(self.safe_domains)}, # unsafe domains: {len(self.unsafe_domains)}, abstract areas: [unknown:"
+                      f"{1 - (self.safe_area + self.unsafe_area + self.ignore_area) / total_area:.3%} --> safe:{self.safe_area / total_area:.3%}, unsafe:{self.unsafe_area / total_area:.3%}, ignore:{self.ignore_area / total_area:.3%}]",
+                      end="")
         if debug:
             print("\n")
         if save:
@@ -83,7 +134,7 @@ class SymbolicDomainExplorer:
             with open("./save/unsafe_domains.json", 'w+') as f:
                 f.write(jsonpickle.encode(self.unsafe_domains))
             with open("./save/queue.json", 'w+') as f:
-                f.write(jsonpickle.encode(queue))
+                f.write(jsonpickle.encode(queue.to_list()))
             print(f"Saved at {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime())}")
         # prepare stats
         stats = dict()
@@ -100,48 +151,186 @@ class SymbolicDomainExplorer:
         return stats
 
     def get_boundaries(self, net: torch.nn.Module, tensor):
+        cache = get_bound_cache(self.bound_cache)
+        if cache is None:
+            return self.compute_boundaries(net, tensor)
+        compute_fn = lambda domains: list(zip(*[bounds.tolist() for bounds in self.compute_boundaries(net, torch.stack(domains))]))  # plain floats, a view of a tensor would pickle its whole storage
+        bound_method = self.bound_method
+        method_tag = "symbolic" if bound_method == FORWARD else f"symbolic_{bound_method}"
+        if self.edep_budget is not None:
+            method_tag = f"{method_tag}_edep{self.edep_budget}"
+        method_tag = f"{method_tag}_{dtype_tag(tensor.dtype)}"  # the bounds are rounded outward below float64
+        boundaries = cache.cached(net.fingerprint(), 1, method_tag, list(tensor), compute_fn)
+        return torch.tensor([u for u, l in boundaries], dtype=tensor.dtype), torch.tensor([l for u, l in boundaries], dtype=tensor.dtype)
+
+    def compute_boundaries(self, net: torch.nn.Module, tensor):
         lbs = tensor[:, :, 0]
         ubs = tensor[:, :, 1]
-        ix = Symbolic_interval(lower=lbs, upper=ubs, use_cuda=False)
-        u, l = net.get_boundaries(ix, 1)
-        return u, l
+        try:
+            ix = Symbolic_interval(lower=lbs, upper=ubs, use_cuda=False, edep_budget=self.edep_budget, outward_rounding=lbs.dtype != torch.float64)
+            u, l = net.get_boundaries(ix, 1, self.bound_method)
+        except (RuntimeError, MemoryError) as e:
+            if not is_out_of_memory(e) or len(tensor) == 1:
+                raise
+            # back off: the estimate was too optimistic, retry in two halves and shrink the next chunks
+            self.unstable_fraction = min(1.0, self.unstable_fraction * 2)
+            self.chunk_size = max(1, min(self.chunk_size or len(tensor), len(tensor) // 2))
+            print(f"\nOut of memory with {len(tensor)} domains, chunk size reduced to {self.chunk_size}")
+            half = len(tensor) // 2
+            u1, l1 = self.compute_boundaries(net, tensor[:half])
+            u2, l2 = self.compute_boundaries(net, tensor[half:])
+            return torch.cat([u1, u2]), torch.cat([l1, l2])
+        return u.detach(), l.detach()
+
+    def refine_by_neuron_splits(self, net: torch.nn.Module, batch: torch.Tensor):
+        """
+        Tries to decide the domains [B,d,2] by splitting their unstable ReLUs instead of their inputs (Neurify-style).
+        The leaves of a domain are split one neuron at a time, on the unstable neuron with the largest relaxation error, up to neuron_split_depth times.
+        The phases are carried in the symbolic bounds and shrink the box of each leaf (see plnn.branching.constrained_propagation),
+        the leaves of all the domains are propagated together.
+        A domain is decided if the property has the same sign on all its feasible leaves, the other domains are left to the input splits
+        :return: the masks [B] of the safe and unsafe domains
+        """
+        can_be_safe = torch.ones(len(batch), dtype=torch.bool)
+        can_be_unsafe = torch.ones(len(batch), dtype=torch.bool)
+        if len(batch) == 0:
+            return can_be_safe, can_be_unsafe
+        inet = get_interval_network(net.base_network, 1, batch.dtype)  # same property as compute_boundaries
+        owners = torch.arange(len(batch))  # the domain of each leaf
+        leaves = batch
+        phases = None
+        for depth in range(self.neuron_split_depth + 1):
+            l, u, pre_lbs, pre_ubs, empty, lbs, ubs = self.constrained_boundaries(inet, leaves, phases)
+            if depth != 0:
+                # the bounds of the parent are sound for its leaves too
+                l, u = torch.max(l, parent_l), torch.min(u, parent_u)
+            can_be_safe[owners[(u < 0) & ~empty]] = False
+            can_be_unsafe[owners[(l > 0) & ~empty]] = False
+            open_mask = (l <= 0) & (u >= 0) & ~empty
+            best_scores, neurons = torch.max(neuron_split_scores(pre_lbs, pre_ubs), dim=1)
+            stuck = open_mask & ((best_scores <= 0) | (depth == self.neuron_split_depth))  # nothing left to split on these leaves
+            can_be_safe[owners[stuck]] = False
+            can_be_unsafe[owners[stuck]] = False
+            open_mask = open_mask & ~stuck & (can_be_safe | can_be_unsafe)[owners]
+            if not bool(open_mask.any()):
+                break
+            owners, neurons = owners[open_mask], neurons[open_mask]
+            parent_phases = torch.zeros_like(pre_lbs[open_mask], dtype=torch.int8) if phases is None else phases[open_mask]
+            rows = torch.arange(len(owners))
+            active = parent_phases.clone()
+            active[rows, neurons] = ACTIVE
+            inactive = parent_phases.clone()
+            inactive[rows, neurons] = INACTIVE
+            owners = owners.repeat(2)
+            phases = torch.cat([active, inactive])
+            leaves = torch.stack([lbs[open_mask], ubs[open_mask]], dim=2).repeat(2, 1, 1)
+            parent_l, parent_u = l[open_mask].repeat(2), u[open_mask].repeat(2)
+        return can_be_safe & ~can_be_unsafe, can_be_unsafe & ~can_be_safe
+
+    def uniform_action_mask(self, net: torch.nn.Module, batch: torch.Tensor) -> torch.Tensor:
+        """:return: the mask [B] of the domains [B,d,2] where the network chooses the same action at the centre and at the centre of every face"""
+        centres = batch.mean(dim=2)
+        half_widths = (batch.select(2, 1) - batch.select(2, 0)) / 2
+        offsets = torch.cat([torch.zeros_like(half_widths[:1]).expand(1, -1), torch.diag_embed(torch.ones_like(half_widths[0])), -torch.diag_embed(torch.ones_like(half_widths[0]))])
+        points = centres.unsqueeze(1) + offsets.unsqueeze(0) * half_widths.unsqueeze(1)  # [B,2d+1,d]
+        with torch.no_grad():
+            action_values = net(points.view(-1, batch.shape[1]).to(self.device, next(net.parameters()).dtype))
+        safe = (torch.argmax(action_values, dim=1) == self.safe_property_index).cpu().view(len(batch), -1)
+        return safe.all(dim=1) | ~safe.any(dim=1)
+
+    def constrained_boundaries(self, inet, batch: torch.Tensor, phases: torch.Tensor):
+        """
+        :return: the lower and upper bounds of the property, the pre-activation bounds, the mask of the infeasible leaves and the shrunk boxes of the leaves
+        [B,d,2] with the phases (see plnn.branching.constrained_propagation), computed in chunks
+        """
+        results = []
+        chunk_size = self.chunk_size or len(batch)
+        for start in range(0, len(batch), chunk_size):
+            chunk = batch[start:start + chunk_size]
+            chunk_phases = phases[start:start + chunk_size] if phases is not None else None
+            lower, upper, pre_lbs, pre_ubs, empty, lbs, ubs = constrained_propagation(inet, chunk[:, :, 0], chunk[:, :, 1], chunk_phases,
+                                                                                      self.edep_budget, outward_rounding=chunk.dtype != torch.float64)
+            # the property is the minimum over the distances from the other classes
+            results.append((torch.min(lower, dim=1)[0], torch.min(upper, dim=1)[0], pre_lbs, pre_ubs, empty, lbs, ubs))
+        return tuple(torch.cat(tensors) for tensors in zip(*results))
 
     hasIgnored = False
 
     def split_and_queue(self, queue, net: torch.nn.Module):
         message_queue = []
+        leaves = []  # domains too small to be split further, classified all together at the end
         for normed_domain in queue:
             # check max length
             length, dim = self.max_length(normed_domain)
             length = round(length, self.rounding)
             if length <= self.precision_constraints[dim]:
-                self.store_approximation(normed_domain, net)
+                leaves.append(normed_domain)
             else:
                 # Genearate new, smaller (normalized) domains using box split.
-                ndoms = self.box_split(normed_domain, self.rounding)
+                ndoms = self.box_split(normed_domain, self.rounding, self.choose_split_dimension(normed_domain, net))
                 for i, ndom_i in enumerate(ndoms):
                     length, dim = self.max_length(ndom_i)
                     length = round(length, self.rounding)
                     if length <= self.precision_constraints[dim]:  # or area < min_area:
                         # too short or too small
                         # approximate the interval to the closest datapoint and determine if it is safe or not
-                        self.store_approximation(ndom_i, net)
+                        leaves.append(ndom_i)
                     else:
                         # queue up the next split at the beginning of the list
                         # message_queue.insert(0, bab_remote.remote(ndom_i, self.safe_property_index, net))
                         message_queue.append(ndom_i)
+        self.store_approximations(leaves, net)
         return message_queue  # these need to be evaluated
 
+    def split_and_queue_batch(self, batch: torch.Tensor, net: torch.nn.Module):
+        """Same as split_and_queue with the longest edge split, for a whole batch [B,d,2] of domains at once"""
+        leaf_mask = self.leaf_mask(batch)
+        to_split = batch[~leaf_mask]
+        diff = to_split.select(2, 1) - to_split.select(2, 0)
+        edgelength, dims = torch.max(diff, dim=1)
+        rows = torch.arange(len(to_split))
+        new_values = torch.from_numpy(np.round((to_split[rows, dims, 1] - edgelength / 2).cpu().numpy(), self.rounding)).to(batch.dtype)
+        # dom1: Upper bound in the 'dim'th dimension is now at halfway point.
+        dom1 = to_split.clone()
+        dom1[rows, dims, 1] = new_values
+        # dom2: Lower bound in 'dim'th dimension is now at haflway point.
+        dom2 = to_split.clone()
+        dom2[rows, dims, 0] = new_values
+        children = torch.stack([dom1, dom2], dim=1).view(-1, batch.shape[1], 2)
+        child_leaf_mask = self.leaf_mask(children)
+        self.store_approximations(torch.cat([batch[leaf_mask], children[child_leaf_mask]]), net)
+        return children[~child_leaf_mask]  # these need to be evaluated
+
+    def leaf_mask(self, batch: torch.Tensor) -> torch.Tensor:
+        """:return: the mask of the domains [B,d,2] whose longest edge is within the precision constraints"""
+        length, dims = torch.max(batch.select(2, 1) - batch.select(2, 0), dim=1)
+        precisions = torch.tensor(self.precision_constraints, dtype=length.dtype)[dims]
+        return torch.from_numpy(np.round(length.cpu().numpy(), self.rounding)) <= precisions
+
+    def choose_split_dimension(self, normed_domain, net: torch.nn.Module):
+        """:return: the dimension to split according to self.branching, None for the longest edge"""
+        if self.branching in (LONGEST_EDGE, NEURON):
+            return None
+        lb, ub = normed_domain[:, 0], normed_domain[:, 1]
+        splittable = torch.tensor(np.round((ub - lb).cpu().numpy(), self.rounding) > np.array(self.precision_constraints[:len(lb)]))
+        return choose_dimension(self.branching, net, lb, ub, self.safe_property_index, splittable)
+
     def store_approximation(self, ndom_i, net: torch.nn.Module):
-        area = mosaic.utils.area_tensor(ndom_i)
-        action_values = self.assign_approximate_action(net, ndom_i)
-        value, index = torch.max(action_values, dim=0)
-        if index == self.safe_property_index:
-            self.safe_domains.append(ndom_i)
-            self.safe_area += area
-        else:
-            self.unsafe_domains.append(ndom_i)
-            self.unsafe_area += area
+        self.store_approximations([ndom_i], net)
+
+    def store_approximations(self, leaves, net: torch.nn.Module):
+        """Classifies the leaves (a list of domains or a tensor [B,d,2]) with a single forward pass of the network on the lower corner of each domain"""
+        if len(leaves) == 0:
+            return
+        batch = leaves if isinstance(leaves, torch.Tensor) else torch.stack(leaves)  # [B,d,2]
+        areas = (batch.select(2, 1) - batch.select(2, 0)).prod(dim=1).abs()  # same as mosaic.utils.area_tensor for each domain
+        with torch.no_grad():
+            action_values = net(torch.min(batch, dim=2)[0].to(self.device, next(net.parameters()).dtype))
+        safe_mask = (torch.argmax(action_values, dim=1) == self.safe_property_index).cpu()
+        self.safe_domains.extend(batch[safe_mask])
+        self.safe_area += areas[safe_mask].sum().item()
+        self.unsafe_domains.extend(batch[~safe_mask])
+        self.unsafe_area += areas[~safe_mask].sum().item()
         if not self.hasIgnored:
             # print("The value has been ignored succesfully")
             self.hasIgnored = True
@@ -221,10 +410,10 @@ class SymbolicDomainExplorer:
         return mosaic.utils.area_tensor(domain) < min_area
 
     @staticmethod
-    def box_split(domain, rounding: int):
+    def box_split(domain, rounding: int, dim: int = None):
         """
         Use box-constraints to split the input domain.
-        Split by dividing the domain into two from its longest edge.
+        Split by dividing the domain into two from its longest edge (or from dim if given).
         Assumes a rectangular domain, which is aligned with the cartesian
         coordinate frame.
 
@@ -235,11 +424,10 @@ class SymbolicDomainExplorer:
         # Find the longest edge by checking the difference of lower and upper
         # limits in each dimension.
         diff = domain[:, 1] - domain[:, 0]
-        edgelength, dim = torch.max(diff, 0)
-
-        # Unwrap from tensor containers
-        edgelength = edgelength.item()
-        dim = dim.item()
+        if dim is None:
+            edgelength, dim = torch.max(diff, 0)
+            dim = dim.item()
+        edgelength = diff[dim].item()
 
         # Now split over dimension dim:
         half_length = edgelength / 2
@@ -301,6 +489,27 @@ def bab_remote(normed_domains, safe_property_index, net):
     return result
 
 
+def symbolic_peak_bytes(layers: list, input_size: int, batch_size: int, unstable_fraction: float, itemsize: int = 8) -> int:
+    """
+    Estimate of the peak memory of the symbolic interval propagation of batch_size domains through layers:
+    idep is [batch, input, width], every layer with unstable ReLUs adds an edep block [unstable, width] and its [unstable, batch] index matrix
+    """
+    widths = [layer.out_features for layer in layers if type(layer) is torch.nn.Linear] + [1]  # the property layer
+    max_width = max(widths + [input_size])
+    elements = 4 * batch_size * max_width  # c, e, l, u
+    elements += batch_size * input_size * max_width  # idep
+    for layer_index, layer in enumerate(layers):
+        if type(layer) is torch.nn.ReLU:
+            width = layers[layer_index - 1].out_features
+            unstable = int(math.ceil(unstable_fraction * batch_size * width))
+            elements += unstable * max_width + unstable * batch_size  # edep and edep_ind
+    return 2 * elements * itemsize  # inputs and outputs of a layer are alive at the same time
+
+
+def is_out_of_memory(e: Exception) -> bool:
+    return isinstance(e, MemoryError) or "out of memory" in str(e) or "can't allocate memory" in str(e)
+
+
 def run_once(f):
     def wrapper(*args, **kwargs):
         if not wrapper.has_run:
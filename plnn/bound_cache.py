@@ -0,0 +1,131 @@
+"""
+Content-addressed on-disk cache of the bounds computed for a domain.
+The key is the hash of (network weights, property index, bounding method, domain bytes) so re-running an experiment with the same network,
+rounding and root domain mostly hits the cache. Entries are kept in a SQLite file shared by all the ray workers and the least recently used ones are
+evicted when the file grows beyond max_size bytes.
+"""
+import hashlib
+import pickle
+import sqlite3
+import time
+
+import numpy as np
+import torch
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS bounds (key BLOB PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS bounds_last_used ON bounds (last_used);
+"""
+open_caches = dict()  # path -> BoundCache, one connection per process
+
+
+def get_bound_cache(path: str):
+    """:return: the cache stored at path, None if path is None"""
+    if path is None:
+        return None
+    if path not in open_caches:
+        open_caches[path] = BoundCache(path)
+    return open_caches[path]
+
+
+def network_fingerprint(network: torch.nn.Module) -> str:
+    digest = hashlib.sha224()
+    for parameter in network.parameters():
+        digest.update(parameter.detach().cpu().numpy().tobytes())
+    return digest.hexdigest()
+
+
+def dtype_tag(dtype: torch.dtype) -> str:
+    """Suffix of the method of the bounds computed in dtype, domain_key hashes every domain as float64 so the dtypes must not share entries"""
+    return str(dtype).replace("torch.", "")
+
+
+def domain_key(fingerprint: str, property_index: int, method: str, domain) -> bytes:
+    if isinstance(domain, torch.Tensor):
+        domain = domain.detach().cpu().numpy()
+    domain = np.ascontiguousarray(domain, dtype=np.float64)
+    digest = hashlib.sha256(f"{fingerprint}:{property_index}:{method}:{domain.shape}".encode())
+    digest.update(domain.tobytes())
+    return digest.digest()
+
+
+class BoundCache:
+    def __init__(self, path: str, max_size: int = 2 ** 30):
+        """
+        :param max_size: maximum total size in bytes of the stored values
+        """
+        self.path = path
+        self.max_size = max_size
+        self.connection = sqlite3.connect(path, timeout=60)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, keys: list) -> list:
+        """:return: the cached value for each key, None when missing"""
+        results = dict()
+        for i in range(0, len(keys), 500):
+            batch = keys[i:i + 500]
+            for key, value in self.connection.execute(f"SELECT key, value FROM bounds WHERE key IN ({','.join('?' * len(batch))})", batch):
+                results[bytes(key)] = pickle.loads(value)
+        if len(results) != 0:
+            now = time.time()
+            self.connection.executemany("UPDATE bounds SET last_used = ? WHERE key = ?", [(now, key) for key in results])
+            self.connection.commit()
+        self.hits += len(results)
+        self.misses += len(keys) - len(results)
+        return [results.get(key) for key in keys]
+
+    def get(self, key: bytes):
+        return self.get_many([key])[0]
+
+    def put_many(self, items: list):
+        """:param items: list of (key, value)"""
+        if len(items) == 0:
+            return
+        now = time.time()
+        rows = []
+        for key, value in items:
+            data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+            rows.append((key, data, len(data), now))
+        self.connection.executemany("INSERT OR REPLACE INTO bounds (key, value, size, last_used) VALUES (?, ?, ?, ?)", rows)
+        self.connection.commit()
+        self.evict()
+
+    def put(self, key: bytes, value):
+        self.put_many([(key, value)])
+
+    def total_size(self) -> int:
+        return self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM bounds").fetchone()[0]
+
+    def evict(self):
+        """Deletes the least recently used entries until the cache is below 90% of max_size"""
+        excess = self.total_size() - self.max_size
+        if excess <= 0:
+            return
+        excess += self.max_size // 10
+        to_delete = []
+        for key, size in self.connection.execute("SELECT key, size FROM bounds ORDER BY last_used"):
+            to_delete.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        self.connection.executemany("DELETE FROM bounds WHERE key = ?", to_delete)
+        self.connection.commit()
+
+    def cached(self, fingerprint: str, property_index: int, method: str, domains: list, compute_fn) -> list:
+        """
+        Looks up the bounds of every domain and computes only the missing ones
+        :param compute_fn: function taking the list of missing domains and returning the list of their bounds
+        """
+        keys = [domain_key(fingerprint, property_index, method, domain) for domain in domains]
+        results = self.get_many(keys)
+        missing = [i for i, result in enumerate(results) if result is None]
+        if len(missing) != 0:
+            computed = compute_fn([domains[i] for i in missing])
+            for i, value in zip(missing, computed):
+                results[i] = value
+            self.put_many([(keys[i], value) for i, value in zip(missing, computed)])
+        return results
@@ -1,7 +1,12 @@
-import bisect
+import time
 
+import ray
 import torch
 
+from plnn.bound_cache import get_bound_cache
+from plnn.branching import LONGEST_EDGE, choose_dimension
+from plnn.work_queue import WorkQueue, BEST_FIRST
+
 use_cuda = False
 device = torch.device("cuda:0" if torch.cuda.is_available() and use_cuda else "cpu")
 
@@ -42,7 +47,8 @@ class CandidateDomain:
         return dom_area
 
 
-def bab(net, domain: torch.Tensor, true_class_index, eps=1e-3, decision_bound=None, save=True):
+def bab(net, domain: torch.Tensor, true_class_index, eps=1e-3, decision_bound=None, save=True, bound_cache: str = None, branching: str = LONGEST_EDGE,
+        n_workers: int = 1, batch_size: int = None, log_interval: float = 5.0):
     '''
     Uses branch and bound algorithm to evaluate the global minimum
     of a given neural network.
@@ -53,6 +59,15 @@ def bab(net, domain: torch.Tensor, true_class_index, eps=1e-3, decision_bound=No
                       before we consider having converged
     `decision_bound`: If not None, stop the search if the UB and LB are both
                       superior or both inferior to this value.
+    `bound_cache`   : If not None, path of the on-disk cache of the lower bounds
+                      (see plnn.bound_cache).
+    `branching`     : Strategy choosing the dimension to split, one of
+                      plnn.branching.STRATEGIES.
+    `n_workers`     : Number of ray workers evaluating the children of the
+                      frontier, 1 evaluates them in the current process.
+    `batch_size`    : Number of frontier domains split at every step,
+                      4 per worker by default.
+    `log_interval`  : Minimum number of seconds between two progress logs.
 
     Returns         : Lower bound and Upper bound on the global minimum,
                       as well as the point where the upper bound is achieved
@@ -63,130 +78,112 @@ def bab(net, domain: torch.Tensor, true_class_index, eps=1e-3, decision_bound=No
                                  torch.ones(nb_input_var)), 1)
     domain_lb = domain.select(-1, 0)
     domain_width = domain.select(-1, 1) - domain.select(-1, 0)
-    # domain_lb = domain_lb.contiguous().unsqueeze(4).expand(domain.size())
-    # domain_width = domain_width.contiguous().unsqueeze(4).expand(domain.size())
+    batch_size = 4 * n_workers if batch_size is None else batch_size
+    start = time.time()
+    last_log = start
 
-    global_ub_point, global_ub = net.get_upper_bound(domain, true_class_index)
-    global_lb = net.get_lower_bound(domain, true_class_index, save)
+    [(global_ub_point, global_ub, global_lb)] = evaluate_domains(net, [domain], true_class_index, save, bound_cache)
     assert global_lb <= global_ub, "lb must be lower than ub"
-    print(f'global_ub:{global_ub}')
-    print(f'global_lb:{global_lb}')
+    log_event("start", global_lb=global_lb, global_ub=global_ub)
     # Stopping criterion
-    if (decision_bound is not None) and (global_lb >= decision_bound):
-        return global_lb, global_ub, global_ub_point
-    elif global_ub < decision_bound:
+    if decided(global_lb, global_ub, decision_bound):
         return global_lb, global_ub, global_ub_point
 
-    # Use objects of type CandidateDomain to store domains with their bounds.
-    candidate_domain = CandidateDomain(lb=global_lb, ub=global_ub, dm=normed_domain)
-    domains = [candidate_domain]
-
-    # This counter is used to decide when to prune domains
-    prune_counter = 0
+    # The frontier is a heap of CandidateDomain ordered by lower bound, the normalised domains are stored
+    frontier = WorkQueue(BEST_FIRST, key=lambda candidate: candidate.lower_bound)
+    frontier.push(CandidateDomain(lb=global_lb, ub=global_ub, dm=normed_domain))
+    n_evaluated = 1
+    n_pruned = 0
 
     while global_ub - global_lb > eps:
-        # Pick a domain to branch over and remove that from our current list of
-        # domains. Also potentially perform some pruning on the way.
-        selected_candidate_domain = pick_out(domains, global_ub - eps)
-        print(f'Splitting domain')
+        # Pick the domains with the lowest lower bounds, the others cannot contain a better minimum
+        selected = []
+        while len(frontier) > 0 and len(selected) < batch_size:
+            candidate = frontier.pop()
+            if candidate.lower_bound >= global_ub - eps:
+                # every other domain in the heap has a larger lower bound
+                n_pruned += len(frontier) + 1
+                frontier = WorkQueue(BEST_FIRST, key=lambda candidate: candidate.lower_bound)
+                break
+            selected.append(candidate)
+        if len(selected) == 0:
+            # if there is no more domains, we have pruned them all.
+            global_lb = global_ub - eps
+            break
         # Genearate new, smaller (normalized) domains using box split.
-        ndoms = box_split(selected_candidate_domain.domain)
-
-        for i, ndom_i in enumerate(ndoms):
-            print(f'Domain #{i}')
-            # Find the upper and lower bounds on the minimum in dom_i
-            dom_i = domain_lb.unsqueeze(dim=1) + domain_width.unsqueeze(dim=1) * ndom_i
-            dom_ub_point, dom_ub = net.get_upper_bound(dom_i, true_class_index)
-            dom_lb = net.get_lower_bound(dom_i, true_class_index, save)
-            print(f'dom_ub:{dom_ub}')
-            print(f'dom_lb:{dom_lb}')
+        children = []
+        for candidate in selected:
+            split_dim = None
+            if branching != LONGEST_EDGE:
+                selected_dom = domain_lb.unsqueeze(dim=1) + domain_width.unsqueeze(dim=1) * candidate.domain
+                split_dim = choose_dimension(branching, net, selected_dom[:, 0], selected_dom[:, 1], true_class_index)
+            children.extend(box_split(candidate.domain, split_dim))
+        # Find the upper and lower bounds on the minimum of every child
+        child_domains = [domain_lb.unsqueeze(dim=1) + domain_width.unsqueeze(dim=1) * ndom_i for ndom_i in children]
+        if n_workers > 1:
+            chunks = [child_domains[i::n_workers] for i in range(n_workers)]
+            chunk_results = ray.get([evaluate_domains_remote.remote(net, chunk, true_class_index, save, bound_cache) for chunk in chunks if len(chunk) != 0])
+            results = [None] * len(child_domains)
+            for i, chunk_result in enumerate(chunk_results):
+                results[i::n_workers] = chunk_result
+        else:
+            results = evaluate_domains(net, child_domains, true_class_index, save, bound_cache)
+        n_evaluated += len(results)
+        for dom_ub_point, dom_ub, dom_lb in results:
             assert dom_lb <= dom_ub, "lb must be lower than ub"
             # Update the global upper if the new upper bound found is lower.
             if dom_ub < global_ub:
                 global_ub = dom_ub
                 global_ub_point = dom_ub_point
-                print(f'updated global_ub to {global_ub}')
-
-            # Add the domain to our current list of domains if its lowerbound
-            # is less than the global upperbound.
+        for ndom_i, (dom_ub_point, dom_ub, dom_lb) in zip(children, results):
+            # Add the domain to the frontier if its lowerbound is less than the global upperbound.
             if dom_lb < global_ub:
-                candidate_domain_to_add = CandidateDomain(lb=dom_lb,
-                                                          ub=dom_ub,
-                                                          dm=ndom_i)
-                add_domain(candidate_domain_to_add, domains)
-                prune_counter += 1
-
-        # Prune domains whose lowerbounds are larger than or equal to the
-        # global upperbound.
-        # If domains list is larger than 100 items and if prune_counter has
-        # reached a threshold, prune domains that we no longer need.
-        if prune_counter >= 100 and len(domains) >= 100:
-            # Remove domains with dom_lb >= global_ub
-            domains = prune_domains(domains, global_ub - eps)
-            prune_counter = 0
-
-            # Do a pass over all the remaining domains to evaluate how much of
-            # the input is there left to prune
-            # print_remaining_domain(domains)
-            # print(f"Current: lb: {global_lb}\t ub: {global_ub}")
-
-        # Update the global lower bound with a lower bound that belongs
-        # to a domain in the updated list "domains" .
-        # TODO: This current implementation is only a global lower bound
-        #       if we sort domains by lower_bound.
-        if len(domains) > 0:
-            print(f'----------------------------------')
-            print(f'remaining domains: {len(domains)}')
-            print(f'lbs:{[i.lower_bound for i in domains]}')
-            global_lb = domains[0].lower_bound
-            # print(f'first domain lb: {domains[0].lower_bound}')
-            # global_lb = max([i.lower_bound for i in domains])
-            print(f'global_lb:{global_lb}')
-        else:
-            # if there is no more domains, we have pruned them all.
-            global_lb = global_ub - eps
+                frontier.push(CandidateDomain(lb=dom_lb, ub=dom_ub, dm=ndom_i))
+            else:
+                n_pruned += 1
+
+        # The global lower bound is the lowest lower bound of the frontier
+        global_lb = frontier.peek().lower_bound if len(frontier) > 0 else global_ub - eps
+        if time.time() - last_log >= log_interval:
+            last_log = time.time()
+            log_event("progress", elapsed=f"{last_log - start:.1f}s", frontier=len(frontier), evaluated=n_evaluated, pruned=n_pruned, global_lb=global_lb, global_ub=global_ub)
 
         # Stopping criterion
-        if (decision_bound is not None) and (global_lb >= decision_bound):
-            break
-        elif global_ub < decision_bound:
+        if decided(global_lb, global_ub, decision_bound):
             break
-    print(f'Reached a decision')
+    log_event("decision", elapsed=f"{time.time() - start:.1f}s", frontier=len(frontier), evaluated=n_evaluated, pruned=n_pruned, global_lb=global_lb, global_ub=global_ub)
     return global_lb, global_ub, global_ub_point
 
 
-def add_domain(candidate, domains):
-    '''
-    Use binary search to add the new domain `candidate`
-    to the candidate list `domains` so that `domains` remains a sorted list.
-    '''
-    bisect.insort_left(domains, candidate)
+def decided(global_lb, global_ub, decision_bound) -> bool:
+    '''The UB and LB are both superior or both inferior to `decision_bound`'''
+    return decision_bound is not None and (global_lb >= decision_bound or global_ub < decision_bound)
 
 
-def pick_out(domains, threshold):
-    '''
-    Pick the first domain in the `domains` sequence
-    that has a lower bound lower than `threshold`.
+def log_event(event: str, **fields):
+    print(f"bab {event} " + " ".join(f"{key}={value}" for key, value in fields.items()))
 
-    Any domain appearing before the chosen one but having a lower_bound greater
-    than the threshold is discarded.
 
-    Returns: Non prunable CandidateDomain with the lowest reference_value.
+def evaluate_domains(net, domains, true_class_index, save=True, bound_cache: str = None):
     '''
-    assert len(domains) > 0, "The given domains list is empty."
-    while True:
-        assert len(domains) > 0, "No domain left to pick from."
-        selected_candidate_domain = domains.pop(0)
-        if selected_candidate_domain.lower_bound < threshold:
-            break
+    Returns: for each domain the point where the upper bound is achieved,
+             the upper bound and the lower bound of the minimum
+    '''
+    cache = get_bound_cache(bound_cache)
+    compute_fn = lambda doms: [net.get_lower_bound(dom, true_class_index, save) for dom in doms]
+    lower_bounds = compute_fn(domains) if cache is None else cache.cached(net.fingerprint(), true_class_index, "lower_bound", domains, compute_fn)
+    # a single batched counterexample search for all the domains
+    ub_points, upper_bounds = net.get_upper_bounds_batch(torch.stack(domains), true_class_index)
+    return [(ub_point, dom_ub.item(), dom_lb) for ub_point, dom_ub, dom_lb in zip(ub_points, upper_bounds, lower_bounds)]
+
 
-    return selected_candidate_domain
+evaluate_domains_remote = ray.remote(evaluate_domains)
 
 
-def box_split(domain):
+def box_split(domain, dim: int = None):
     '''
     Use box-constraints to split the input domain.
-    Split by dividing the domain into two from its longest edge.
+    Split by dividing the domain into two from its longest edge (or from dim if given).
     Assumes a rectangular domain, which is aligned with the cartesian
     coordinate frame.
 
@@ -197,11 +194,10 @@ def box_split(domain):
     # Find the longest edge by checking the difference of lower and upper
     # limits in each dimension.
     diff = domain[:, 1] - domain[:, 0]
-    edgelength, dim = torch.max(diff, 0)
-
-    # Unwrap from tensor containers
-    edgelength = edgelength.item()
-    dim = dim.item()
+    if dim is None:
+        edgelength, dim = torch.max(diff, 0)
+        dim = dim.item()
+    edgelength = diff[dim].item()
 
     # Now split over dimension dim:
     half_length = edgelength / 2
@@ -219,22 +215,6 @@ def box_split(domain):
     return sub_domains
 
 
-def prune_domains(domains, threshold):
-    '''
-    Remove domain from `domains`
-    that have a lower_bound greater than `threshold`
-    '''
-    # TODO: Could do this with binary search rather than iterating.
-    # TODO: If this is not sorted according to lower bounds, this
-    # implementation is incorrect because we can not reason about the lower
-    # bounds of the domain that come after
-    for i in range(len(domains)):
-        if domains[i].lower_bound >= threshold:
-            domains = domains[0:i]
-            break
-    return domains
-
-
 def print_remaining_domain(domains):
     '''
     Iterate over all the domains, measuring the part of the whole input space
@@ -0,0 +1,263 @@
+"""
+Branching strategies choosing the input dimension to split in the branch and bound explorers.
+Every strategy scores the dimensions of a domain (the highest score is split):
+    longest_edge: the width of the dimension, the default
+    sensitivity: width times the magnitude of the symbolic gradient of the property w.r.t. the dimension (ReluVal's smear function)
+    babsr: BaBSR-style score, the backward linear relaxation coefficient of the dimension plus the relaxation error of the unstable neurons of the
+           first layer attributed to the dimension in proportion to its share of their pre-activation width
+    lookahead: splits every dimension of the domain and scores it by how much it shrinks the interval of the property of the two children
+NEURON is not an input strategy: the symbolic explorer splits the unstable ReLUs of an undecided domain (Neurify-style, see constrained_propagation)
+before bisecting its longest edge.
+"""
+import torch
+from torch import nn as nn
+
+from plnn.interval_network_cache import get_interval_network
+from symbolic.symbolic_interval import Symbolic_interval
+from symbolic.symbolic_interval.symbolic_network import Interval_Dense, Interval_ReLU
+
+LONGEST_EDGE = "longest_edge"
+SENSITIVITY = "sensitivity"
+BABSR = "babsr"
+LOOKAHEAD = "lookahead"
+STRATEGIES = (LONGEST_EDGE, SENSITIVITY, BABSR, LOOKAHEAD)
+NEURON = "neuron"
+ACTIVE = 1  # phases of a split neuron, 0 if it is not split
+INACTIVE = -1
+
+
+def verification_network(net, true_class_index: int):
+    """The cached Interval_network of the base network followed by the property layer"""
+    return get_interval_network(net.base_network, true_class_index, net.base_network[-1].weight.dtype)
+
+
+def symbolic_propagation(inet, lbs: torch.Tensor, ubs: torch.Tensor):
+    """
+    Symbolic interval propagation of a batch of domains [B,d]
+    :return: the final symbolic interval and the (lower, upper) bounds of every linear layer
+    """
+    dtype = inet.net[-1].layer.weight.dtype  # the property layer
+    ix = Symbolic_interval(lower=lbs.to(dtype), upper=ubs.to(dtype), use_cuda=False)
+    bounds = []
+    with torch.no_grad():
+        for layer in inet.net:
+            ix = layer(ix)
+            if isinstance(layer, Interval_Dense):
+                bounds.append((ix.l.detach(), ix.u.detach()))
+    return ix, bounds
+
+
+def constrained_propagation(inet, lbs: torch.Tensor, ubs: torch.Tensor, phases: torch.Tensor = None, edep_budget: int = None, outward_rounding: bool = False,
+                            dual_steps: int = 10):
+    """
+    Symbolic interval propagation of a batch of domains [B,d] where some ReLUs have a fixed phase (Neurify-style neuron splits).
+    The bounds are sound over the points of the domain where every split neuron has its phase:
+    the pre-activation bounds of a split neuron are intersected with its phase, so its ReLU is propagated exactly, and for fully connected layers
+    the phase is also a linear constraint on the inputs (the symbolic upper bound of an active neuron is positive, the symbolic lower bound of an
+    inactive one is negative) that tightens the bounds of the following layers (see constrained_minimum) and shrinks the domain (see tighten_box)
+    :param phases: [B,n_relus] ACTIVE, INACTIVE or 0 for every ReLU neuron of inet in order, None if no neuron is split
+    :return: the lower and upper bounds of the output, the (lower, upper) pre-activation bounds [B,n_relus], the mask [B] of the domains whose phases are
+    infeasible and the (lower, upper) bounds [B,d] of the domains shrunk to their phases
+    """
+    ix = Symbolic_interval(lower=lbs, upper=ubs, use_cuda=False, edep_budget=edep_budget, outward_rounding=outward_rounding)
+    centers = (ubs + lbs) / 2
+    pre_lbs, pre_ubs = [], []
+    constraint_weights, constraint_thresholds = [], []  # constraint_weights[:, :, k] . x >= constraint_thresholds[:, k]
+    empty = torch.zeros(len(lbs), dtype=torch.bool)
+    offset = 0
+    with torch.no_grad():
+        for layer in inet.net:
+            if isinstance(layer, Interval_ReLU):
+                if phases is not None:
+                    layer_phases = phases[:, offset:offset + ix.n].view(ix.l.shape)
+                    n_split = int((layer_phases != 0).sum(dim=1).max()) if ix.c.dim() == 2 else 0
+                    if n_split != 0:
+                        # the split neurons of each domain, padded with neurons that are not split to the largest number of split neurons of a domain
+                        split = torch.argsort((layer_phases != 0).to(torch.int8), dim=1, descending=True)[:, :n_split]
+                        coefficients, offsets, remainder = linear_bounds(ix, centers)
+                        split_phases = layer_phases.gather(1, split)
+                        active, inactive = split_phases == ACTIVE, split_phases == INACTIVE
+                        weights = coefficients.gather(2, split.unsqueeze(1).expand(-1, coefficients.shape[1], -1))
+                        split_offsets, split_remainder = offsets.gather(1, split), remainder.gather(1, split)
+                        constraint_weights.append(torch.where(active.unsqueeze(1), weights, torch.where(inactive.unsqueeze(1), -weights, torch.zeros_like(weights))))
+                        constraint_thresholds.append(torch.where(active, -(split_offsets + split_remainder),
+                                                                 torch.where(inactive, split_offsets - split_remainder, torch.zeros_like(split_offsets))))
+                        lbs, ubs, infeasible = tighten_box(lbs, ubs, torch.cat(constraint_weights, dim=2), torch.cat(constraint_thresholds, dim=1))
+                        empty |= infeasible
+                    # only the relaxation of the unstable neurons benefits from tighter bounds
+                    unstable = ((ix.l < 0) & (ix.u > 0) & (layer_phases == 0)).any(dim=0)
+                    if ix.c.dim() == 2 and len(constraint_weights) != 0 and bool(unstable.any()):
+                        lower, upper = constrained_bounds(ix, centers, lbs, ubs, torch.cat(constraint_weights, dim=2), torch.cat(constraint_thresholds, dim=1),
+                                                          dual_steps, unstable)
+                        ix.l[:, unstable], ix.u[:, unstable] = torch.max(ix.l[:, unstable], lower), torch.min(ix.u[:, unstable], upper)
+                    ix.l = torch.where(layer_phases == ACTIVE, ix.l.clamp(min=0), ix.l)
+                    ix.u = torch.where(layer_phases == INACTIVE, ix.u.clamp(max=0), ix.u)
+                    empty |= (ix.l > ix.u).view(len(lbs), -1).any(dim=1)
+                pre_lbs.append(ix.l.reshape(len(lbs), -1))
+                pre_ubs.append(ix.u.reshape(len(lbs), -1))
+                if phases is not None:
+                    # below the 1e-8 of Interval_ReLU so that the relaxation of an inactive neuron is exactly 0
+                    ix.l = torch.where(layer_phases == INACTIVE, ix.l.clamp(max=-2e-8), ix.l)
+                offset += ix.n
+            ix = layer(ix)
+        lower, upper = ix.l, ix.u
+        if len(constraint_weights) != 0:
+            constrained_lower, constrained_upper = constrained_bounds(ix, centers, lbs, ubs, torch.cat(constraint_weights, dim=2),
+                                                                      torch.cat(constraint_thresholds, dim=1), dual_steps)
+            lower, upper = torch.max(lower, constrained_lower), torch.min(upper, constrained_upper)
+            empty |= (lower > upper).any(dim=1)
+    return lower, upper, torch.cat(pre_lbs, dim=1), torch.cat(pre_ubs, dim=1), empty, lbs, ubs
+
+
+def linear_bounds(ix: Symbolic_interval, centers: torch.Tensor):
+    """:return: the coefficients [B,d,n], offsets [B,n] and remainder [B,n] such that every node is within coefficients . x + offsets +- remainder"""
+    coefficients = ix.idep.expand(len(centers), -1, -1)
+    remainder = ((ix.u - ix.l) / 2 - (ix.idep * ix.e.view(len(centers), -1, 1)).abs().sum(dim=1)).clamp(min=0)
+    offsets = ix.c - (coefficients * centers.unsqueeze(2)).sum(dim=1)
+    return coefficients, offsets, remainder
+
+
+def constrained_bounds(ix: Symbolic_interval, centers: torch.Tensor, lbs: torch.Tensor, ubs: torch.Tensor, weights: torch.Tensor, thresholds: torch.Tensor,
+                       steps: int, nodes: torch.Tensor = None):
+    """
+    :param nodes: optional mask of the nodes to bound
+    :return: the lower and upper bounds [B,n] of the nodes of ix over the points of the boxes satisfying the constraints, see constrained_minimum
+    """
+    coefficients, offsets, remainder = linear_bounds(ix, centers)
+    if nodes is not None:
+        coefficients, offsets, remainder = coefficients[:, :, nodes], offsets[:, nodes], remainder[:, nodes]
+    objective = coefficients.transpose(1, 2)
+    lower = constrained_minimum(objective, offsets, lbs, ubs, weights, thresholds, steps) - remainder
+    upper = -constrained_minimum(-objective, -offsets, lbs, ubs, weights, thresholds, steps) + remainder
+    return lower, upper
+
+
+def constrained_minimum(objective: torch.Tensor, constant: torch.Tensor, lbs: torch.Tensor, ubs: torch.Tensor, weights: torch.Tensor, thresholds: torch.Tensor,
+                        steps: int) -> torch.Tensor:
+    """
+    Lower bound of the minimum of objective[:, j] . x + constant[:, j] over the points x of the boxes [B,d] with weights[:, :, k] . x >= thresholds[:, k]
+    for every k, by Lagrangian relaxation of the constraints: any multipliers >= 0 give a lower bound, they are improved by projected supergradient ascent
+    :param objective: [B,n,d]
+    :return: [B,n]
+    """
+    scale = objective.abs().sum(dim=2, keepdim=True) / weights.abs().sum(dim=1).clamp(min=1e-12).unsqueeze(1)  # [B,n,k] step of each multiplier
+    thresholds = thresholds.unsqueeze(1)  # [B,1,k]
+    multipliers = torch.zeros(objective.shape[0], objective.shape[1], weights.shape[2], dtype=objective.dtype)
+    best = None
+    for step in range(steps + 1):
+        lagrangian = objective - multipliers.bmm(weights.transpose(1, 2))
+        x = torch.where(lagrangian > 0, lbs.unsqueeze(1), ubs.unsqueeze(1))  # minimum of the lagrangian on the box
+        terms = lagrangian * x
+        value = terms.sum(dim=2) + (multipliers * thresholds).sum(dim=2) + constant
+        # margin for the floating point error of the sums
+        value = value - 4 * torch.finfo(value.dtype).eps * (x.shape[2] + weights.shape[2] + 2) * \
+                (terms.abs().sum(dim=2) + (multipliers * thresholds).abs().sum(dim=2) + constant.abs())
+        best = value if best is None else torch.max(best, value)
+        violations = thresholds - x.bmm(weights)
+        multipliers = (multipliers + scale * violations.sign() / (2 * (step + 1) ** 0.5)).clamp(min=0)
+    return best
+
+
+def tighten_box(lbs: torch.Tensor, ubs: torch.Tensor, weights: torch.Tensor, thresholds: torch.Tensor):
+    """
+    One pass of bound propagation shrinking the boxes [B,d] to the points x with weights[:, :, k] . x >= thresholds[:, k] for every k
+    (a constraint with zero weights and threshold is ignored)
+    :return: the shrunk lower and upper bounds and the mask [B] of the boxes that contain no such point
+    """
+    products = torch.max(weights * lbs.unsqueeze(2), weights * ubs.unsqueeze(2))  # [B,d,k] largest value of each term on the box
+    totals = products.sum(dim=1, keepdim=True)
+    # margin for the floating point error of the sums, so that no point satisfying the constraints is cut off
+    magnitudes = (weights.abs() * torch.max(lbs.abs(), ubs.abs()).unsqueeze(2)).sum(dim=1)
+    thresholds = thresholds - 4 * torch.finfo(lbs.dtype).eps * (lbs.shape[1] + 2) * (thresholds.abs() + magnitudes)
+    infeasible = (totals.squeeze(1) < thresholds).any(dim=1)
+    limits = (thresholds.unsqueeze(1) - (totals - products)) / weights  # [B,d,k] bound on each input implied by each constraint
+    new_lbs = torch.where(weights > 0, limits, torch.full_like(limits, -float("inf"))).max(dim=2)[0]
+    new_ubs = torch.where(weights < 0, limits, torch.full_like(limits, float("inf"))).min(dim=2)[0]
+    lbs, ubs = torch.max(lbs, new_lbs), torch.min(ubs, new_ubs)
+    return lbs, ubs, infeasible | (lbs > ubs).any(dim=1)
+
+
+def neuron_split_scores(pre_lbs: torch.Tensor, pre_ubs: torch.Tensor) -> torch.Tensor:
+    """:return: the relaxation error of every unstable ReLU neuron [B,n_relus], 0 for the stable (or already split) ones"""
+    unstable = (pre_lbs < 0) & (pre_ubs > 0)
+    intercepts = -pre_lbs * pre_ubs / (pre_ubs - pre_lbs).clamp(min=1e-12)
+    return torch.where(unstable, intercepts, torch.zeros_like(intercepts))
+
+
+def sensitivity_scores(inet, lb: torch.Tensor, ub: torch.Tensor) -> torch.Tensor:
+    ix, _ = symbolic_propagation(inet, lb.unsqueeze(0), ub.unsqueeze(0))
+    # idep [1,d,n_properties] is the dependency of the properties on each (half width normalised) input
+    return (ix.idep[0] * ix.e[0].unsqueeze(1)).abs().sum(dim=1)
+
+
+def babsr_scores(inet, lb: torch.Tensor, ub: torch.Tensor) -> torch.Tensor:
+    _, bounds = symbolic_propagation(inet, lb.unsqueeze(0), ub.unsqueeze(0))
+    layers = [layer.layer for layer in inet.net if hasattr(layer, "layer")]
+    linear_layers = [layer for layer in layers if type(layer) is nn.Linear]
+    relu_after = [i + 1 < len(layers) and type(layers[i + 1]) is nn.ReLU for i, layer in enumerate(layers) if type(layer) is nn.Linear]
+    width = (ub - lb).to(linear_layers[0].weight.dtype)
+    # backward pass of the linear relaxation, starting from the property layer
+    coefficients = torch.ones(1, linear_layers[-1].out_features, dtype=width.dtype)
+    first_relu_error = None
+    for index in reversed(range(len(linear_layers))):
+        if relu_after[index]:
+            pre_lb, pre_ub = bounds[index][0][0], bounds[index][1][0]
+            unstable = (pre_lb < 0) & (pre_ub > 0)
+            slopes = (pre_lb >= 0).to(width.dtype)
+            slopes[unstable] = pre_ub[unstable] / (pre_ub[unstable] - pre_lb[unstable])
+            if index == 0:
+                # area of the triangle relaxation scaled by how much the neuron matters for the property
+                intercepts = torch.zeros_like(pre_lb)
+                intercepts[unstable] = -pre_lb[unstable] * slopes[unstable]
+                first_relu_error = (coefficients.abs().sum(dim=0) * intercepts)
+            coefficients = coefficients * slopes
+        coefficients = coefficients @ linear_layers[index].weight.to(width.dtype)
+    scores = coefficients.abs().sum(dim=0) * width
+    if first_relu_error is not None:
+        contributions = linear_layers[0].weight.to(width.dtype).abs() * width  # [n,d] share of each input in the pre-activation width
+        shares = contributions / contributions.sum(dim=1, keepdim=True).clamp(min=1e-12)
+        scores = scores + first_relu_error @ shares
+    return scores
+
+
+def lookahead_scores(inet, lb: torch.Tensor, ub: torch.Tensor) -> torch.Tensor:
+    d = lb.shape[0]
+    middle = (lb + ub) / 2
+    lbs = lb.repeat(2 * d, 1)
+    ubs = ub.repeat(2 * d, 1)
+    dims = torch.arange(d)
+    ubs[dims, dims] = middle  # lower halves
+    lbs[dims + d, dims] = middle  # upper halves
+    ix, _ = symbolic_propagation(inet, lbs, ubs)
+    # the property is the minimum over its rows
+    property_width = torch.min(ix.u, dim=1)[0] - torch.min(ix.l, dim=1)[0]
+    return -(property_width[:d] + property_width[d:])
+
+
+def split_scores(branching: str, net, lb: torch.Tensor, ub: torch.Tensor, true_class_index: int) -> torch.Tensor:
+    """
+    :param net: a network with a base_network (VerificationNetwork or SymVerificationNetwork)
+    :return: the score of each dimension of the domain [lb, ub], the dimension with the highest score should be split
+    """
+    if branching == LONGEST_EDGE:
+        return ub - lb
+    inet = verification_network(net, true_class_index)
+    if branching == SENSITIVITY:
+        return sensitivity_scores(inet, lb, ub)
+    elif branching == BABSR:
+        return babsr_scores(inet, lb, ub)
+    elif branching == LOOKAHEAD:
+        return lookahead_scores(inet, lb, ub)
+    raise Exception(f"Unknown branching strategy {branching}")
+
+
+def choose_dimension(branching: str, net, lb: torch.Tensor, ub: torch.Tensor, true_class_index: int, splittable: torch.Tensor = None) -> int:
+    """:param splittable: optional boolean mask of the dimensions that can still be split, by default the ones with a positive width"""
+    widths = (ub - lb).to(torch.float64)
+    splittable = widths > 0 if splittable is None else splittable
+    scores = split_scores(branching, net, lb, ub, true_class_index).to(torch.float64)
+    if branching != LOOKAHEAD and not bool((scores[splittable] > 0).any()):
+        scores = widths  # the property does not depend on any of the splittable dimensions
+    scores = scores.clone()
+    scores[~splittable] = -float("inf")
+    return int(torch.argmax(scores).item())
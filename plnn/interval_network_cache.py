@@ -0,0 +1,77 @@
+"""
+Cache of the Interval_network used for symbolic interval propagation.
+The network (followed by the property layer of true_class_index, if given) is copied once per dtype with pre-cast, contiguous parameters that do not
+require gradients, so repeated calls skip the conversion. An entry is rebuilt if the parameters of the original network are modified in place.
+"""
+import copy
+
+import torch
+from torch import nn as nn
+
+from symbolic.symbolic_interval import Interval_network, Symbolic_interval
+from symbolic.symbolic_interval.scripted_network import scripted_bounds
+
+FORWARD = "forward"  # symbolic interval propagation
+BACKWARD = "backward"  # CROWN-style backward propagation reusing the forward bounds, see Interval_network.backward_bounds
+BOUND_METHODS = (FORWARD, BACKWARD)
+use_scripted = True  # FORWARD uses the scripted propagation of symbolic.symbolic_interval.scripted_network for Linear/ReLU networks
+interval_networks = dict()  # (id(network), true_class_index, dtype) -> (network, parameter versions, Interval_network)
+
+
+def property_weight(n_classes: int, true_class_index: int) -> torch.Tensor:
+    """Each row is the difference between the true class and one of the other classes"""
+    rows = []
+    for i in range(n_classes):
+        if i == true_class_index:
+            continue
+        row = [0] * n_classes
+        row[true_class_index] = 1
+        row[i] = -1
+        rows.append(row)
+    return torch.tensor(rows)
+
+
+def parameter_versions(network: nn.Module) -> tuple:
+    """Changes when a parameter is modified in place (load_state_dict, an optimizer step, copy_) or its data is replaced"""
+    return tuple((getattr(parameter, "_version", 0), parameter.data_ptr()) for parameter in network.parameters())
+
+
+def get_interval_network(network: nn.Sequential, true_class_index: int = None, dtype=torch.float64) -> Interval_network:
+    """:return: the cached Interval_network of network (followed by the property layer if true_class_index is not None) in the given dtype"""
+    key = (id(network), true_class_index, dtype)
+    versions = parameter_versions(network)
+    cached = interval_networks.get(key)
+    if cached is not None and cached[0] is network and cached[1] == versions:
+        return cached[2]
+    layers = list(copy.deepcopy(network).to(dtype))
+    if true_class_index is not None:
+        weight = property_weight(network[-1].out_features, true_class_index)
+        property_layer = nn.Linear(weight.shape[1], weight.shape[0], bias=False)
+        with torch.no_grad():
+            property_layer.weight = nn.Parameter(weight.to(dtype))
+        layers.append(property_layer)
+    sequential = nn.Sequential(*layers)
+    for parameter in sequential.parameters():
+        parameter.requires_grad_(False)
+        parameter.data = parameter.data.contiguous()
+    inet = Interval_network(sequential, None)
+    interval_networks[key] = (network, versions, inet)
+    return inet
+
+
+def interval_bounds(inet: Interval_network, interval: Symbolic_interval, method: str = FORWARD):
+    """:return: the (upper, lower) bounds of the output of inet over the domains of interval with the given propagation method"""
+    if method == FORWARD:
+        if use_scripted and type(interval) is Symbolic_interval and interval.norm == "linf" and len(interval.edep) == 0 and interval.edep_budget is None \
+                and not interval.outward_rounding:
+            bounds = scripted_bounds(inet, interval.l, interval.u)
+            if bounds is not None:
+                return bounds[1], bounds[0]
+        result_interval = inet(interval)
+        return result_interval.u, result_interval.l
+    elif method == BACKWARD:
+        if interval.outward_rounding:
+            raise Exception("Outward rounding is only supported by the forward propagation")
+        lower, upper = inet.backward_bounds(interval.l, interval.u)
+        return upper, lower
+    raise Exception(f"Unknown bound method {method}")
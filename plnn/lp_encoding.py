@@ -0,0 +1,158 @@
+"""
+Reusable LP relaxation of a fully connected ReLU network.
+The model is built once with matrix constraints, every new domain only changes the bounds of the variables and the coefficients of the ReLU relaxation,
+so gurobi can warm start each LP from the basis of the previous one.
+"""
+from typing import List, Tuple
+
+import numpy as np
+import scipy.sparse
+import torch
+from torch import nn as nn
+
+from plnn.flatten_layer import Flatten
+from utility.solver_backend import get_backend, SolverBackend, OPTIMAL, MINIMIZE, MAXIMIZE
+
+
+def is_fully_connected(layers) -> bool:
+    return all(type(layer) in (nn.Linear, nn.ReLU, Flatten, torch.Tensor) for layer in layers)
+
+
+def intersect_bounds(bounds_a: List[Tuple[np.ndarray, np.ndarray]], bounds_b: List[Tuple[np.ndarray, np.ndarray]]) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """Intersection of two lists of sound (lower, upper) bounds of every linear layer, either of them can be None"""
+    if bounds_a is None or bounds_b is None:
+        return bounds_a if bounds_b is None else bounds_b
+    return [(np.maximum(lb_a, lb_b), np.minimum(ub_a, ub_b)) for (lb_a, ub_a), (lb_b, ub_b) in zip(bounds_a, bounds_b)]
+
+
+class LPEncoding:
+    def __init__(self, layers: list, backend: str = None):
+        """
+        :param layers: the layers of the network followed by the property layer (a weight tensor), only nn.Linear, nn.ReLU, Flatten and torch.Tensor are supported
+        :param backend: name of the solver backend, see utility.solver_backend.get_backend
+        """
+        self.solver: SolverBackend = get_backend(backend)
+        self.weights = []  # (weight, bias) of the linear layers as numpy arrays
+        self.linear_vars: List[np.ndarray] = []  # output variables of each linear layer
+        self.relu_vars: List[np.ndarray] = []  # output variables of the relu following the linear layer with the same index (None if missing)
+        self.relu_upper_constrs: List[np.ndarray] = []  # a <= slope * z + intercept
+        self.n_lp_solved = 0
+        self.n_lp_skipped = 0  # neurons whose ReLU phase was already fixed by the pre-pass
+        self.layer_bounds: List[Tuple[np.ndarray, np.ndarray]] = None  # (lower, upper) bounds of every linear layer computed by the last get_boundaries
+        n_input = None
+        for layer in layers:
+            if type(layer) is nn.Linear or type(layer) is torch.Tensor:
+                weight = (layer.weight if type(layer) is nn.Linear else layer).detach().cpu().numpy().astype(np.float64)
+                bias = layer.bias.detach().cpu().numpy().astype(np.float64) if type(layer) is nn.Linear and layer.bias is not None else np.zeros(weight.shape[0])
+                if n_input is None:
+                    n_input = weight.shape[1]
+                    self.input_vars = self.solver.add_variables(n_input)
+                previous = self.input_vars if len(self.linear_vars) == 0 else (self.relu_vars[-1] if self.relu_vars[-1] is not None else self.linear_vars[-1])
+                z = self.solver.add_variables(weight.shape[0])
+                # W x - z = -b
+                matrix = scipy.sparse.hstack([scipy.sparse.csr_matrix(weight), -scipy.sparse.identity(weight.shape[0])]).tocsr()
+                self.solver.add_constraints(matrix, np.concatenate([previous, z]), '=', -bias)
+                self.weights.append((weight, bias))
+                self.linear_vars.append(z)
+                self.relu_vars.append(None)
+                self.relu_upper_constrs.append(None)
+            elif type(layer) is nn.ReLU:
+                z = self.linear_vars[-1]
+                n = len(z)
+                a = self.solver.add_variables(n, lb=0)
+                identity = scipy.sparse.identity(n)
+                self.solver.add_constraints(scipy.sparse.hstack([identity, -identity]).tocsr(), np.concatenate([a, z]), '>', 0)  # a >= z
+                # the coefficients of z are added by set_relu_relaxation once the bounds of z are known, every row keeps a finite rhs
+                # (gurobi does not treat an infinite rhs as a missing constraint)
+                self.relu_upper_constrs[-1] = self.solver.add_constraints(identity.tocsr(), a, '<', 0)
+                self.relu_vars[-1] = a
+            elif type(layer) is Flatten:
+                continue
+            else:
+                raise Exception('Type of layer not supported')
+
+    def relax(self, domain_lb: np.ndarray, domain_ub: np.ndarray, prepass_bounds: List[Tuple[np.ndarray, np.ndarray]] = None):
+        """
+        Replaces the constraints left by the previous domain with the interval arithmetic relaxation of the new one (intersected with prepass_bounds),
+        which is valid for the whole domain so it does not cut the feasible region of the LPs of the earlier layers
+        """
+        lower, upper = np.asarray(domain_lb, dtype=np.float64), np.asarray(domain_ub, dtype=np.float64)
+        for index, ((weight, bias), z, a) in enumerate(zip(self.weights, self.linear_vars, self.relu_vars)):
+            new_lb = weight.clip(min=0) @ lower + weight.clip(max=0) @ upper + bias
+            new_ub = weight.clip(min=0) @ upper + weight.clip(max=0) @ lower + bias
+            if prepass_bounds is not None:
+                new_lb = np.maximum(new_lb, prepass_bounds[index][0])
+                new_ub = np.minimum(new_ub, prepass_bounds[index][1])
+            self.solver.set_bounds(z, new_lb, new_ub)
+            if a is not None:
+                self.set_relu_relaxation(index, new_lb, new_ub)
+                lower, upper = np.maximum(new_lb, 0), np.maximum(new_ub, 0)
+            else:
+                lower, upper = new_lb, new_ub
+
+    def solve(self, var: int, sense) -> float:
+        self.solver.set_objective(np.array([var]), 1.0, sense)
+        status = self.solver.optimize()
+        assert status == OPTIMAL, "LP wasn't optimally solved"
+        return self.solver.objective_value
+
+    def get_boundaries(self, domain_lb: np.ndarray, domain_ub: np.ndarray, prepass_bounds: List[Tuple[np.ndarray, np.ndarray]] = None):
+        """
+        :param prepass_bounds: optional sound (lower, upper) bounds of every linear layer computed beforehand (e.g. by symbolic interval propagation
+        or for a parent domain, see intersect_bounds), they seed the bounds of the variables and the LPs are solved only for the neurons followed by a ReLU whose phase is not fixed by them
+        :return: the lower and upper bounds of every linear layer, the last one being the property
+        """
+        self.solver.set_bounds(self.input_vars, domain_lb, domain_ub)
+        self.relax(domain_lb, domain_ub, prepass_bounds)
+        lower_bounds = [np.asarray(domain_lb, dtype=np.float64)]
+        upper_bounds = [np.asarray(domain_ub, dtype=np.float64)]
+        self.layer_bounds = []
+        for index, ((weight, bias), z) in enumerate(zip(self.weights, self.linear_vars)):
+            old_lb = lower_bounds[-1]
+            old_ub = upper_bounds[-1]
+            weight_pos = weight.clip(min=0)
+            weight_neg = weight.clip(max=0)
+            # interval arithmetic gives the initial bounds, then they are tightened with the LP
+            new_lb = weight_pos @ old_lb + weight_neg @ old_ub + bias
+            new_ub = weight_pos @ old_ub + weight_neg @ old_lb + bias
+            a = self.relu_vars[index]
+            to_solve = np.ones(len(z), dtype=bool)
+            if prepass_bounds is not None:
+                new_lb = np.maximum(new_lb, prepass_bounds[index][0])
+                new_ub = np.minimum(new_ub, prepass_bounds[index][1])
+                if a is not None:
+                    to_solve = (new_lb < 0) & (new_ub > 0)  # stable neurons are encoded exactly by the relaxation, no need to tighten them
+            self.solver.set_bounds(z, new_lb, new_ub)
+            for row in np.nonzero(to_solve)[0]:
+                new_lb[row] = self.solve(z[row], MINIMIZE)
+                self.solver.set_bounds(z[row:row + 1], lb=new_lb[row])
+                new_ub[row] = self.solve(z[row], MAXIMIZE)
+                self.solver.set_bounds(z[row:row + 1], ub=new_ub[row])
+            self.n_lp_solved += 2 * int(to_solve.sum())
+            self.n_lp_skipped += 2 * int((~to_solve).sum())
+            lower_bounds.append(new_lb)
+            upper_bounds.append(new_ub)
+            self.layer_bounds.append((new_lb.copy(), new_ub.copy()))
+            if a is not None:
+                self.set_relu_relaxation(index, new_lb, new_ub)
+                lower_bounds.append(np.maximum(new_lb, 0))
+                upper_bounds.append(np.maximum(new_ub, 0))
+        return lower_bounds, upper_bounds
+
+    def set_relu_relaxation(self, index: int, pre_lb: np.ndarray, pre_ub: np.ndarray):
+        """Updates the coefficients of the triangle relaxation a <= slope * z + intercept, together with a >= z and a >= 0"""
+        z = self.linear_vars[index]
+        a = self.relu_vars[index]
+        constrs = self.relu_upper_constrs[index]
+        slopes = np.zeros(len(z))
+        intercepts = np.zeros(len(z))
+        active = pre_lb >= 0  # the ReLU is always passing, a == z
+        unstable = (pre_lb < 0) & (pre_ub > 0)
+        slopes[active] = 1
+        slopes[unstable] = pre_ub[unstable] / (pre_ub[unstable] - pre_lb[unstable])
+        intercepts[unstable] = - pre_lb[unstable] * slopes[unstable]
+        # inactive neurons keep slope and intercept at 0, which forces a == 0
+        for row, constr in enumerate(constrs):
+            self.solver.set_coefficient(constr, z[row], -slopes[row])
+        self.solver.set_rhs(constrs, intercepts)
+        self.solver.set_bounds(a, ub=np.maximum(pre_ub, 0))
@@ -0,0 +1,69 @@
+import os
+import tempfile
+from unittest import TestCase
+
+import torch
+
+from plnn.bound_cache import BoundCache, get_bound_cache, open_caches
+
+
+class TestBoundCache(TestCase):
+    def test_cached(self):
+        with tempfile.TemporaryDirectory() as folder:
+            cache = BoundCache(os.path.join(folder, "bounds.sqlite"))
+            domains = [torch.tensor([[0.0, 1.0], [0.5, 2.0]], dtype=torch.float64), torch.tensor([[0.0, 1.0], [0.5, 3.0]], dtype=torch.float64)]
+            computed = []
+            compute_fn = lambda doms: [computed.append(dom) or (dom.max().item(), dom.min().item()) for dom in doms]
+            assert cache.cached("net", 0, "lp", domains, compute_fn) == [(2.0, 0.0), (3.0, 0.0)]
+            assert cache.cached("net", 0, "lp", domains, compute_fn) == [(2.0, 0.0), (3.0, 0.0)]
+            assert len(computed) == 2  # the second call only hits the cache
+            cache.cached("net", 1, "lp", domains[:1], compute_fn)  # a different property is a different key
+            assert len(computed) == 3
+
+    def test_eviction(self):
+        with tempfile.TemporaryDirectory() as folder:
+            cache = BoundCache(os.path.join(folder, "bounds.sqlite"), max_size=2000)
+            for i in range(100):
+                cache.put(bytes([i]), list(range(10)))
+            assert cache.total_size() <= 2000
+            assert cache.get(bytes([99])) is not None
+            assert cache.get(bytes([0])) is None  # the least recently used entries are evicted first
+
+    def test_symbolic_explorer_cache(self):
+        from plnn.bab_explore_sym import SymbolicDomainExplorer
+        from plnn.verification_network_sym import SymVerificationNetwork
+        torch.manual_seed(0)
+        net = SymVerificationNetwork(torch.nn.Sequential(torch.nn.Linear(2, 8), torch.nn.ReLU(), torch.nn.Linear(8, 2)).double())
+        lbs = torch.rand(64, 2, dtype=torch.float64)
+        domains = torch.stack([lbs, lbs + 0.5], dim=2)
+        with tempfile.TemporaryDirectory() as folder:
+            explorer = SymbolicDomainExplorer(1, torch.device("cpu"), 0.01, 3, bound_cache=os.path.join(folder, "bounds.sqlite"))
+            expected = explorer.compute_boundaries(net, domains)
+            for _ in range(2):  # computed, then read from the cache
+                u, l = explorer.get_boundaries(net, domains)
+                assert torch.equal(u, expected[0]) and torch.equal(l, expected[1])
+            cache = get_bound_cache(explorer.bound_cache)
+            assert cache.hits == 64
+            values = [value for value, in cache.connection.execute("SELECT value FROM bounds")]
+            assert len(values) == 64 and all(len(value) < 200 for value in values)  # plain floats, not views of the whole batch
+            explorer.get_boundaries(net, domains.float())  # float32 bounds are rounded outward, they must not hit the float64 entries
+            assert cache.hits == 64
+            cache.connection.close()
+            del open_caches[explorer.bound_cache]
+
+    def test_fingerprint_follows_weights(self):
+        from plnn.verification_network import VerificationNetwork
+        from plnn.verification_network_sym import SymVerificationNetwork
+        for network_class in (VerificationNetwork, SymVerificationNetwork):
+            base = torch.nn.Sequential(torch.nn.Linear(2, 8), torch.nn.ReLU(), torch.nn.Linear(8, 2)).double()
+            state = {key: value.clone() for key, value in base.state_dict().items()}
+            net = network_class(base)
+            fingerprint = net.fingerprint()
+            assert net.fingerprint() == fingerprint
+            with torch.no_grad():
+                base[0].weight.add_(1)  # e.g. an optimizer step
+            assert net.fingerprint() != fingerprint
+            base.load_state_dict(state)
+            assert net.fingerprint() == fingerprint
+            base[2].weight.data = base[2].weight.data * 2
+            assert net.fingerprint() != fingerprint
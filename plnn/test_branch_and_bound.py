@@ -0,0 +1,50 @@
+from unittest import TestCase, mock
+
+import torch
+
+from plnn import branch_and_bound
+from plnn.branch_and_bound import bab, decided, evaluate_domains
+from plnn.verification_network import VerificationNetwork
+
+
+class TestBranchAndBound(TestCase):
+    def setUp(self):
+        torch.manual_seed(0)
+        base_network = torch.nn.Sequential(torch.nn.Linear(2, 8), torch.nn.ReLU(), torch.nn.Linear(8, 8), torch.nn.ReLU(), torch.nn.Linear(8, 2))
+        self.net = VerificationNetwork(base_network)
+        self.domain = torch.tensor([[-4.0, 4.0], [-3.0, 5.0]])
+        grid = torch.stack(torch.meshgrid(torch.linspace(-4, 4, 801), torch.linspace(-3, 5, 801), indexing="ij"), dim=-1).reshape(-1, 2)
+        with torch.no_grad():
+            self.sampled_min = self.net.forward_verif(grid, 1).min().item()
+
+    def check_minimum(self, global_lb, global_ub, global_ub_point, eps):
+        assert global_lb <= self.sampled_min + 1e-5
+        assert global_ub - global_lb <= eps + 1e-6
+        assert bool((global_ub_point >= self.domain[:, 0]).all()) and bool((global_ub_point <= self.domain[:, 1]).all())
+        with torch.no_grad():
+            assert abs(self.net.forward_verif(global_ub_point.unsqueeze(0), 1).item() - global_ub) < 1e-5
+
+    def test_bab(self):
+        eps = 1e-3
+        global_lb, global_ub, global_ub_point = bab(self.net, self.domain, 1, eps=eps, decision_bound=None, save=False, n_workers=1, batch_size=2)
+        self.check_minimum(global_lb, global_ub, global_ub_point, eps)
+
+    def test_strided_reassembly(self):
+        # the chunks child_domains[i::n_workers] are evaluated in process, the results must be put back in the order of the children
+        eps = 1e-3
+        remote = mock.Mock()
+        remote.remote.side_effect = evaluate_domains
+        with mock.patch.object(branch_and_bound, "evaluate_domains_remote", remote), mock.patch.object(branch_and_bound.ray, "get", side_effect=list):
+            global_lb, global_ub, global_ub_point = bab(self.net, self.domain, 1, eps=eps, save=False, n_workers=3, batch_size=5)
+        assert remote.remote.call_count > 0
+        self.check_minimum(global_lb, global_ub, global_ub_point, eps)
+
+    def test_decision_bound(self):
+        assert not decided(-1.0, 1.0, None)
+        assert not decided(-1.0, 1.0, 0.0)
+        assert decided(0.5, 1.0, 0.0) and decided(-1.0, -0.5, 0.0)
+        # the decision is taken during the search, before converging to the minimum
+        global_lb, global_ub, _ = bab(self.net, self.domain, 1, eps=1e-6, decision_bound=self.sampled_min - 0.05, save=False)
+        assert self.sampled_min - 0.05 <= global_lb <= self.sampled_min + 1e-5
+        global_lb, global_ub, _ = bab(self.net, self.domain, 1, eps=1e-6, decision_bound=self.sampled_min + 1e-3, save=False)
+        assert global_lb <= self.sampled_min + 1e-5 and global_ub < self.sampled_min + 1e-3
@@ -0,0 +1,47 @@
+from unittest import TestCase
+
+import torch
+
+from plnn.branching import STRATEGIES, LONGEST_EDGE, ACTIVE, INACTIVE, choose_dimension, constrained_propagation
+from plnn.interval_network_cache import get_interval_network
+from plnn.verification_network_sym import SymVerificationNetwork
+
+
+class TestBranching(TestCase):
+    def test_irrelevant_dimension(self):
+        torch.manual_seed(0)
+        base = torch.nn.Sequential(torch.nn.Linear(2, 8), torch.nn.ReLU(), torch.nn.Linear(8, 2)).double()
+        with torch.no_grad():
+            base[0].weight[:, 0] = 0  # the output does not depend on the first (and longest) dimension
+        net = SymVerificationNetwork(base)
+        lb = torch.tensor([-10, -1], dtype=torch.float64)
+        ub = torch.tensor([10, 1], dtype=torch.float64)
+        for branching in STRATEGIES:
+            expected = 0 if branching == LONGEST_EDGE else 1
+            assert choose_dimension(branching, net, lb, ub, 1) == expected, branching
+        assert choose_dimension(LONGEST_EDGE, net, lb, ub, 1, splittable=torch.tensor([False, True])) == 1
+
+    def test_constrained_propagation(self):
+        torch.manual_seed(0)
+        base = torch.nn.Sequential(torch.nn.Linear(3, 16), torch.nn.ReLU(), torch.nn.Linear(16, 16), torch.nn.ReLU(), torch.nn.Linear(16, 2)).double()
+        inet = get_interval_network(base, 1, torch.float64)
+        lbs = torch.tensor([[-1, -1, -1]], dtype=torch.float64).repeat(8, 1)
+        ubs = -lbs
+        phases = torch.zeros(8, 32, dtype=torch.int8)
+        for i in range(8):
+            phases[i, torch.randperm(32)[:3]] = torch.tensor([ACTIVE if (i >> bit) & 1 else INACTIVE for bit in range(3)], dtype=torch.int8)
+        lower, upper, _, _, empty, shrunk_lbs, shrunk_ubs = constrained_propagation(inet, lbs, ubs, phases)
+        x = torch.rand(20000, 3, dtype=torch.float64) * 2 - 1
+        with torch.no_grad():
+            hidden1 = base[0](x)
+            hidden2 = base[2](base[1](hidden1))
+            outputs = inet.net[-1].layer(base(x))
+        signs = torch.cat([hidden1, hidden2], dim=1)
+        for i in range(8):
+            split = phases[i] != 0
+            feasible = ((signs[:, split] >= 0) == (phases[i, split] == ACTIVE)).all(dim=1)
+            if bool(empty[i]):
+                assert not bool(feasible.any())
+                continue
+            assert bool((outputs[feasible] >= lower[i] - 1e-9).all()) and bool((outputs[feasible] <= upper[i] + 1e-9).all())
+            assert bool((x[feasible] >= shrunk_lbs[i] - 1e-9).all()) and bool((x[feasible] <= shrunk_ubs[i] + 1e-9).all())
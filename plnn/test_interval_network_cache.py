@@ -0,0 +1,32 @@
+from unittest import TestCase
+
+import torch
+
+from plnn.interval_network_cache import get_interval_network, interval_bounds, FORWARD, BACKWARD
+from symbolic.symbolic_interval import Symbolic_interval
+
+
+class TestIntervalNetworkCache(TestCase):
+    def test_cache(self):
+        network = torch.nn.Sequential(torch.nn.Linear(2, 4), torch.nn.ReLU(), torch.nn.Linear(4, 2))
+        inet = get_interval_network(network, 1)
+        assert get_interval_network(network, 1) is inet
+        assert get_interval_network(network, 0) is not inet
+        assert inet.net[-1].layer.weight.dtype == torch.float64
+        assert network[0].weight.dtype == torch.float32  # the original network is not converted
+        with torch.no_grad():
+            network[0].weight.add_(1)
+        assert get_interval_network(network, 1) is not inet  # modified in place
+
+    def test_backward_bounds(self):
+        torch.manual_seed(0)
+        network = torch.nn.Sequential(torch.nn.Linear(3, 16), torch.nn.ReLU(), torch.nn.Linear(16, 16), torch.nn.ReLU(), torch.nn.Linear(16, 3))
+        inet = get_interval_network(network, 0)
+        lower = torch.rand(5, 3, dtype=torch.float64)
+        upper = lower + 0.5
+        forward_u, forward_l = interval_bounds(inet, Symbolic_interval(lower=lower, upper=upper), FORWARD)
+        backward_u, backward_l = interval_bounds(inet, Symbolic_interval(lower=lower, upper=upper), BACKWARD)
+        assert bool((backward_l >= forward_l - 1e-12).all()) and bool((backward_u <= forward_u + 1e-12).all())
+        samples = lower.unsqueeze(1) + torch.rand(5, 1000, 3, dtype=torch.float64) * (upper - lower).unsqueeze(1)
+        outputs = torch.nn.Sequential(*[layer.layer for layer in inet.net])(samples)
+        assert bool((outputs >= backward_l.unsqueeze(1) - 1e-9).all()) and bool((outputs <= backward_u.unsqueeze(1) + 1e-9).all())
@@ -0,0 +1,44 @@
+from unittest import TestCase, mock
+
+import torch
+
+from plnn.lp_encoding import LPEncoding
+from plnn.verification_network import VerificationNetwork
+
+
+class TestLPEncoding(TestCase):
+    def test_reused_lp_matches_per_domain_lp(self):
+        for seed in range(3):
+            torch.manual_seed(seed)
+            base = torch.nn.Sequential(torch.nn.Linear(3, 12), torch.nn.ReLU(), torch.nn.Linear(12, 12), torch.nn.ReLU(), torch.nn.Linear(12, 3)).double()
+            net = VerificationNetwork(base)
+            layers = list(base) + [net.attach_property_layers(1)]
+            domains = []
+            for _ in range(4):
+                lb = torch.rand(3, dtype=torch.float64) * 2 - 1
+                domains.append(torch.stack([lb, lb + torch.rand(3, dtype=torch.float64)], dim=1))
+            with mock.patch("plnn.verification_network.is_fully_connected", return_value=False):
+                expected = [net.get_boundaries(domain, 1, False) for domain in domains]  # a new gurobi model for each domain
+            for backend in ("gurobi", "highs"):
+                encoding = LPEncoding(layers, backend)
+                for domain, (upper_bound, lower_bound) in zip(domains, expected):
+                    lower_bounds, upper_bounds = encoding.get_boundaries(domain[:, 0].numpy(), domain[:, 1].numpy())
+                    assert abs(min(lower_bounds[-1]) - lower_bound) < 1e-6, backend
+                    assert abs(max(upper_bounds[-1]) - upper_bound) < 1e-6, backend
+
+    def test_symbolic_prepass(self):
+        torch.manual_seed(0)
+        net = VerificationNetwork(torch.nn.Sequential(torch.nn.Linear(3, 16), torch.nn.ReLU(), torch.nn.Linear(16, 16), torch.nn.ReLU(), torch.nn.Linear(16, 3)).double())
+        domains = []
+        for _ in range(4):
+            lb = torch.rand(3, dtype=torch.float64) * 2 - 1
+            domains.append(torch.stack([lb, lb + 0.2 * torch.rand(3, dtype=torch.float64)], dim=1))
+        net.use_symbolic_prepass = False
+        expected = [net.get_boundaries(domain, 1) for domain in domains]
+        encoding = net.get_lp_encoding(1)
+        assert encoding.n_lp_skipped == 0
+        net.use_symbolic_prepass = True
+        for domain, (upper_bound, lower_bound) in zip(domains, expected):
+            u, l = net.get_boundaries(domain, 1)
+            assert abs(u - upper_bound) < 1e-6 and abs(l - lower_bound) < 1e-6
+        assert encoding.n_lp_skipped > 0
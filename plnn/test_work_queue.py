@@ -0,0 +1,14 @@
+from unittest import TestCase
+
+from plnn.work_queue import WorkQueue, DEPTH_FIRST, BREADTH_FIRST, BEST_FIRST
+
+
+class TestWorkQueue(TestCase):
+    def test_order(self):
+        for order, expected in [(DEPTH_FIRST, [4, 3, 2, 1, 0]), (BREADTH_FIRST, [0, 1, 2, 3, 4]), (BEST_FIRST, [4, 3, 2, 1, 0])]:
+            queue = WorkQueue(order, key=lambda x: -x)
+            queue.extend(range(5))
+            assert queue.to_list() == expected
+            assert queue.peek() == expected[0]
+            assert queue.pop_batch(2) + queue.pop_batch(10) == expected  # no item is lost across batches
+            assert len(queue) == 0
@@ -2,22 +2,33 @@ import hashlib
 import os
 import pickle
 import time
+from typing import List, Tuple
 
 import gurobipy as grb
 import numpy as np
 import torch
 from torch import nn as nn
 
+from plnn.bound_cache import network_fingerprint
 from plnn.flatten_layer import Flatten
+from plnn.interval_network_cache import get_interval_network, parameter_versions
+from plnn.lp_encoding import LPEncoding, is_fully_connected, intersect_bounds
+from symbolic.symbolic_interval import Symbolic_interval
+from symbolic.symbolic_interval.interval import rounding_error, outward_cast
+from symbolic.symbolic_interval.symbolic_network import Interval_Dense
 
 use_cuda = False
 device = torch.device("cuda:0" if torch.cuda.is_available() and use_cuda else "cpu")
+lp_encodings = dict()  # (network fingerprint, true_class_index) -> LPEncoding, shared by all the domains evaluated in the same process
 
 
 class VerificationNetwork(nn.Module):
     def __init__(self, base_network: torch.nn.Sequential):
         super(VerificationNetwork, self).__init__()
         self.base_network = base_network
+        self.use_symbolic_prepass = True  # skip the LPs of the neurons whose phase is fixed by symbolic interval propagation
+        self._fingerprint = None
+        self._fingerprint_versions = None  # parameter versions the fingerprint was computed for
 
     '''need to  repeat this method for each class so that it describes the distance between the corresponding class 
     and the closest other class'''
@@ -40,7 +51,7 @@ class VerificationNetwork(nn.Module):
 
     def forward_verif(self, x, true_class_index):
         x = self.base_network(x)
-        property_layer = self.attach_property_layers(true_class_index)
+        property_layer = self.attach_property_layers(true_class_index).to(x.dtype)
         result = torch.matmul(x, torch.t(property_layer))
         return torch.min(result, dim=1, keepdim=True)[0]
 
@@ -50,56 +61,55 @@ class VerificationNetwork(nn.Module):
         return x
 
     def get_upper_bound(self, domain, true_class_index):
-        # we try get_upper_bound
-        nb_samples = 1024
-        nb_inp = domain.size()[0]  # get last dimensions
-        # print(nb_inp)
-        # Not a great way of sampling but this will be good enough
-        # We want to get rows that are >= 0
-        rand_samples_size = [nb_samples, nb_inp]
-        rand_samples = torch.zeros(rand_samples_size).to(device)
-        rand_samples.uniform_(0, 1)
-        domain_lb = domain.select(-1, 0).contiguous()
-        domain_ub = domain.select(-1, 1).contiguous()
+        '''
+        domain: Tensor containing in each row the lower and upper bound for the corresponding dimension
+        :return: the point where the lowest value of the property was found and the value itself
+        '''
+        ub_points, upper_bounds = self.get_upper_bounds_batch(domain.unsqueeze(0), true_class_index)
+        return ub_points[0], upper_bounds[0].item()
+
+    def get_upper_bounds_batch(self, domains: torch.Tensor, true_class_index, n_seeds=64, n_steps=20, step_size=0.1):
+        '''
+        Searches counterexamples in a batch of domains of shape [B,d,2] with projected gradient descent on the property,
+        starting from n_seeds random points (and the centre) of every domain, all the domains and seeds are processed in the same forward pass
+        step_size: initial length of a step as a fraction of the width of the domain, it decays linearly to 0
+        :return: the points [B,d] where the lowest value of the property was found in each domain and the values [B]
+        '''
+        dtype = self.base_network[-1].weight.dtype
+        domains = domains.to(device=device, dtype=dtype)
+        batch_size, nb_inp = domains.shape[0], domains.shape[1]
+        domain_lb = domains.select(-1, 0).unsqueeze(1)  # [B,1,d]
+        domain_ub = domains.select(-1, 1).unsqueeze(1)
         domain_width = domain_ub - domain_lb
-        # domain_lb = domain_lb.view([1] + list(nb_inp)).expand(
-        #     [nb_samples] + list(nb_inp))  # expand the initial point for the number of examples
-        # domain_width = domain_width.view([1] + list(nb_inp)).expand(
-        #     [nb_samples] + list(nb_inp))  # expand the width for the number of examples
-        inps = domain_lb + domain_width * rand_samples
-        # now flatten the first dimension into the second
-        # flattened_size = [inps.size(0) * inps.size(1)] + list(inps.size()[2:])
-        # print(flattened_size)
-        # rearrange the tensor so that is consumable by the model
-        # print(self.input_size)
-        # examples_data_size = [nb_samples] + list(self.input_size[1:])  # the expected dimension of the example tensor
-        # print(examples_data_size)
-        # var_inps = inps.view(examples_data_size)
-        # if var_inps.size() != self.input_size: print(f"var_inps != input_size , {var_inps}/{self.input_size}")  # should match input_size
-        outs = self.forward_verif(inps, true_class_index)  # gets the input for the values
-        # print(outs.size())
-        # print(outs[0])  # those two should be very similar but different because they belong to two different examples
-        # print(outs[1])
-        # print(outs.size())
-        outs_true_class_resized = outs.squeeze(1)
-        # print(outs_true_class_resized.size())  # resize outputs so that they each row is a different element of each batch
-        upper_bound, idx = torch.min(outs_true_class_resized,
-                                     dim=0)  # this returns the distance of the network output from the given class, it selects the class which is furthest from the current one
-        # print(f'idx size {idx.size()}')
-        # print(f'inps size {inps.size()}')
-        # print(idx.item())
-        # upper_bound = upper_bound[0]
-        # unsqueezed_idx = idx.view(-1, 1)
-        # print(f'single size {inps.select(0, idx.item()).size()}')
-        ub_point = inps.select(0,
-                               idx.item())  # torch.tensor([inps[x][idx[x]][:].cpu().numpy() for x in range(idx.size()[0])]).to(device)  # ub_point represents the input that amongst all examples returns the minimum response for the appropriate class
-        return ub_point, upper_bound.item()
+        seeds = domain_lb + domain_width * torch.rand(batch_size, n_seeds, nb_inp, device=device, dtype=dtype)
+        inps = torch.cat([(domain_lb + domain_ub) / 2, seeds], dim=1)  # [B,S,d]
+        best_values = torch.full((batch_size,), float("inf"), device=device, dtype=dtype)
+        best_points = inps[:, 0, :].detach().clone()
+        batch_index = torch.arange(batch_size, device=device)
+        with torch.enable_grad():
+            for step in range(n_steps + 1):
+                inps = inps.detach().requires_grad_(True)
+                outs = self.forward_verif(inps.reshape(-1, nb_inp), true_class_index).view(batch_size, -1)
+                values, idx = torch.min(outs.detach(), dim=1)
+                improved = values < best_values
+                best_values = torch.where(improved, values, best_values)
+                best_points[improved] = inps.detach()[batch_index, idx][improved]
+                if step == n_steps:
+                    break
+                grad, = torch.autograd.grad(outs.sum(), inps)
+                alpha = step_size * (1 - step / n_steps)
+                inps = torch.max(torch.min(inps.detach() - alpha * domain_width * grad.sign(), domain_ub), domain_lb)
+        return best_points, best_values
 
     def get_lower_bound(self, domain, true_class_index, save=True):
         '''
         input_domain: Tensor containing in each row the lower and upper bound
                       for the corresponding dimension
         '''
+        if is_fully_connected(self.base_network):
+            lower_bounds, upper_bounds = self.get_lp_bounds(domain, true_class_index)
+            return min(lower_bounds[-1])
+        # todo the convolutional path still builds gurobi models directly (and caches them as .mps files), move it to utility.solver_backend
         # now try to do the lower bound
 
         batch_size = 1  # domain.size()[1]
@@ -943,11 +953,116 @@ class VerificationNetwork(nn.Module):
         # print(f'Result -1={gurobi_vars[-2]}')
         return gurobi_vars[-1][0].X
 
+    def get_boundaries_batch(self, domains: torch.Tensor, true_class_index):
+        '''
+        Vectorised interval bound propagation for a batch of domains, looser than get_boundaries but a single pass for the whole batch
+        domains: Tensor of shape [B,2,d], the first row of each domain contains the lower bounds and the second row the upper bounds,
+                 below float64 the bounds are rounded outward by the floating point error of each linear layer
+        :return: upper bounds [B], lower bounds [B] of the property
+        '''
+        lb = domains[:, 0, :]
+        ub = domains[:, 1, :]
+        layers = []
+        layers.extend(self.base_network)
+        layers.append(self.attach_property_layers(true_class_index))
+        with torch.no_grad():
+            for layer in layers:
+                if type(layer) is nn.Linear or type(layer) is torch.Tensor:
+                    weight = layer.weight if type(layer) is nn.Linear else layer
+                    bias = layer.bias if type(layer) is nn.Linear else None
+                    weight = weight.to(domains.dtype)
+                    if domains.dtype != torch.float64:
+                        error = rounding_error(torch.max(lb.abs(), ub.abs()), weight, bias.to(domains.dtype) if bias is not None else None, weight.shape[1])
+                    weight_pos = weight.clamp(min=0)
+                    weight_neg = weight.clamp(max=0)
+                    new_lb = lb @ weight_pos.t() + ub @ weight_neg.t()
+                    new_ub = ub @ weight_pos.t() + lb @ weight_neg.t()
+                    if bias is not None:
+                        new_lb = new_lb + bias.to(domains.dtype)
+                        new_ub = new_ub + bias.to(domains.dtype)
+                    if domains.dtype != torch.float64:
+                        new_lb, new_ub = new_lb - error, new_ub + error
+                    lb, ub = new_lb, new_ub
+                elif type(layer) is nn.ReLU:
+                    lb = lb.clamp(min=0)
+                    ub = ub.clamp(min=0)
+                elif type(layer) is Flatten:
+                    continue
+                else:
+                    raise Exception('Type of layer not supported')
+        # the property is the minimum over the distances from the other classes
+        return torch.min(ub, dim=1)[0], torch.min(lb, dim=1)[0]
+
+    def fingerprint(self) -> str:
+        """:return: the hash of the weights, recomputed if the parameters were modified since the previous call"""
+        versions = parameter_versions(self.base_network)
+        if self._fingerprint_versions != versions:
+            self._fingerprint = network_fingerprint(self.base_network)
+            self._fingerprint_versions = versions
+        return self._fingerprint
+
+    def get_lp_encoding(self, true_class_index) -> LPEncoding:
+        key = (self.fingerprint(), true_class_index)
+        if key not in lp_encodings:
+            layers = []
+            layers.extend(self.base_network)
+            layers.append(self.attach_property_layers(true_class_index))
+            lp_encodings[key] = LPEncoding(layers)
+        return lp_encodings[key]
+
+    def symbolic_prepass(self, domains: torch.Tensor, true_class_index) -> List[List[Tuple[np.ndarray, np.ndarray]]]:
+        '''
+        Symbolic interval propagation of a batch of domains of shape [B,d,2]
+        :return: for each domain, the (lower, upper) bounds of the output of every linear layer including the property layer
+        '''
+        dtype = self.base_network[-1].weight.dtype
+        inet = get_interval_network(self.base_network, true_class_index, dtype)
+        lower, upper = outward_cast(domains[:, :, 0], domains[:, :, 1], dtype)
+        ix = Symbolic_interval(lower=lower, upper=upper, use_cuda=False, outward_rounding=dtype != torch.float64)
+        bounds = []
+        with torch.no_grad():
+            for layer in inet.net:
+                ix = layer(ix)
+                if isinstance(layer, Interval_Dense):
+                    bounds.append((ix.l.detach().cpu().numpy().astype(np.float64), ix.u.detach().cpu().numpy().astype(np.float64)))
+        return [[(lb[i], ub[i]) for lb, ub in bounds] for i in range(domains.shape[0])]
+
+    def get_lp_bounds(self, domain, true_class_index, parent_bounds=None):
+        '''
+        Bounds of every layer computed with the cached LP encoding, only for fully connected networks
+        parent_bounds: optional bounds of every linear layer computed for a domain containing this one, they are still valid and tighten the relaxation
+        '''
+        prepass_bounds = self.symbolic_prepass(domain.unsqueeze(0), true_class_index)[0] if self.use_symbolic_prepass else None
+        prepass_bounds = intersect_bounds(prepass_bounds, parent_bounds)
+        # reuse the same LP, only the bounds and the relaxation change between domains
+        return self.get_lp_encoding(true_class_index).get_boundaries(domain[:, 0].cpu().numpy(), domain[:, 1].cpu().numpy(), prepass_bounds)
+
+    def get_boundaries_and_layers(self, domain, true_class_index, parent_bounds=None):
+        '''
+        Same as get_boundaries but also returns the (lower, upper) bounds of every linear layer so that the children of the domain can reuse them,
+        the neurons whose phase is fixed for the parent are not solved again. The layer bounds are None for networks that are not fully connected
+        '''
+        if not is_fully_connected(self.base_network):
+            upper_bound, lower_bound = self.get_boundaries(domain, true_class_index, False)
+            return upper_bound, lower_bound, None
+        lower_bounds, upper_bounds = self.get_lp_bounds(domain, true_class_index, parent_bounds)
+        lower_bound = min(lower_bounds[-1])
+        upper_bound = max(upper_bounds[-1])
+        assert lower_bound <= upper_bound
+        return upper_bound, lower_bound, self.get_lp_encoding(true_class_index).layer_bounds
+
     def get_boundaries(self, domain, true_class_index, save=True):
         '''
         input_domain: Tensor containing in each row the lower and upper bound
                       for the corresponding dimension
         '''
+        if is_fully_connected(self.base_network):
+            lower_bounds, upper_bounds = self.get_lp_bounds(domain, true_class_index)
+            lower_bound = min(lower_bounds[-1])
+            upper_bound = max(upper_bounds[-1])
+            assert lower_bound <= upper_bound
+            return upper_bound, lower_bound
+        # todo the convolutional path still builds gurobi models directly (and caches them as .mps files), move it to utility.solver_backend
         # now try to do the lower bound
 
         batch_size = 1  # domain.size()[1]
@@ -10,8 +10,10 @@ from sympy import symarray
 from torch import nn as nn
 
 from agents.dqn.dqn_sequential import TestNetwork
+from plnn.bound_cache import network_fingerprint
 from plnn.flatten_layer import Flatten
-from symbolic.symbolic_interval import Interval_network, Symbolic_interval
+from plnn.interval_network_cache import get_interval_network, interval_bounds, parameter_versions, FORWARD
+from symbolic.symbolic_interval import Symbolic_interval
 
 use_cuda = False
 device = torch.device("cuda:0" if torch.cuda.is_available() and use_cuda else "cpu")
@@ -22,6 +24,8 @@ class SymVerificationNetwork(nn.Module):
         """Base network any nn.sequential network"""
         super(SymVerificationNetwork, self).__init__()
         self.base_network = base_network
+        self._fingerprint = None
+        self._fingerprint_versions = None  # parameter versions the fingerprint was computed for
 
     '''need to  repeat this method for each class so that it describes the distance between the corresponding class 
     and the closest other class'''
@@ -55,6 +59,14 @@ class SymVerificationNetwork(nn.Module):
         x = self.base_network(x)
         return x
 
+    def fingerprint(self) -> str:
+        """:return: the hash of the weights, recomputed if the parameters were modified since the previous call"""
+        versions = parameter_versions(self.base_network)
+        if self._fingerprint_versions != versions:
+            self._fingerprint = network_fingerprint(self.base_network)
+            self._fingerprint_versions = versions
+        return self._fingerprint
+
     def substitute_array(self, prefix, array):
         substitution_dict = dict()
         for index, x in np.ndenumerate(array):
@@ -62,19 +74,14 @@ class SymVerificationNetwork(nn.Module):
             substitution_dict[key] = array[index]
         return substitution_dict
 
-    def get_boundaries(self, interval: Symbolic_interval, true_class_index):
+    def get_boundaries(self, interval: Symbolic_interval, true_class_index, method: str = FORWARD):
         '''
         input_domain: Tensor containing in each row the lower and upper bound
                       for the corresponding dimension
+        method: the propagation method, one of plnn.interval_network_cache.BOUND_METHODS
         '''
-        verif_network = []
-        verif_network.extend(self.base_network)
-        verif_network.append(self.attach_property_layers(true_class_index))
-        net = torch.nn.Sequential(*verif_network)
-        inet = Interval_network(net, None)
-        result_interval = inet(interval)
-        upper_bound = result_interval.u
-        lower_bound = result_interval.l
+        inet = get_interval_network(self.base_network, true_class_index, interval.c.dtype)
+        upper_bound, lower_bound = interval_bounds(inet, interval, method)
         return upper_bound, lower_bound
 
 
@@ -0,0 +1,73 @@
+import heapq
+import itertools
+from collections import deque
+from typing import Callable, List
+
+import mosaic.utils
+
+DEPTH_FIRST = "depth_first"
+BREADTH_FIRST = "breadth_first"
+BEST_FIRST = "best_first"
+
+
+def largest_area_first(domain) -> float:
+    return -mosaic.utils.area_tensor(domain)
+
+
+class WorkQueue:
+    """
+    Queue of domains waiting to be explored, all the operations are O(1) (O(log n) for best first)
+    depth first: the most recently pushed domains are popped first
+    breadth first: the domains are popped in the same order they were pushed
+    best first: the domains with the smallest priority are popped first, the priority is computed by key (largest area first by default)
+    """
+
+    def __init__(self, order: str = DEPTH_FIRST, key: Callable = None):
+        if order not in (DEPTH_FIRST, BREADTH_FIRST, BEST_FIRST):
+            raise Exception(f"Invalid exploration order {order}")
+        self.order = order
+        self.key = key if key is not None else largest_area_first
+        self.items = [] if order == BEST_FIRST else deque()
+        self.counter = itertools.count()  # tie breaker, keeps the heap stable and avoids comparing the domains
+
+    def __len__(self):
+        return len(self.items)
+
+    def push(self, item, priority: float = None):
+        if self.order == BEST_FIRST:
+            heapq.heappush(self.items, (self.key(item) if priority is None else priority, next(self.counter), item))
+        else:
+            self.items.append(item)
+
+    def extend(self, items):
+        for item in items:
+            self.push(item)
+
+    def pop(self):
+        if self.order == BEST_FIRST:
+            return heapq.heappop(self.items)[-1]
+        elif self.order == DEPTH_FIRST:
+            return self.items.pop()
+        else:
+            return self.items.popleft()
+
+    def peek(self):
+        """:return: the next item that would be popped, without removing it"""
+        if self.order == BEST_FIRST:
+            return self.items[0][-1]
+        elif self.order == DEPTH_FIRST:
+            return self.items[-1]
+        else:
+            return self.items[0]
+
+    def pop_batch(self, n: int) -> List:
+        """Pops up to n items"""
+        return [self.pop() for _ in range(min(n, len(self.items)))]
+
+    def to_list(self) -> List:
+        if self.order == BEST_FIRST:
+            return [item for _, _, item in sorted(self.items)]
+        elif self.order == DEPTH_FIRST:
+            return list(reversed(self.items))
+        else:
+            return list(self.items)
@@ -7,7 +7,6 @@ from collections import defaultdict
 from contextlib import nullcontext
 from typing import Tuple, List
 
-import gurobi as grb
 import numpy as np
 import progressbar
 import ray
@@ -15,6 +14,7 @@ import torch
 from interval import interval, imath
 
 from polyhedra.plot_utils import show_polygon_list3
+from utility import solver_backend
 
 
 class Experiment():
@@ -41,6 +41,7 @@ class Experiment():
         self.show_progressbar = True
         self.show_progress_plot = True
         self.save_dir = None
+        self.lp_backend = None  # solver used by the LP/MILP encodings, see utility.solver_backend
 
     def run_experiment(self):
         assert self.get_nn_fn is not None
@@ -153,54 +154,58 @@ class Experiment():
         return tuple(rounded_x)
 
     def generate_root_polytope(self):
-        gurobi_model = grb.Model()
-        gurobi_model.setParam('OutputFlag', self.output_flag)
-        input = Experiment.generate_input_region(gurobi_model, self.input_template, self.input_boundaries, self.env_input_size)
-        x_results = self.optimise(self.analysis_template, gurobi_model, input)
-        if x_results is None:
-            print("Model unsatisfiable")
-            return None
-        root = tuple(x_results)
+        solver = self.new_solver(self.output_flag)
+        input = self.generate_input_region(solver, self.input_template, self.input_boundaries, self.env_input_size)
+        results = []
+        for template in self.analysis_template:
+            solver.set_objective(input, template, solver_backend.MAXIMIZE)
+            if solver.optimize() != solver_backend.OPTIMAL:
+                print("Model unsatisfiable")
+                return None
+            results.append(solver.objective_value)
+        root = tuple(results)
         return root
 
+    def new_solver(self, output_flag=False, threads=1) -> solver_backend.SolverBackend:
+        return solver_backend.get_backend(self.lp_backend, output_flag=output_flag, threads=threads)
+
     @staticmethod
-    def generate_input_region(gurobi_model, templates, boundaries, env_input_size):
-        input = gurobi_model.addMVar(shape=env_input_size, lb=float("-inf"), ub=float("inf"), name="input")
-        Experiment.generate_region_constraints(gurobi_model, templates, input, boundaries, env_input_size)
+    def generate_input_region(solver: solver_backend.SolverBackend, templates, boundaries, env_input_size):
+        input = solver.add_variables(env_input_size)
+        Experiment.generate_region_constraints(solver, templates, input, boundaries, env_input_size)
         return input
 
     @staticmethod
-    def generate_region_constraints(gurobi_model, templates, input, boundaries, env_input_size):
-        for j, template in enumerate(templates):
-            gurobi_model.update()
-            multiplication = 0
-            for i in range(env_input_size):
-                multiplication += template[i] * input[i]
-            gurobi_model.addConstr(multiplication <= boundaries[j], name=f"input_constr_{j}")
+    def generate_region_constraints(solver: solver_backend.SolverBackend, templates, input, boundaries, env_input_size):
+        templates = np.asarray(templates, dtype=float)
+        boundaries = np.asarray(boundaries, dtype=float)[:len(templates)]  # extra boundaries are ignored
+        return solver.add_constraints(templates[:, :env_input_size], input[:env_input_size], "<", boundaries)
 
-    def optimise(self, templates: np.ndarray, gurobi_model: grb.Model, x_prime: tuple):
+    @staticmethod
+    def generate_linear_dynamic(solver: solver_backend.SolverBackend, input, matrix, offset=0):
+        """adds the variables z == matrix @ input + offset and returns them"""
+        matrix = np.asarray(matrix, dtype=float)
+        z = solver.add_variables(matrix.shape[0])
+        solver.add_constraints(np.hstack([np.eye(matrix.shape[0]), -matrix]), np.concatenate([z, input]), "=", offset)
+        return z
+
+    def optimise(self, templates: np.ndarray, solver: solver_backend.SolverBackend, x_prime: np.ndarray):
         results = []
         for template in templates:
-            gurobi_model.update()
-            gurobi_model.setObjective(sum((template[i] * x_prime[i]) for i in range(self.env_input_size)), grb.GRB.MAXIMIZE)
-            gurobi_model.optimize()
-            # print_model(gurobi_model)
-            if gurobi_model.status != 2:
+            solver.set_objective(x_prime[:self.env_input_size], np.asarray(template, dtype=float)[:self.env_input_size], solver_backend.MAXIMIZE)
+            if solver.optimize() != solver_backend.OPTIMAL:
                 return None
-            result = gurobi_model.ObjVal
+            result = solver.objective_value
             results.append(result)
         return np.array(results)
 
     def check_unsafe(self, template, bnds):
         for A, b in self.unsafe_zone:
-            gurobi_model = grb.Model()
-            gurobi_model.setParam('OutputFlag', False)
-            input = gurobi_model.addMVar(shape=(self.env_input_size,), lb=float("-inf"), name="input")
-            Experiment.generate_region_constraints(gurobi_model, template, input, bnds, self.env_input_size)
-            Experiment.generate_region_constraints(gurobi_model, A, input, b, self.env_input_size)
-            gurobi_model.update()
-            gurobi_model.optimize()
-            if gurobi_model.status == 2:
+            solver = self.new_solver(self.output_flag)
+            input = solver.add_variables(self.env_input_size)
+            solver.add_constraints(template, input, "<", bnds)
+            solver.add_constraints(A, input, "<", b)
+            if solver.optimize() == solver_backend.OPTIMAL:
                 return True
         return False
 
@@ -234,57 +239,50 @@ class Experiment():
             template.append(-x)
         return np.stack(template)
 
-    def h_repr_to_plot(self, gurobi_model, template, x_prime):
-        x_prime_results = self.optimise(template, gurobi_model, x_prime)  # h representation
+    def h_repr_to_plot(self, solver, template, x_prime):
+        x_prime_results = self.optimise(template, solver, x_prime)  # h representation
         return x_prime_results is not None, x_prime_results
 
     @staticmethod
-    def generate_nn_guard(gurobi_model: grb.Model, input, nn: torch.nn.Sequential, action_ego=0):
-        gurobi_vars = []
-        gurobi_vars.append(input)
+    def generate_relu(solver: solver_backend.SolverBackend, x):
+        """
+        y = Relu(x), x is split in its positive and negative part
+        0 <= z <= 1, z is integer
+        x = y - w
+        y >= 0, w >= 0
+        y <= Mz
+        w <= M - Mz"""
+        n = len(x)
+        identity = np.eye(n)
+        v = solver.add_variables(n, lb=0)  # same shape as previous
+        w = solver.add_variables(n, lb=0)
+        z = solver.add_variables(n, lb=0, ub=1, integer=True)
+        M = 10e4  # the activations stay far below this, a larger M is beyond the integrality tolerance of HiGHS
+        solver.add_constraints(np.hstack([identity, -identity, identity]), np.concatenate([x, v, w]), "=", 0)
+        solver.add_constraints(np.hstack([identity, -M * identity]), np.concatenate([v, z]), "<", 0)
+        solver.add_constraints(np.hstack([identity, M * identity]), np.concatenate([w, z]), "<", M)
+        return v
+
+    @staticmethod
+    def generate_nn_guard(solver: solver_backend.SolverBackend, input, nn: torch.nn.Sequential, action_ego=0):
+        solver_vars = []
+        solver_vars.append(input)
         for i, layer in enumerate(nn):
 
             # print(layer)
             if type(layer) is torch.nn.Linear:
-                v = gurobi_model.addMVar(lb=float("-inf"), shape=(layer.out_features), name=f"layer_{i}")
-                lin_expr = layer.weight.data.numpy() @ gurobi_vars[-1]
-                if layer.bias is not None:
-                    lin_expr = lin_expr + layer.bias.data.numpy()
-                gurobi_model.addConstr(v == lin_expr, name=f"linear_constr_{i}")
-                gurobi_vars.append(v)
+                bias = layer.bias.data.numpy() if layer.bias is not None else 0
+                v = Experiment.generate_linear_dynamic(solver, solver_vars[-1], layer.weight.data.numpy(), bias)
+                solver_vars.append(v)
             elif type(layer) is torch.nn.ReLU:
-                v = gurobi_model.addMVar(lb=float("-inf"), shape=gurobi_vars[-1].shape, name=f"layer_{i}")  # same shape as previous
-                z = gurobi_model.addMVar(lb=0, ub=1, shape=gurobi_vars[-1].shape, vtype=grb.GRB.INTEGER, name=f"relu_{i}")
-                M = 10e6
-                # gurobi_model.addConstr(v == grb.max_(0, gurobi_vars[-1]))
-                gurobi_model.addConstr(v >= gurobi_vars[-1], name=f"relu_constr_1_{i}")
-                gurobi_model.addConstr(v <= gurobi_vars[-1] + M * z, name=f"relu_constr_2_{i}")
-                gurobi_model.addConstr(v >= 0, name=f"relu_constr_3_{i}")
-                gurobi_model.addConstr(v <= M - M * z, name=f"relu_constr_4_{i}")
-                gurobi_vars.append(v)
-                # gurobi_model.update()
-                # gurobi_model.optimize()
-                # assert gurobi_model.status == 2, "LP wasn't optimally solved"
-                """
-                y = Relu(x)
-                0 <= z <= 1, z is integer
-                y >= x
-                y <= x + Mz
-                y >= 0
-                y <= M - Mz"""
-        # gurobi_model.update()
-        # gurobi_model.optimize()
-        # assert gurobi_model.status == 2, "LP wasn't optimally solved"
-        # gurobi_model.setObjective(v[action_ego].sum(), grb.GRB.MAXIMIZE)  # maximise the output
-        last_layer = gurobi_vars[-1]
+                v = Experiment.generate_relu(solver, solver_vars[-1])
+                solver_vars.append(v)
+        last_layer = solver_vars[-1]
         if action_ego == 0:
-            gurobi_model.addConstr(last_layer[0] >= last_layer[1], name="last_layer")
+            solver.add_constraints(np.array([[1, -1]]), last_layer[:2], ">", 0)
         else:
-            gurobi_model.addConstr(last_layer[1] >= last_layer[0], name="last_layer")
-        gurobi_model.update()
-        gurobi_model.optimize()
-        # assert gurobi_model.status == 2, "LP wasn't optimally solved"
-        return gurobi_model.status == 2
+            solver.add_constraints(np.array([[-1, 1]]), last_layer[:2], ">", 0)
+        return solver.optimize() == solver_backend.OPTIMAL
 
     def generic_plot(self, title_x, title_y, vertices_list, template, template_2d):
         fig, simple_vertices = show_polygon_list3(vertices_list, title_x, title_y, template, template_2d)
@@ -1,38 +1,40 @@
 import numpy as np
 import scipy.sparse as sp
-import gurobipy as gp
 
+from utility import solver_backend
 
-def is_separable(points: np.ndarray, A, b):
-    m = gp.Model("matrix1")
+
+def is_separable(points: np.ndarray, A, b, backend: str = None):
+    A = np.asarray(A, dtype=np.float64)
+    b = np.asarray(b, dtype=np.float64)
+    m = solver_backend.get_backend(backend)
     # Create variables
-    y = m.addMVar(shape=(3,), name="y", lb=0)
+    y = m.add_variables(len(b), lb=0)
     epsilon = np.array([-1])
     # bad state polyhedra definition
 
     # cloud of points
     # points = np.array([[2, 2], [2, 1.5], [1.5, 1.5]])  # , [1, 0.5]
-    d = m.addMVar(shape=(2,), name="d", lb=float("-inf"))
+    d = m.add_variables(A.shape[1])
     # d = np.array([-1.0, -1.0])  # the direction vector
-    z1 = m.addMVar(shape=(1,), name="z1", lb=float("-inf"))
+    z1 = m.add_variables(1)
 
-    # m.setObjective(sum(z1)+(b @ y), GRB.MINIMIZE)  #- (b @ y)sum(z1)
     # Add constraints
-    m.addConstr(A.T @ y == -d)  # fix direction as opposite of d
-    m.addConstr((z1 + (b @ y)) <= epsilon)  # point inside polyhedra
-    for i in range(len(points)):
-        m.addConstr(z1 >= (points[i] @ d))  # points belonging to the cloud
+    m.add_constraints(sp.hstack([sp.csr_matrix(A.T), sp.identity(A.shape[1])]), np.concatenate([y, d]), "=", 0)  # fix direction as opposite of d
+    m.add_constraints(np.concatenate([[1.0], b])[None, :], np.concatenate([z1, y]), "<", epsilon)  # point inside polyhedra
+    points = np.asarray(points, dtype=np.float64)
+    m.add_constraints(np.hstack([np.ones((len(points), 1)), -points]), np.concatenate([z1, d]), ">", 0)  # points belonging to the cloud
 
     # Optimize model
-    m.optimize()
-    if m.Status == gp.GRB.OPTIMAL:
+    status = m.optimize()
+    if status == solver_backend.OPTIMAL:
         print("Model solved successfully")
         return True
-    elif m.Status == gp.GRB.INFEASIBLE:
+    elif status == solver_backend.INFEASIBLE:
         print("Model infeasible")
         return False
     else:
-        print(f"Unknown code: {m.Status}")
+        print(f"Unknown code: {status}")
         return False
 
 if __name__ == '__main__':
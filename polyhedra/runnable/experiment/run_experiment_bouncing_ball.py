@@ -1,6 +1,5 @@
 from typing import List, Tuple
 
-import gurobi as grb
 import numpy as np
 import ray
 import torch
@@ -10,6 +9,7 @@ from agents.ppo.train_PPO_bouncingball import get_PPO_trainer
 from agents.ppo.tune.tune_train_PPO_bouncing_ball import get_PPO_config
 from agents.ray_utils import convert_ray_policy_to_sequential
 from polyhedra.experiments_nn_analysis import Experiment
+from utility import solver_backend
 
 
 class BouncingBallExperiment(Experiment):
@@ -38,149 +38,125 @@ class BouncingBallExperiment(Experiment):
         post = []
 
         def standard_op():
-            gurobi_model = grb.Model()
-            gurobi_model.setParam('OutputFlag', output_flag)
-            input = self.generate_input_region(gurobi_model, template, x, self.env_input_size)
-            z = self.apply_dynamic(input, gurobi_model, self.env_input_size)
-            return gurobi_model, z, input
+            solver = self.new_solver(output_flag)
+            input = self.generate_input_region(solver, template, x, self.env_input_size)
+            z = self.apply_dynamic(input, solver, self.env_input_size)
+            return solver, z, input
 
         # case 0
-        gurobi_model, z, input = standard_op()
-        feasible0 = self.generate_guard(gurobi_model, z, case=0)  # bounce
+        solver, z, input = standard_op()
+        feasible0 = self.generate_guard(solver, z, case=0)  # bounce
         if feasible0:  # action is irrelevant in this case
             # apply dynamic
-            x_prime = self.apply_dynamic2(z, gurobi_model, case=0, env_input_size=self.env_input_size)
-            found_successor, x_prime_results = self.h_repr_to_plot(gurobi_model, template, x_prime)
+            x_prime = self.apply_dynamic2(z, solver, case=0, env_input_size=self.env_input_size)
+            found_successor, x_prime_results = self.h_repr_to_plot(solver, template, x_prime)
             if found_successor:
                 post.append(tuple(x_prime_results))
 
         # case 1 : ball going down and hit
-        gurobi_model, z, input = standard_op()
-        feasible11 = self.generate_guard(gurobi_model, z, case=1)
+        solver, z, input = standard_op()
+        feasible11 = self.generate_guard(solver, z, case=1)
         if feasible11:
-            feasible12 = self.generate_nn_guard(gurobi_model, input, nn, action_ego=1)  # check for action =1 over input (not z!)
+            feasible12 = self.generate_nn_guard(solver, input, nn, action_ego=1)  # check for action =1 over input (not z!)
             if feasible12:
                 # apply dynamic
-                x_prime = self.apply_dynamic2(z, gurobi_model, case=1, env_input_size=self.env_input_size)
-                found_successor, x_prime_results = self.h_repr_to_plot(gurobi_model, template, x_prime)
+                x_prime = self.apply_dynamic2(z, solver, case=1, env_input_size=self.env_input_size)
+                found_successor, x_prime_results = self.h_repr_to_plot(solver, template, x_prime)
                 if found_successor:
                     post.append(tuple(x_prime_results))
         # case 2 : ball going up and hit
-        gurobi_model, z, input = standard_op()
-        feasible21 = self.generate_guard(gurobi_model, z, case=2)
+        solver, z, input = standard_op()
+        feasible21 = self.generate_guard(solver, z, case=2)
         if feasible21:
-            feasible22 = self.generate_nn_guard(gurobi_model, input, nn, action_ego=1)  # check for action =1 over input (not z!)
+            feasible22 = self.generate_nn_guard(solver, input, nn, action_ego=1)  # check for action =1 over input (not z!)
             if feasible22:
                 # apply dynamic
-                x_prime = self.apply_dynamic2(z, gurobi_model, case=2, env_input_size=self.env_input_size)
-                found_successor, x_prime_results = self.h_repr_to_plot(gurobi_model, template, x_prime)
+                x_prime = self.apply_dynamic2(z, solver, case=2, env_input_size=self.env_input_size)
+                found_successor, x_prime_results = self.h_repr_to_plot(solver, template, x_prime)
                 if found_successor:
                     post.append(tuple(x_prime_results))
         # case 1 alt : ball going down and NO hit
-        gurobi_model, z, input = standard_op()
-        feasible11_alt = self.generate_guard(gurobi_model, z, case=1)
+        solver, z, input = standard_op()
+        feasible11_alt = self.generate_guard(solver, z, case=1)
         if feasible11_alt:
-            feasible12_alt = self.generate_nn_guard(gurobi_model, input, nn, action_ego=0)  # check for action = 0 over input (not z!)
+            feasible12_alt = self.generate_nn_guard(solver, input, nn, action_ego=0)  # check for action = 0 over input (not z!)
             if feasible12_alt:
                 # apply dynamic
-                x_prime = self.apply_dynamic2(z, gurobi_model, case=3, env_input_size=self.env_input_size)  # normal dynamic
-                found_successor, x_prime_results = self.h_repr_to_plot(gurobi_model, template, x_prime)
+                x_prime = self.apply_dynamic2(z, solver, case=3, env_input_size=self.env_input_size)  # normal dynamic
+                found_successor, x_prime_results = self.h_repr_to_plot(solver, template, x_prime)
                 if found_successor:
                     post.append(tuple(x_prime_results))
         # case 2 alt : ball going up and NO hit
-        gurobi_model, z, input = standard_op()
-        feasible21_alt = self.generate_guard(gurobi_model, z, case=2)
+        solver, z, input = standard_op()
+        feasible21_alt = self.generate_guard(solver, z, case=2)
         if feasible21_alt:
-            feasible22_alt = self.generate_nn_guard(gurobi_model, input, nn, action_ego=0)  # check for action = 0 over input (not z!)
+            feasible22_alt = self.generate_nn_guard(solver, input, nn, action_ego=0)  # check for action = 0 over input (not z!)
             if feasible22_alt:
                 # apply dynamic
-                x_prime = self.apply_dynamic2(z, gurobi_model, case=3, env_input_size=self.env_input_size)  # normal dynamic
-                found_successor, x_prime_results = self.h_repr_to_plot(gurobi_model, template, x_prime)
+                x_prime = self.apply_dynamic2(z, solver, case=3, env_input_size=self.env_input_size)  # normal dynamic
+                found_successor, x_prime_results = self.h_repr_to_plot(solver, template, x_prime)
                 if found_successor:
                     post.append(tuple(x_prime_results))
         # case 3 : ball out of reach and not bounce
-        gurobi_model, z, input = standard_op()
-        feasible3 = self.generate_guard(gurobi_model, z, case=3)  # out of reach
+        solver, z, input = standard_op()
+        feasible3 = self.generate_guard(solver, z, case=3)  # out of reach
         if feasible3:  # action is irrelevant in this case
             # apply dynamic
-            x_prime = self.apply_dynamic2(z, gurobi_model, case=3, env_input_size=self.env_input_size)  # normal dynamic
-            found_successor, x_prime_results = self.h_repr_to_plot(gurobi_model, template, x_prime)
+            x_prime = self.apply_dynamic2(z, solver, case=3, env_input_size=self.env_input_size)  # normal dynamic
+            found_successor, x_prime_results = self.h_repr_to_plot(solver, template, x_prime)
             if found_successor:
                 post.append(tuple(x_prime_results))
 
         return post
 
     @staticmethod
-    def generate_guard(gurobi_model: grb.Model, input, case=0):
+    def generate_guard(solver: solver_backend.SolverBackend, input, case=0):
         eps = 1e-6
+        p_v = input[:2]
         if case == 0:  # v <= 0 && p <= 0
-            gurobi_model.addConstr(input[1] <= 0, name=f"cond1")
-            gurobi_model.addConstr(input[0] <= 0, name=f"cond2")
+            solver.add_constraints(np.array([[0, 1], [1, 0]]), p_v, "<", 0)
         if case == 1:  # v_prime <= 0 and p_prime > 4
-            gurobi_model.addConstr(input[1] <= 0, name=f"cond1")
-            gurobi_model.addConstr(input[0] >= 4, name=f"cond2")
+            solver.add_constraints(np.array([[0, 1]]), p_v, "<", 0)
+            solver.add_constraints(np.array([[1, 0]]), p_v, ">", 4)
         if case == 2:  # v_prime > 0 and p_prime > 4
-            gurobi_model.addConstr(input[1] >= 0, name=f"cond1")
-            gurobi_model.addConstr(input[0] >= 4, name=f"cond2")
+            solver.add_constraints(np.array([[0, 1]]), p_v, ">", 0)
+            solver.add_constraints(np.array([[1, 0]]), p_v, ">", 4)
         if case == 3:  # ball out of reach and not bounce
-            gurobi_model.addConstr(input[0] <= 4 - eps, name=f"cond1")
-            gurobi_model.addConstr(input[0] >= 0 + eps, name=f"cond2")
-        gurobi_model.update()
-        gurobi_model.optimize()
-        # assert gurobi_model.status == 2, "LP wasn't optimally solved"
-        return gurobi_model.status == 2
+            solver.add_constraints(np.array([[1, 0]]), p_v, "<", 4 - eps)
+            solver.add_constraints(np.array([[1, 0]]), p_v, ">", 0 + eps)
+        return solver.optimize() == solver_backend.OPTIMAL
 
     @staticmethod
-    def apply_dynamic2(input_prime, gurobi_model: grb.Model, case, env_input_size):
-        p_prime = input_prime[0]
-        v_prime = input_prime[1]
-        z = gurobi_model.addMVar(shape=(env_input_size,), lb=float("-inf"), name=f"x_prime")
-        v_second = v_prime
-        p_second = p_prime
+    def apply_dynamic2(input_prime, solver: solver_backend.SolverBackend, case, env_input_size):
+        # rows are (p_second, v_second) as a function of (p_prime, v_prime)
+        matrix = np.eye(env_input_size)
+        offset = np.zeros(env_input_size)
         if case == 0:  # v <= 0 && p <= 0
-            v_second = -(0.90) * v_prime
-            p_second = 0
+            matrix = np.array([[0, 0], [0, -0.90]])
         if case == 1:  # v <= 0 && p >= 4 && action = 1
-            v_second = v_prime - 4
-            p_second = 4
+            matrix = np.array([[0, 0], [0, 1]])
+            offset = np.array([4, -4])
         if case == 2:  # v >=0 && p >= 4 && action = 1
-            v_second = -(0.9) * v_prime - 4
-            p_second = 4
+            matrix = np.array([[0, 0], [0, -0.9]])
+            offset = np.array([4, -4])
         if case == 3:  # p>=0
-            v_second = v_prime
-            p_second = p_prime
-
-        gurobi_model.addConstr(z[1] == v_second, name=f"dyna_constr2_1")
-        gurobi_model.addConstr(z[0] == p_second, name=f"dyna_constr2_2")
-        return z
+            pass
+        return Experiment.generate_linear_dynamic(solver, input_prime, matrix, offset)
 
     @staticmethod
-    def apply_dynamic(input, gurobi_model: grb.Model, env_input_size):
+    def apply_dynamic(input, solver: solver_backend.SolverBackend, env_input_size):
         '''
 
         :param input:
-        :param gurobi_model:
-        :param t:
+        :param solver:
         :return:
         '''
 
-        p = input[0]
-        v = input[1]
         dt = 0.1
-        z = gurobi_model.addMVar(shape=(env_input_size,), lb=float("-inf"), name=f"x_prime")
-        # pos_max = gurobi_model.addMVar(shape=(1,), lb=float("-inf"), name=f"pos_max")
-        v_second = v - 9.81 * dt
-        p_second = p + dt * v_second
-        gurobi_model.addConstr(z[1] == v_second, name=f"dyna_constr_1")
-        # gurobi_model.addConstr(pos_max == grb.max_([p_second, 0]), name=f"dyna_constr_2")
-        # gurobi_model.addConstr(z[1] == p_second, name=f"dyna_constr_2")
-        max_switch = gurobi_model.addMVar(lb=0, ub=1, shape=p_second.shape, vtype=grb.GRB.INTEGER, name=f"max_switch")
-        M = 10e6
-        # gurobi_model.addConstr(v == grb.max_(0, gurobi_vars[-1]))
-        gurobi_model.addConstr(z[0] >= p_second)
-        gurobi_model.addConstr(z[0] <= p_second + M * max_switch)
-        gurobi_model.addConstr(z[0] >= 0)
-        gurobi_model.addConstr(z[0] <= M - M * max_switch)
+        v_second = Experiment.generate_linear_dynamic(solver, input[1:2], np.array([[1]]), -9.81 * dt)
+        p_second = Experiment.generate_linear_dynamic(solver, input[:2], np.array([[1, dt]]), -9.81 * dt * dt)  # p + dt * v_second
+        p_max = Experiment.generate_relu(solver, p_second)  # max(p_second, 0)
+        z = np.concatenate([p_max, v_second])
 
         return z
 
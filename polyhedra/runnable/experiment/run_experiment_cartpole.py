@@ -7,12 +7,12 @@ from agents.ppo.tune.tune_train_PPO_cartpole import get_PPO_config
 from agents.ray_utils import convert_ray_policy_to_sequential
 from polyhedra.experiments_nn_analysis import Experiment
 import ray
-import gurobi as grb
 import math
 import numpy as np
 import torch
 from interval import interval, imath
 from environment.cartpole_ray import CartPoleEnv
+from utility import solver_backend
 
 
 class CartpoleExperiment(Experiment):
@@ -49,50 +49,37 @@ class CartpoleExperiment(Experiment):
         """milp method"""
         post = []
         for chosen_action in range(2):
-            gurobi_model = grb.Model()
-            gurobi_model.setParam('OutputFlag', output_flag)
-            gurobi_model.setParam('Threads', 2)
-            input = Experiment.generate_input_region(gurobi_model, template, x, self.env_input_size)
-            max_theta, min_theta, max_theta_dot, min_theta_dot = self.get_theta_bounds(gurobi_model, input)
+            solver = self.new_solver(output_flag, threads=2)
+            input = Experiment.generate_input_region(solver, template, x, self.env_input_size)
+            max_theta, min_theta, max_theta_dot, min_theta_dot = self.get_theta_bounds(solver, input)
             sin_cos_table = self.get_sin_cos_table(max_theta, min_theta, max_theta_dot, min_theta_dot, action=chosen_action)
-            feasible_action = CartpoleExperiment.generate_nn_guard(gurobi_model, input, nn, action_ego=chosen_action)
+            feasible_action = CartpoleExperiment.generate_nn_guard(solver, input, nn, action_ego=chosen_action)
             if feasible_action:
-                thetaacc, xacc = CartpoleExperiment.generate_angle_milp(gurobi_model, input, sin_cos_table)
+                thetaacc, xacc = CartpoleExperiment.generate_angle_milp(solver, input, sin_cos_table)
                 # apply dynamic
-                x_prime = self.apply_dynamic(input, gurobi_model, thetaacc=thetaacc, xacc=xacc, env_input_size=self.env_input_size)
-                gurobi_model.update()
-                gurobi_model.optimize()
-                found_successor, x_prime_results = self.h_repr_to_plot(gurobi_model, template, x_prime)
+                x_prime = self.apply_dynamic(input, solver, thetaacc=thetaacc, xacc=xacc, env_input_size=self.env_input_size)
+                found_successor, x_prime_results = self.h_repr_to_plot(solver, template, x_prime)
                 if found_successor:
                     post.append(tuple(x_prime_results))
         return post
 
-    def apply_dynamic(self, input, gurobi_model: grb.Model, thetaacc, xacc, env_input_size):
+    def apply_dynamic(self, input, solver: solver_backend.SolverBackend, thetaacc, xacc, env_input_size):
         '''
 
-        :param costheta: gurobi variable containing the range of costheta values
-        :param sintheta: gurobi variable containin the range of sintheta values
+        :param thetaacc: solver variable containing the range of thetaacc values
+        :param xacc: solver variable containing the range of xacc values
         :param input:
-        :param gurobi_model:
-        :param t:
+        :param solver:
         :return:
         '''
 
         tau = self.tau  # 0.001  # seconds between state updates
-        x = input[0]
-        x_dot = input[1]
-        theta = input[2]
-        theta_dot = input[3]
-        z = gurobi_model.addMVar(shape=(env_input_size,), lb=float("-inf"), name=f"x_prime")
-        x_prime = x + tau * x_dot
-        x_dot_prime = x_dot + tau * xacc
-        theta_prime = theta + tau * theta_dot
-        theta_dot_prime = theta_dot + tau * thetaacc
-        gurobi_model.addConstr(z[0] == x_prime, name=f"dyna_constr_1")
-        gurobi_model.addConstr(z[1] == x_dot_prime, name=f"dyna_constr_2")
-        gurobi_model.addConstr(z[2] == theta_prime, name=f"dyna_constr_3")
-        gurobi_model.addConstr(z[3] == theta_dot_prime, name=f"dyna_constr_4")
-        return z
+        # (x, x_dot, theta, theta_dot, xacc, thetaacc) -> (x_prime, x_dot_prime, theta_prime, theta_dot_prime)
+        matrix = np.array([[1, tau, 0, 0, 0, 0],
+                           [0, 1, 0, 0, tau, 0],
+                           [0, 0, 1, tau, 0, 0],
+                           [0, 0, 0, 1, 0, tau]])
+        return Experiment.generate_linear_dynamic(solver, np.concatenate([input[:env_input_size], xacc, thetaacc]), matrix)
 
     @staticmethod
     def get_sin_cos_table(max_theta, min_theta, max_theta_dot, min_theta_dot, action):
@@ -145,26 +132,26 @@ class CartpoleExperiment(Experiment):
         return sin_cos_table
 
     @staticmethod
-    def get_theta_bounds(gurobi_model, input):
-        gurobi_model.setObjective(input[2].sum(), grb.GRB.MAXIMIZE)
-        gurobi_model.optimize()
-        max_theta = gurobi_model.getVars()[2].X
+    def get_theta_bounds(solver: solver_backend.SolverBackend, input):
+        solver.set_objective(input[2:3], 1, solver_backend.MAXIMIZE)
+        solver.optimize()
+        max_theta = solver.objective_value
 
-        gurobi_model.setObjective(input[2].sum(), grb.GRB.MINIMIZE)
-        gurobi_model.optimize()
-        min_theta = gurobi_model.getVars()[2].X
+        solver.set_objective(input[2:3], 1, solver_backend.MINIMIZE)
+        solver.optimize()
+        min_theta = solver.objective_value
 
-        gurobi_model.setObjective(input[3].sum(), grb.GRB.MAXIMIZE)
-        gurobi_model.optimize()
-        max_theta_dot = gurobi_model.getVars()[3].X
+        solver.set_objective(input[3:4], 1, solver_backend.MAXIMIZE)
+        solver.optimize()
+        max_theta_dot = solver.objective_value
 
-        gurobi_model.setObjective(input[3].sum(), grb.GRB.MINIMIZE)
-        gurobi_model.optimize()
-        min_theta_dot = gurobi_model.getVars()[3].X
+        solver.set_objective(input[3:4], 1, solver_backend.MINIMIZE)
+        solver.optimize()
+        min_theta_dot = solver.objective_value
         return max_theta, min_theta, max_theta_dot, min_theta_dot
 
     @staticmethod
-    def generate_angle_milp(gurobi_model: grb.Model, input, sin_cos_table: List[Tuple]):
+    def generate_angle_milp(solver: solver_backend.SolverBackend, input, sin_cos_table: List[Tuple]):
         """MILP method
         input: theta, thetadot
         output: thetadotdot, xdotdot (edited)
@@ -172,50 +159,19 @@ class CartpoleExperiment(Experiment):
         sum_{i=1}^k l_{x,i} - l_{x,i}*z_i <= x <= sum_{i=1}^k u_{x,i} - u_{x,i}*z_i, for each variable x
         sum_{i=1}^k l_{theta,i} - l_{theta,i}*z_i <= theta <= sum_{i=1}^k u_{theta,i} - u_{theta,i}*z_i
         """
-        theta = input[2]
-        theta_dot = input[3]
         k = len(sin_cos_table)
-        zs = []
-        thetaacc = gurobi_model.addMVar(shape=(1,), lb=float("-inf"), name="thetaacc")
-        xacc = gurobi_model.addMVar(shape=(1,), lb=float("-inf"), name="xacc")
-        for i in range(k):
-            z = gurobi_model.addMVar(lb=0, ub=1, shape=(1,), vtype=grb.GRB.INTEGER, name=f"part_{i}")
-            zs.append(z)
-        gurobi_model.addConstr(k - 1 == sum(zs), name=f"const_milp1")
-        theta_lb = 0
-        theta_ub = 0
-        theta_dot_lb = 0
-        theta_dot_ub = 0
-        thetaacc_lb = 0
-        thetaacc_ub = 0
-        xacc_lb = 0
-        xacc_ub = 0
-        for i in range(k):
-            theta_interval, theta_dot_interval, theta_acc_interval, xacc_interval = sin_cos_table[i]
-            theta_lb += theta_interval[0].inf - theta_interval[0].inf * zs[i]
-            theta_ub += theta_interval[0].sup - theta_interval[0].sup * zs[i]
-            theta_dot_lb += theta_dot_interval[0].inf - theta_dot_interval[0].inf * zs[i]
-            theta_dot_ub += theta_dot_interval[0].sup - theta_dot_interval[0].sup * zs[i]
-
-            thetaacc_lb += theta_acc_interval[0].inf - theta_acc_interval[0].inf * zs[i]
-            thetaacc_ub += theta_acc_interval[0].sup - theta_acc_interval[0].sup * zs[i]
-
-            xacc_lb += xacc_interval[0].inf - xacc_interval[0].inf * zs[i]
-            xacc_ub += xacc_interval[0].sup - xacc_interval[0].sup * zs[i]
-
-        gurobi_model.addConstr(theta >= theta_lb, name=f"theta_guard1")
-        gurobi_model.addConstr(theta <= theta_ub, name=f"theta_guard2")
-        gurobi_model.addConstr(theta_dot >= theta_dot_lb, name=f"theta_dot_guard1")
-        gurobi_model.addConstr(theta_dot <= theta_dot_ub, name=f"theta_dot_guard2")
-
-        gurobi_model.addConstr(thetaacc >= thetaacc_lb, name=f"thetaacc_guard1")
-        gurobi_model.addConstr(thetaacc <= thetaacc_ub, name=f"thetaacc_guard2")
-        gurobi_model.addConstr(xacc >= xacc_lb, name=f"xacc_guard1")
-        gurobi_model.addConstr(xacc <= xacc_ub, name=f"xacc_guard2")
-
-        gurobi_model.update()
-        gurobi_model.optimize()
-        # assert gurobi_model.status == 2, "LP wasn't optimally solved"
+        thetaacc = solver.add_variables(1)
+        xacc = solver.add_variables(1)
+        zs = solver.add_variables(k, lb=0, ub=1, integer=True)
+        solver.add_constraints(np.ones((1, k)), zs, "=", k - 1)
+        # columns of the table are theta, theta_dot, thetaacc, xacc
+        lbs = np.array([[entry[0].inf for entry in row] for row in sin_cos_table]).reshape(k, 4)
+        ubs = np.array([[entry[0].sup for entry in row] for row in sin_cos_table]).reshape(k, 4)
+        for j, var in enumerate([input[2], input[3], thetaacc[0], xacc[0]]):
+            variables = np.concatenate([[var], zs])
+            # var >= sum_i l_i - l_i * z_i  <=>  var + sum_i l_i * z_i >= sum_i l_i
+            solver.add_constraints(np.concatenate([[1], lbs[:, j]])[None, :], variables, ">", lbs[:, j].sum())
+            solver.add_constraints(np.concatenate([[1], ubs[:, j]])[None, :], variables, "<", ubs[:, j].sum())
         return thetaacc, xacc
 
     def plot(self, vertices_list, template, template_2d):
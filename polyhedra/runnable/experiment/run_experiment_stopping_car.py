@@ -1,6 +1,5 @@
 from typing import List, Tuple
 
-import gurobi as grb
 import numpy as np
 import ray
 import torch
@@ -10,6 +9,7 @@ from agents.ppo.train_PPO_car import get_PPO_trainer
 from agents.ppo.tune.tune_train_PPO_car import get_PPO_config
 from agents.ray_utils import convert_ray_policy_to_sequential
 from polyhedra.experiments_nn_analysis import Experiment
+from utility import solver_backend
 
 
 class StoppingCarExperiment(Experiment):
@@ -49,34 +49,37 @@ class StoppingCarExperiment(Experiment):
         """milp method"""
         post = []
         for chosen_action in range(2):
-            gurobi_model = grb.Model()
-            gurobi_model.setParam('OutputFlag', output_flag)
-            input = Experiment.generate_input_region(gurobi_model, template, x, self.env_input_size)
-            observation = gurobi_model.addMVar(shape=(2,), lb=float("-inf"), ub=float("inf"), name="input")
-            gurobi_model.addConstr(observation[1] <= input[0] - input[1] + self.input_epsilon / 2, name=f"obs_constr21")
-            gurobi_model.addConstr(observation[1] >= input[0] - input[1] - self.input_epsilon / 2, name=f"obs_constr22")
-            gurobi_model.addConstr(observation[0] <= input[2] - input[3] + self.input_epsilon / 2, name=f"obs_constr11")
-            gurobi_model.addConstr(observation[0] >= input[2] - input[3] - self.input_epsilon / 2, name=f"obs_constr12")
-            feasible_action = Experiment.generate_nn_guard(gurobi_model, observation, nn, action_ego=chosen_action)
+            solver = self.new_solver(output_flag)
+            input = Experiment.generate_input_region(solver, template, x, self.env_input_size)
+            observation = StoppingCarExperiment.generate_observation(solver, input, self.input_epsilon)
+            feasible_action = Experiment.generate_nn_guard(solver, observation, nn, action_ego=chosen_action)
             # feasible_action = Experiment.generate_nn_guard(gurobi_model, input, nn, action_ego=chosen_action)
             if feasible_action:
                 # apply dynamic
-                x_prime = StoppingCarExperiment.apply_dynamic(input, gurobi_model, action=chosen_action, env_input_size=self.env_input_size)
-                gurobi_model.update()
-                gurobi_model.optimize()
-                found_successor, x_prime_results = self.h_repr_to_plot(gurobi_model, template, x_prime)
+                x_prime = StoppingCarExperiment.apply_dynamic(input, solver, action=chosen_action, env_input_size=self.env_input_size)
+                found_successor, x_prime_results = self.h_repr_to_plot(solver, template, x_prime)
                 if found_successor:
                     post.append(tuple(x_prime_results))
         return post
 
     @staticmethod
-    def apply_dynamic(input, gurobi_model: grb.Model, action, env_input_size):
+    def generate_observation(solver: solver_backend.SolverBackend, input, input_epsilon):
+        """observation[0] = v_lead - v_ego and observation[1] = x_lead - x_ego, both up to input_epsilon / 2"""
+        observation = solver.add_variables(2)
+        matrix = np.array([[1, 0, 0, 0, -1, 1],
+                           [0, 1, -1, 1, 0, 0]])
+        variables = np.concatenate([observation, input[:4]])
+        solver.add_constraints(matrix, variables, "<", input_epsilon / 2)
+        solver.add_constraints(matrix, variables, ">", -input_epsilon / 2)
+        return observation
+
+    @staticmethod
+    def apply_dynamic(input, solver: solver_backend.SolverBackend, action, env_input_size):
         '''
 
         :param input:
-        :param gurobi_model:
-        :param action_ego:
-        :param t:
+        :param solver:
+        :param action:
         :return:
 
         lead 100km/h 28m/s
@@ -85,13 +88,6 @@ class StoppingCarExperiment(Experiment):
 
         '''
 
-        x_lead = input[0]
-        x_ego = input[1]
-        v_lead = input[2]
-        v_ego = input[3]
-        a_lead = input[4]
-        a_ego = input[5]
-        z = gurobi_model.addMVar(shape=(6,), lb=float("-inf"), name=f"x_prime")
         const_acc = 3
         dt = .1  # seconds
         if action == 0:
@@ -100,20 +96,15 @@ class StoppingCarExperiment(Experiment):
             acceleration = const_acc
         else:
             acceleration = 0
-        a_ego_prime = acceleration
-        v_ego_prime = v_ego + a_ego * dt
-        v_lead_prime = v_lead + a_lead * dt
-        x_lead_prime = x_lead + v_lead_prime * dt
-        x_ego_prime = x_ego + v_ego_prime * dt
-        # delta_x_prime = (x_lead + (v_lead + (a_lead + 0) * dt) * dt) - (x_ego + (v_ego + (a_ego + acceleration) * dt) * dt)
-        # delta_v_prime = (v_lead + (a_lead + 0) * dt) - (v_ego + (a_ego + acceleration) * dt)
-        gurobi_model.addConstr(z[0] == x_lead_prime, name=f"dyna_constr_1")
-        gurobi_model.addConstr(z[1] == x_ego_prime, name=f"dyna_constr_2")
-        gurobi_model.addConstr(z[2] == v_lead_prime, name=f"dyna_constr_3")
-        gurobi_model.addConstr(z[3] == v_ego_prime, name=f"dyna_constr_4")
-        gurobi_model.addConstr(z[4] == a_lead, name=f"dyna_constr_5")  # no change in a_lead
-        gurobi_model.addConstr(z[5] == a_ego_prime, name=f"dyna_constr_6")
-        return z
+        # (x_lead, x_ego, v_lead, v_ego, a_lead, a_ego) -> the same variables one step later
+        matrix = np.array([[1, 0, dt, 0, dt * dt, 0],  # x_lead + v_lead_prime * dt
+                           [0, 1, 0, dt, 0, dt * dt],  # x_ego + v_ego_prime * dt
+                           [0, 0, 1, 0, dt, 0],  # v_lead + a_lead * dt
+                           [0, 0, 0, 1, 0, dt],  # v_ego + a_ego * dt
+                           [0, 0, 0, 0, 1, 0],  # no change in a_lead
+                           [0, 0, 0, 0, 0, 0]])
+        offset = np.array([0, 0, 0, 0, 0, acceleration])
+        return Experiment.generate_linear_dynamic(solver, input[:6], matrix, offset)
 
     def plot(self, vertices_list, template, template_2d):
         # try:
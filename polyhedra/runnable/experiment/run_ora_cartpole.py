@@ -1,4 +1,3 @@
-import gurobi as grb
 import ray
 
 from polyhedra.experiments_nn_analysis import Experiment
@@ -16,22 +15,18 @@ class ORACartpoleExperiment(CartpoleExperiment):
         """milp method"""
         post = []
         for chosen_action in range(2):
-            gurobi_model = grb.Model()
-            gurobi_model.setParam('OutputFlag', output_flag)
-            gurobi_model.setParam('Threads', 2)
-            input = Experiment.generate_input_region(gurobi_model, template, x, self.env_input_size)
-            max_theta, min_theta, max_theta_dot, min_theta_dot = self.get_theta_bounds(gurobi_model, input)
+            solver = self.new_solver(output_flag, threads=2)
+            input = Experiment.generate_input_region(solver, template, x, self.env_input_size)
+            max_theta, min_theta, max_theta_dot, min_theta_dot = self.get_theta_bounds(solver, input)
             sin_cos_table = self.get_sin_cos_table(max_theta, min_theta, max_theta_dot, min_theta_dot, action=chosen_action)
-            feasible_action = CartpoleExperiment.generate_nn_guard(gurobi_model, input, nn, action_ego=chosen_action)
+            feasible_action = CartpoleExperiment.generate_nn_guard(solver, input, nn, action_ego=chosen_action)
             if feasible_action:
-                x_prime_results = self.optimise(template, gurobi_model, input)  # h representation
-                x_prime = Experiment.generate_input_region(gurobi_model, template, x_prime_results, self.env_input_size)
-                thetaacc, xacc = CartpoleExperiment.generate_angle_milp(gurobi_model, x_prime, sin_cos_table)
+                x_prime_results = self.optimise(template, solver, input)  # h representation
+                x_prime = Experiment.generate_input_region(solver, template, x_prime_results, self.env_input_size)
+                thetaacc, xacc = CartpoleExperiment.generate_angle_milp(solver, x_prime, sin_cos_table)
                 # apply dynamic
-                x_second = self.apply_dynamic(x_prime, gurobi_model, thetaacc=thetaacc, xacc=xacc, env_input_size=self.env_input_size)
-                gurobi_model.update()
-                gurobi_model.optimize()
-                found_successor, x_prime_results = self.h_repr_to_plot(gurobi_model, template, x_second)
+                x_second = self.apply_dynamic(x_prime, solver, thetaacc=thetaacc, xacc=xacc, env_input_size=self.env_input_size)
+                found_successor, x_prime_results = self.h_repr_to_plot(solver, template, x_second)
                 if found_successor:
                     post.append(tuple(x_prime_results))
         return post
@@ -1,8 +1,8 @@
-import gurobi as grb
 import ray
 import numpy as np
 from polyhedra.experiments_nn_analysis import Experiment
 from polyhedra.runnable.experiment.run_experiment_stopping_car import StoppingCarExperiment
+from utility import solver_backend
 
 
 class ORAStoppingCarExperiment(StoppingCarExperiment):
@@ -12,14 +12,12 @@ class ORAStoppingCarExperiment(StoppingCarExperiment):
         self.before_start_fn = self.before_start
 
     def generate_nn_polyhedral_guard(self, nn, chosen_action, output_flag):
-        gurobi_model = grb.Model()
-        gurobi_model.setParam('OutputFlag', output_flag)
-        gurobi_model.setParam('Threads', 2)
-        observation = gurobi_model.addMVar(shape=(2,), lb=float("-inf"), ub=float("inf"), name="observation")
-        Experiment.generate_nn_guard(gurobi_model, observation, nn, action_ego=chosen_action)
+        solver = self.new_solver(output_flag, threads=2)
+        observation = solver.add_variables(2)
+        Experiment.generate_nn_guard(solver, observation, nn, action_ego=chosen_action)
         observable_template = Experiment.octagon(2)
         self.env_input_size = 2
-        observable_result = self.optimise(observable_template, gurobi_model, observation)
+        observable_result = self.optimise(observable_template, solver, observation)
         self.env_input_size = 6
         return observable_template, observable_result
 
@@ -40,29 +38,20 @@ class ORAStoppingCarExperiment(StoppingCarExperiment):
         for chosen_action in range(2):
             observable_template = self.observable_templates[chosen_action]
             observable_result = self.observable_results[chosen_action]
-            gurobi_model = grb.Model()
-            gurobi_model.setParam('OutputFlag', output_flag)
-            gurobi_model.setParam('Threads', 2)
-            input = Experiment.generate_input_region(gurobi_model, template, x, self.env_input_size)
-            observation = gurobi_model.addMVar(shape=(2,), lb=float("-inf"), ub=float("inf"), name="input")
-            gurobi_model.addConstr(observation[1] <= input[0] - input[1] + self.input_epsilon / 2, name=f"obs_constr21")
-            gurobi_model.addConstr(observation[1] >= input[0] - input[1] - self.input_epsilon / 2, name=f"obs_constr22")
-            gurobi_model.addConstr(observation[0] <= input[2] - input[3] + self.input_epsilon / 2, name=f"obs_constr11")
-            gurobi_model.addConstr(observation[0] >= input[2] - input[3] - self.input_epsilon / 2, name=f"obs_constr12")
+            solver = self.new_solver(output_flag, threads=2)
+            input = Experiment.generate_input_region(solver, template, x, self.env_input_size)
+            observation = StoppingCarExperiment.generate_observation(solver, input, self.input_epsilon)
             # feasible_action = Experiment.generate_nn_guard(gurobi_model, observation, nn, action_ego=chosen_action)
             # feasible_action = Experiment.generate_nn_guard(gurobi_model, input, nn, action_ego=chosen_action)
 
-            Experiment.generate_region_constraints(gurobi_model, observable_template, observation, observable_result, 2)
-            gurobi_model.optimize()
-            feasible_action = gurobi_model.status
+            Experiment.generate_region_constraints(solver, observable_template, observation, observable_result, 2)
+            feasible_action = solver.optimize() == solver_backend.OPTIMAL
             if feasible_action:
                 # apply dynamic
                 # x_prime_results = self.optimise(template, gurobi_model, input)  # h representation
                 # x_prime = Experiment.generate_input_region(gurobi_model, template, x_prime_results, self.env_input_size)
-                x_second = StoppingCarExperiment.apply_dynamic(input, gurobi_model, action=chosen_action, env_input_size=self.env_input_size)
-                gurobi_model.update()
-                gurobi_model.optimize()
-                found_successor, x_second_results = self.h_repr_to_plot(gurobi_model, template, x_second)
+                x_second = StoppingCarExperiment.apply_dynamic(input, solver, action=chosen_action, env_input_size=self.env_input_size)
+                found_successor, x_second_results = self.h_repr_to_plot(solver, template, x_second)
                 if found_successor:
                     post.append(tuple(x_second_results))
         return post
@@ -1,6 +1,5 @@
 from collections import defaultdict
 
-import gurobi as grb
 import numpy as np
 import pypoman
 import ray
@@ -8,139 +7,84 @@ import torch
 
 from agents.ppo.train_PPO_bouncingball import get_PPO_trainer
 from agents.ray_utils import convert_ray_policy_to_sequential
+from polyhedra.experiments_nn_analysis import Experiment
 from polyhedra.plot_utils import show_polygon_list2
+from utility import solver_backend
 
 env_input_size = 2
+lp_backend = None  # solver used by the MILP encodings, see utility.solver_backend
 
 
-def generate_input_region(gurobi_model, templates, boundaries):
-    input = gurobi_model.addMVar(shape=env_input_size, lb=float("-inf"), name="input")
-    for j, template in enumerate(templates):
-        gurobi_model.update()
-        multiplication = 0
-        for i in range(env_input_size):
-            multiplication += template[i] * input[i]
-        gurobi_model.addConstr(multiplication <= boundaries[j], name=f"input_constr_{j}")
-    return input
+def new_solver(output_flag=False):
+    return solver_backend.get_backend(lp_backend, output_flag=output_flag)
 
-def generate_guard(gurobi_model: grb.Model, input, case=0):
+
+def generate_input_region(solver, templates, boundaries):
+    return Experiment.generate_input_region(solver, templates, boundaries, env_input_size)
+
+
+def generate_guard(solver: solver_backend.SolverBackend, input, case=0):
     eps = 1e-6
+    p_v = input[:2]
     if case == 0:  # v <= 0 && p <= 0
-        gurobi_model.addConstr(input[1] <= 0, name=f"cond1")
-        gurobi_model.addConstr(input[0] <= 0, name=f"cond2")
+        solver.add_constraints(np.array([[0, 1], [1, 0]]), p_v, "<", 0)
     if case == 1:  # v_prime <= 0 and p_prime > 4
-        gurobi_model.addConstr(input[1] <= 0, name=f"cond1")
-        gurobi_model.addConstr(input[0] >= 4, name=f"cond2")
+        solver.add_constraints(np.array([[0, 1]]), p_v, "<", 0)
+        solver.add_constraints(np.array([[1, 0]]), p_v, ">", 4)
     if case == 2:  # v_prime > 0 and p_prime > 4
-        gurobi_model.addConstr(input[1] >= 0, name=f"cond1")
-        gurobi_model.addConstr(input[0] >= 4, name=f"cond2")
+        solver.add_constraints(np.array([[0, 1]]), p_v, ">", 0)
+        solver.add_constraints(np.array([[1, 0]]), p_v, ">", 4)
     if case == 3:  # ball out of reach and not bounce
-        gurobi_model.addConstr(input[0] <= 4 - eps, name=f"cond1")
-        gurobi_model.addConstr(input[0] >= 0 + eps, name=f"cond2")
-    gurobi_model.update()
-    gurobi_model.optimize()
-    # assert gurobi_model.status == 2, "LP wasn't optimally solved"
-    return gurobi_model.status == 2
-
-
-def generate_nn_guard(gurobi_model: grb.Model, input, nn: torch.nn.Sequential, action_ego=0):
-    gurobi_vars = []
-    gurobi_vars.append(input)
-    for i, layer in enumerate(nn):
-
-        # print(layer)
-        if type(layer) is torch.nn.Linear:
-            v = gurobi_model.addMVar(lb=float("-inf"), shape=(layer.out_features), name=f"layer_{i}")
-            lin_expr = layer.weight.data.numpy() @ gurobi_vars[-1]
-            if layer.bias is not None:
-                lin_expr = lin_expr + layer.bias.data.numpy()
-            gurobi_model.addConstr(v == lin_expr, name=f"linear_constr_{i}")
-            gurobi_vars.append(v)
-        elif type(layer) is torch.nn.ReLU:
-            v = gurobi_model.addMVar(lb=float("-inf"), shape=gurobi_vars[-1].shape, name=f"layer_{i}")  # same shape as previous
-            z = gurobi_model.addMVar(lb=0, ub=1, shape=gurobi_vars[-1].shape, vtype=grb.GRB.INTEGER, name=f"relu_{i}")
-            M = 10e6
-            # gurobi_model.addConstr(v == grb.max_(0, gurobi_vars[-1]))
-            gurobi_model.addConstr(v >= gurobi_vars[-1], name=f"relu_constr_1_{i}")
-            gurobi_model.addConstr(v <= gurobi_vars[-1] + M * z, name=f"relu_constr_2_{i}")
-            gurobi_model.addConstr(v >= 0, name=f"relu_constr_3_{i}")
-            gurobi_model.addConstr(v <= M - M * z, name=f"relu_constr_4_{i}")
-            gurobi_vars.append(v)
-    last_layer = gurobi_vars[-1]
-    if action_ego == 0:
-        gurobi_model.addConstr(last_layer[0] >= last_layer[1], name="last_layer")
-    else:
-        gurobi_model.addConstr(last_layer[1] >= last_layer[0], name="last_layer")
-    gurobi_model.update()
-    gurobi_model.optimize()
-    # assert gurobi_model.status == 2, "LP wasn't optimally solved"
-    return gurobi_model.status == 2
-
-
-def apply_dynamic(input, gurobi_model: grb.Model):
+        solver.add_constraints(np.array([[1, 0]]), p_v, "<", 4 - eps)
+        solver.add_constraints(np.array([[1, 0]]), p_v, ">", 0 + eps)
+    return solver.optimize() == solver_backend.OPTIMAL
+
+
+def generate_nn_guard(solver: solver_backend.SolverBackend, input, nn: torch.nn.Sequential, action_ego=0):
+    return Experiment.generate_nn_guard(solver, input, nn, action_ego=action_ego)
+
+
+def apply_dynamic(input, solver: solver_backend.SolverBackend):
     '''
 
     :param input:
-    :param gurobi_model:
-    :param t:
+    :param solver:
     :return:
     '''
 
-    p = input[0]
-    v = input[1]
     dt = 0.1
-    z = gurobi_model.addMVar(shape=(env_input_size,), lb=float("-inf"), name=f"x_prime")
-    # pos_max = gurobi_model.addMVar(shape=(1,), lb=float("-inf"), name=f"pos_max")
-    v_second = v - 9.81 * dt
-    p_second = p + dt * v_second
-    gurobi_model.addConstr(z[1] == v_second, name=f"dyna_constr_1")
-    # gurobi_model.addConstr(pos_max == grb.max_([p_second, 0]), name=f"dyna_constr_2")
-    # gurobi_model.addConstr(z[1] == p_second, name=f"dyna_constr_2")
-    max_switch = gurobi_model.addMVar(lb=0, ub=1, shape=p_second.shape, vtype=grb.GRB.INTEGER, name=f"max_switch")
-    M = 10e6
-    # gurobi_model.addConstr(v == grb.max_(0, gurobi_vars[-1]))
-    gurobi_model.addConstr(z[0] >= p_second)
-    gurobi_model.addConstr(z[0] <= p_second + M * max_switch)
-    gurobi_model.addConstr(z[0] >= 0)
-    gurobi_model.addConstr(z[0] <= M - M * max_switch)
+    v_second = Experiment.generate_linear_dynamic(solver, input[1:2], np.array([[1]]), -9.81 * dt)
+    p_second = Experiment.generate_linear_dynamic(solver, input[:2], np.array([[1, dt]]), -9.81 * dt * dt)  # p + dt * v_second
+    p_max = Experiment.generate_relu(solver, p_second)  # max(p_second, 0)
+    z = np.concatenate([p_max, v_second])
 
     return z
 
 
-def apply_dynamic2(input_prime, gurobi_model: grb.Model, case):
-    p_prime = input_prime[0]
-    v_prime = input_prime[1]
-    z = gurobi_model.addMVar(shape=(env_input_size,), lb=float("-inf"), name=f"x_prime")
-    v_second = v_prime
-    p_second = p_prime
+def apply_dynamic2(input_prime, solver: solver_backend.SolverBackend, case):
+    # rows are (p_second, v_second) as a function of (p_prime, v_prime)
+    matrix = np.eye(env_input_size)
+    offset = np.zeros(env_input_size)
     if case == 0:  # v <= 0 && p <= 0
-        v_second = -(0.90) * v_prime
-        p_second = 0
+        matrix = np.array([[0, 0], [0, -0.90]])
     if case == 1:  # v <= 0 && p >= 4 && action = 1
-        v_second = v_prime - 4
-        p_second = 4
+        matrix = np.array([[0, 0], [0, 1]])
+        offset = np.array([4, -4])
     if case == 2:  # v >=0 && p >= 4 && action = 1
-        v_second = -(0.9) * v_prime - 4
-        p_second = 4
+        matrix = np.array([[0, 0], [0, -0.9]])
+        offset = np.array([4, -4])
     if case == 3:  # p>=0
-        v_second = v_prime
-        p_second = p_prime
-
-    gurobi_model.addConstr(z[1] == v_second, name=f"dyna_constr2_1")
-    gurobi_model.addConstr(z[0] == p_second, name=f"dyna_constr2_2")
-    return z
+        pass
+    return Experiment.generate_linear_dynamic(solver, input_prime, matrix, offset)
 
 
-def optimise(templates, gurobi_model: grb.Model, x_prime):
+def optimise(templates, solver: solver_backend.SolverBackend, x_prime):
     results = []
     for template in templates:
-        gurobi_model.update()
-        gurobi_model.setObjective(sum((template[i] * x_prime[i]) for i in range(env_input_size)), grb.GRB.MAXIMIZE)
-        gurobi_model.optimize()
-        # print_model(gurobi_model)
-        if gurobi_model.status != 2:
+        solver.set_objective(x_prime[:env_input_size], np.asarray(template, dtype=float)[:env_input_size], solver_backend.MAXIMIZE)
+        if solver.optimize() != solver_backend.OPTIMAL:
             return None
-        result = gurobi_model.ObjVal
+        result = solver.objective_value
         results.append(result)
     print(results)
     return np.array(results)
@@ -165,8 +109,7 @@ def main():
     for l in sequential_nn:
         layers.append(l)
     nn = torch.nn.Sequential(*layers)
-    gurobi_model = grb.Model()
-    gurobi_model.setParam('OutputFlag', output_flag)
+    solver = new_solver(output_flag)
     input_boundaries, template = get_template(0)
 
     start1 = np.array([9, -8, 0, 0.1])
@@ -224,73 +167,72 @@ def post(x, nn, output_flag, t, template):
     post = []
 
     def standard_op():
-        gurobi_model = grb.Model()
-        gurobi_model.setParam('OutputFlag', output_flag)
-        input = generate_input_region(gurobi_model, template, x)
-        z = apply_dynamic(input, gurobi_model)
-        return gurobi_model, z, input
+        solver = new_solver(output_flag)
+        input = generate_input_region(solver, template, x)
+        z = apply_dynamic(input, solver)
+        return solver, z, input
 
     # case 0
-    gurobi_model, z, input = standard_op()
-    feasible0 = generate_guard(gurobi_model, z, case=0)  # bounce
+    solver, z, input = standard_op()
+    feasible0 = generate_guard(solver, z, case=0)  # bounce
     if feasible0:  # action is irrelevant in this case
         # apply dynamic
-        x_prime = apply_dynamic2(z, gurobi_model, case=0)
-        found_successor, x_prime_results = h_repr_to_plot(gurobi_model, template, x_prime)
+        x_prime = apply_dynamic2(z, solver, case=0)
+        found_successor, x_prime_results = h_repr_to_plot(solver, template, x_prime)
         if found_successor:
             post.append(tuple(x_prime_results))
 
     # case 1 : ball going down and hit
-    gurobi_model, z, input = standard_op()
-    feasible11 = generate_guard(gurobi_model, z, case=1)
+    solver, z, input = standard_op()
+    feasible11 = generate_guard(solver, z, case=1)
     if feasible11:
-        feasible12 = generate_nn_guard(gurobi_model, input, nn, action_ego=1)  # check for action =1 over input (not z!)
+        feasible12 = generate_nn_guard(solver, input, nn, action_ego=1)  # check for action =1 over input (not z!)
         if feasible12:
             # apply dynamic
-            x_prime = apply_dynamic2(z, gurobi_model, case=1)
-            found_successor, x_prime_results = h_repr_to_plot(gurobi_model, template, x_prime)
+            x_prime = apply_dynamic2(z, solver, case=1)
+            found_successor, x_prime_results = h_repr_to_plot(solver, template, x_prime)
             if found_successor:
                 post.append(tuple(x_prime_results))
     # case 2 : ball going up and hit
-    gurobi_model, z, input = standard_op()
-    feasible21 = generate_guard(gurobi_model, z, case=2)
+    solver, z, input = standard_op()
+    feasible21 = generate_guard(solver, z, case=2)
     if feasible21:
-        feasible22 = generate_nn_guard(gurobi_model, input, nn, action_ego=1)  # check for action =1 over input (not z!)
+        feasible22 = generate_nn_guard(solver, input, nn, action_ego=1)  # check for action =1 over input (not z!)
         if feasible22:
             # apply dynamic
-            x_prime = apply_dynamic2(z, gurobi_model, case=2)
-            found_successor, x_prime_results = h_repr_to_plot(gurobi_model, template, x_prime)
+            x_prime = apply_dynamic2(z, solver, case=2)
+            found_successor, x_prime_results = h_repr_to_plot(solver, template, x_prime)
             if found_successor:
                 post.append(tuple(x_prime_results))
     # case 1 alt : ball going down and NO hit
-    gurobi_model, z, input = standard_op()
-    feasible11_alt = generate_guard(gurobi_model, z, case=1)
+    solver, z, input = standard_op()
+    feasible11_alt = generate_guard(solver, z, case=1)
     if feasible11_alt:
-        feasible12_alt = generate_nn_guard(gurobi_model, input, nn, action_ego=0)  # check for action = 0 over input (not z!)
+        feasible12_alt = generate_nn_guard(solver, input, nn, action_ego=0)  # check for action = 0 over input (not z!)
         if feasible12_alt:
             # apply dynamic
-            x_prime = apply_dynamic2(z, gurobi_model, case=3)  # normal dynamic
-            found_successor, x_prime_results = h_repr_to_plot(gurobi_model, template, x_prime)
+            x_prime = apply_dynamic2(z, solver, case=3)  # normal dynamic
+            found_successor, x_prime_results = h_repr_to_plot(solver, template, x_prime)
             if found_successor:
                 post.append(tuple(x_prime_results))
     # case 2 alt : ball going up and NO hit
-    gurobi_model, z, input = standard_op()
-    feasible21_alt = generate_guard(gurobi_model, z, case=2)
+    solver, z, input = standard_op()
+    feasible21_alt = generate_guard(solver, z, case=2)
     if feasible21_alt:
-        feasible22_alt = generate_nn_guard(gurobi_model, input, nn, action_ego=0)  # check for action = 0 over input (not z!)
+        feasible22_alt = generate_nn_guard(solver, input, nn, action_ego=0)  # check for action = 0 over input (not z!)
         if feasible22_alt:
             # apply dynamic
-            x_prime = apply_dynamic2(z, gurobi_model, case=3)  # normal dynamic
-            found_successor, x_prime_results = h_repr_to_plot(gurobi_model, template, x_prime)
+            x_prime = apply_dynamic2(z, solver, case=3)  # normal dynamic
+            found_successor, x_prime_results = h_repr_to_plot(solver, template, x_prime)
             if found_successor:
                 post.append(tuple(x_prime_results))
     # case 3 : ball out of reach and not bounce
-    gurobi_model, z, input = standard_op()
-    feasible3 = generate_guard(gurobi_model, z, case=3)  # out of reach
+    solver, z, input = standard_op()
+    feasible3 = generate_guard(solver, z, case=3)  # out of reach
     if feasible3:  # action is irrelevant in this case
         # apply dynamic
-        x_prime = apply_dynamic2(z, gurobi_model, case=3)  # normal dynamic
-        found_successor, x_prime_results = h_repr_to_plot(gurobi_model, template, x_prime)
+        x_prime = apply_dynamic2(z, solver, case=3)  # normal dynamic
+        found_successor, x_prime_results = h_repr_to_plot(solver, template, x_prime)
         if found_successor:
             post.append(tuple(x_prime_results))
 
@@ -329,8 +271,8 @@ def e(n, i):
     return np.array(result)
 
 
-def h_repr_to_plot(gurobi_model, template, x_prime):
-    x_prime_results = optimise(template, gurobi_model, x_prime)  # h representation
+def h_repr_to_plot(solver, template, x_prime):
+    x_prime_results = optimise(template, solver, x_prime)  # h representation
     return x_prime_results is not None, x_prime_results
 
 
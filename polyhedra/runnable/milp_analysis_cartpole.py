@@ -3,7 +3,6 @@ import time
 from collections import defaultdict
 from typing import Tuple, List
 
-import gurobi as grb
 import numpy as np
 import progressbar
 import ray
@@ -13,107 +12,53 @@ from interval import interval, imath
 from agents.ppo.train_PPO_cartpole import get_PPO_trainer
 from agents.ray_utils import convert_ray_policy_to_sequential
 from environment.cartpole_ray import CartPoleEnv
+from polyhedra.experiments_nn_analysis import Experiment
 from polyhedra.plot_utils import show_polygon_list3
+from utility import solver_backend
 
 env_input_size = 4
+lp_backend = None  # solver used by the MILP encodings, see utility.solver_backend
 
 
-def generate_input_region(gurobi_model, templates, boundaries):
-    input = gurobi_model.addMVar(shape=env_input_size, lb=float("-inf"), ub=float("inf"), name="input")
-    generate_region_constraints(gurobi_model, templates, input, boundaries)
-    return input
-
-
-def generate_region_constraints(gurobi_model, templates, input, boundaries):
-    for j, template in enumerate(templates):
-        gurobi_model.update()
-        multiplication = 0
-        for i in range(env_input_size):
-            multiplication += template[i] * input[i]
-        gurobi_model.addConstr(multiplication <= boundaries[j], name=f"input_constr_{j}")
-
-
-def generate_nn_guard(gurobi_model: grb.Model, input, nn: torch.nn.Sequential, action_ego=0):
-    gurobi_vars = []
-    gurobi_vars.append(input)
-    for i, layer in enumerate(nn):
-
-        # print(layer)
-        if type(layer) is torch.nn.Linear:
-            v = gurobi_model.addMVar(lb=float("-inf"), shape=(layer.out_features), name=f"layer_{i}")
-            lin_expr = layer.weight.data.numpy() @ gurobi_vars[-1]
-            if layer.bias is not None:
-                lin_expr = lin_expr + layer.bias.data.numpy()
-            gurobi_model.addConstr(v == lin_expr, name=f"linear_constr_{i}")
-            gurobi_vars.append(v)
-        elif type(layer) is torch.nn.ReLU:
-            v = gurobi_model.addMVar(lb=float("-inf"), shape=gurobi_vars[-1].shape, name=f"layer_{i}")  # same shape as previous
-            z = gurobi_model.addMVar(lb=0, ub=1, shape=gurobi_vars[-1].shape, vtype=grb.GRB.INTEGER, name=f"relu_{i}")
-            M = 10e6
-            # gurobi_model.addConstr(v == grb.max_(0, gurobi_vars[-1]))
-            gurobi_model.addConstr(v >= gurobi_vars[-1], name=f"relu_constr_1_{i}")
-            gurobi_model.addConstr(v <= gurobi_vars[-1] + M * z, name=f"relu_constr_2_{i}")
-            gurobi_model.addConstr(v >= 0, name=f"relu_constr_3_{i}")
-            gurobi_model.addConstr(v <= M - M * z, name=f"relu_constr_4_{i}")
-            gurobi_vars.append(v)
-            # gurobi_model.update()
-            # gurobi_model.optimize()
-            # assert gurobi_model.status == 2, "LP wasn't optimally solved"
-            """
-            y = Relu(x)
-            0 <= z <= 1, z is integer
-            y >= x
-            y <= x + Mz
-            y >= 0
-            y <= M - Mz"""
-    # gurobi_model.update()
-    # gurobi_model.optimize()
-    # assert gurobi_model.status == 2, "LP wasn't optimally solved"
-    # gurobi_model.setObjective(v[action_ego].sum(), grb.GRB.MAXIMIZE)  # maximise the output
-    last_layer = gurobi_vars[-1]
-    if action_ego == 0:
-        gurobi_model.addConstr(last_layer[0] >= last_layer[1], name="last_layer")
-    else:
-        gurobi_model.addConstr(last_layer[1] >= last_layer[0], name="last_layer")
-    gurobi_model.update()
-    gurobi_model.optimize()
-    # assert gurobi_model.status == 2, "LP wasn't optimally solved"
-    return gurobi_model.status == 2
+def new_solver(output_flag=False, threads=1):
+    return solver_backend.get_backend(lp_backend, output_flag=output_flag, threads=threads)
+
+
+def generate_input_region(solver, templates, boundaries):
+    return Experiment.generate_input_region(solver, templates, boundaries, env_input_size)
+
+
+def generate_region_constraints(solver, templates, input, boundaries):
+    return Experiment.generate_region_constraints(solver, templates, input, boundaries, env_input_size)
 
 
-def apply_dynamic(input, gurobi_model: grb.Model, action_ego, thetaacc, xacc, case=0):
+def generate_nn_guard(solver: solver_backend.SolverBackend, input, nn: torch.nn.Sequential, action_ego=0):
+    return Experiment.generate_nn_guard(solver, input, nn, action_ego=action_ego)
+
+
+def apply_dynamic(input, solver: solver_backend.SolverBackend, action_ego, thetaacc, xacc, case=0):
     '''
 
-    :param costheta: gurobi variable containing the range of costheta values
-    :param sintheta: gurobi variable containin the range of sintheta values
+    :param thetaacc: solver variable containing the range of thetaacc values
+    :param xacc: solver variable containing the range of xacc values
     :param input:
-    :param gurobi_model:
+    :param solver:
     :param action_ego:
-    :param t:
     :return:
     '''
 
     tau = 0.001  # seconds between state updates
-    x = input[0]
-    x_dot = input[1]
-    theta = input[2]
-    theta_dot = input[3]
-    z = gurobi_model.addMVar(shape=(env_input_size,), lb=float("-inf"), name=f"x_prime")
-    x_prime = x + tau * x_dot
-    x_dot_prime = x_dot + tau * xacc
-    theta_prime = theta + tau * theta_dot
-    theta_dot_prime = theta_dot + tau * thetaacc
-    gurobi_model.addConstr(z[0] == x_prime, name=f"dyna_constr_1")
-    gurobi_model.addConstr(z[1] == x_dot_prime, name=f"dyna_constr_2")
-    gurobi_model.addConstr(z[2] == theta_prime, name=f"dyna_constr_3")
-    gurobi_model.addConstr(z[3] == theta_dot_prime, name=f"dyna_constr_4")
-    return z
-
-
-def create_temp_var(gurobi_model, expression: grb.MLinExpr, name):
-    temp_var = gurobi_model.addMVar(shape=(1,), lb=float("-inf"), name=f"{name}")
-    gurobi_model.addConstr(temp_var == expression, name=f"{name}_constr_1")
-    return temp_var
+    # (x, x_dot, theta, theta_dot, xacc, thetaacc) -> (x_prime, x_dot_prime, theta_prime, theta_dot_prime)
+    matrix = np.array([[1, tau, 0, 0, 0, 0],
+                       [0, 1, 0, 0, tau, 0],
+                       [0, 0, 1, tau, 0, 0],
+                       [0, 0, 0, 1, 0, tau]])
+    return Experiment.generate_linear_dynamic(solver, np.concatenate([input[:env_input_size], xacc, thetaacc]), matrix)
+
+
+def create_temp_var(solver: solver_backend.SolverBackend, variables, coefficients, offset=0):
+    """:return: a new variable equal to coefficients @ variables + offset"""
+    return Experiment.generate_linear_dynamic(solver, variables, np.array([coefficients]), offset)
 
 
 def get_sin_cos_table(max_theta, min_theta, max_theta_dot, min_theta_dot, action):
@@ -171,30 +116,24 @@ def get_sin_cos_table(max_theta, min_theta, max_theta_dot, min_theta_dot, action
     return sin_cos_table
 
 
-def optimise(templates, gurobi_model: grb.Model, x_prime):
+def optimise(templates, solver: solver_backend.SolverBackend, x_prime):
     results = []
     for template in templates:
-        gurobi_model.update()
-        gurobi_model.setObjective(sum((template[i] * x_prime[i]) for i in range(env_input_size)), grb.GRB.MAXIMIZE)
-        gurobi_model.optimize()
-        # print_model(gurobi_model)
-        if gurobi_model.status != 2:
+        solver.set_objective(x_prime[:env_input_size], np.asarray(template, dtype=float)[:env_input_size], solver_backend.MAXIMIZE)
+        if solver.optimize() != solver_backend.OPTIMAL:
             return None
-        result = gurobi_model.ObjVal
+        result = solver.objective_value
         results.append(result)
     return np.array(results)
 
 
 def check_unsafe(template, bnds, unsafe_zone):
     for A, b in unsafe_zone:
-        gurobi_model = grb.Model()
-        gurobi_model.setParam('OutputFlag', False)
-        input = gurobi_model.addMVar(shape=(env_input_size,), lb=float("-inf"), name="input")
-        generate_region_constraints(gurobi_model, template, input, bnds)
-        generate_region_constraints(gurobi_model, A, input, b)
-        gurobi_model.update()
-        gurobi_model.optimize()
-        if gurobi_model.status == 2:
+        solver = new_solver()
+        input = solver.add_variables(env_input_size)
+        generate_region_constraints(solver, template, input, bnds)
+        generate_region_constraints(solver, A, input, b)
+        if solver.optimize() == solver_backend.OPTIMAL:
             return True
     return False
 
@@ -222,13 +161,12 @@ def main():
     nn = torch.nn.Sequential(*layers)
     template_2d = np.array([[0, 0, 1, 0], [0, 0, 0, 1]])
     output_flag = False
-    gurobi_model = grb.Model()
-    gurobi_model.setParam('OutputFlag', output_flag)
+    solver = new_solver(output_flag)
     input_boundaries, template = get_template(0)
 
-    input = generate_input_region(gurobi_model, template, input_boundaries)
+    input = generate_input_region(solver, template, input_boundaries)
     _, template = get_template(1)
-    x_results = optimise(template, gurobi_model, input)
+    x_results = optimise(template, solver, input)
     if x_results is None:
         print("Model unsatisfiable")
         return
@@ -308,19 +246,14 @@ def contained(x: tuple, y: tuple):
 
 
 
-def generate_angle_guard(gurobi_model: grb.Model, input, theta_interval, theta_dot_interval):
+def generate_angle_guard(solver: solver_backend.SolverBackend, input, theta_interval, theta_dot_interval):
     eps = 1e-6
-    gurobi_model.addConstr(input[2] >= theta_interval[0].inf, name=f"theta_guard1")
-    gurobi_model.addConstr(input[2] <= theta_interval[0].sup, name=f"theta_guard2")
-    gurobi_model.addConstr(input[3] >= theta_dot_interval[0].inf, name=f"theta_dot_guard1")
-    gurobi_model.addConstr(input[3] <= theta_dot_interval[0].sup, name=f"theta_dot_guard2")
-    gurobi_model.update()
-    gurobi_model.optimize()
-    # assert gurobi_model.status == 2, "LP wasn't optimally solved"
-    return gurobi_model.status == 2
+    solver.add_constraints(np.eye(2), input[2:4], ">", [theta_interval[0].inf, theta_dot_interval[0].inf])
+    solver.add_constraints(np.eye(2), input[2:4], "<", [theta_interval[0].sup, theta_dot_interval[0].sup])
+    return solver.optimize() == solver_backend.OPTIMAL
 
 
-def generate_angle_milp(gurobi_model: grb.Model, input, sin_cos_table: List[Tuple]):
+def generate_angle_milp(solver: solver_backend.SolverBackend, input, sin_cos_table: List[Tuple]):
     """MILP method
     input: theta, thetadot
     output: thetadotdot, xdotdot (edited)
@@ -328,53 +261,28 @@ def generate_angle_milp(gurobi_model: grb.Model, input, sin_cos_table: List[Tupl
     sum_{i=1}^k l_{x,i} - l_{x,i}*z_i <= x <= sum_{i=1}^k u_{x,i} - u_{x,i}*z_i, per ogni variabile x
     sum_{i=1}^k l_{theta,i} - l_{theta,i}*z_i <= theta <= sum_{i=1}^k u_{theta,i} - u_{theta,i}*z_i
     """
-    theta = input[2]
-    theta_dot = input[3]
     k = len(sin_cos_table)
-    zs = []
-    thetaacc = gurobi_model.addMVar(shape=(1,), lb=float("-inf"), name="thetaacc")
-    xacc = gurobi_model.addMVar(shape=(1,), lb=float("-inf"), name="xacc")
-    for i in range(k):
-        z = gurobi_model.addMVar(lb=0, ub=1, shape=(1,), vtype=grb.GRB.INTEGER, name=f"part_{i}")
-        zs.append(z)
-    gurobi_model.addConstr(k - 1 == sum(zs), name=f"const_milp1")
-    theta_lb = 0
-    theta_ub = 0
-    theta_dot_lb = 0
-    theta_dot_ub = 0
-    thetaacc_lb = 0
-    thetaacc_ub = 0
-    xacc_lb = 0
-    xacc_ub = 0
-    for i in range(k):
-        theta_interval, theta_dot_interval, theta_acc_interval, xacc_interval = sin_cos_table[i]
-        theta_lb += theta_interval[0].inf - theta_interval[0].inf * zs[i]
-        theta_ub += theta_interval[0].sup - theta_interval[0].sup * zs[i]
-        theta_dot_lb += theta_dot_interval[0].inf - theta_dot_interval[0].inf * zs[i]
-        theta_dot_ub += theta_dot_interval[0].sup - theta_dot_interval[0].sup * zs[i]
-
-        thetaacc_lb += theta_acc_interval[0].inf - theta_acc_interval[0].inf * zs[i]
-        thetaacc_ub += theta_acc_interval[0].sup - theta_acc_interval[0].sup * zs[i]
-
-        xacc_lb += xacc_interval[0].inf - xacc_interval[0].inf * zs[i]
-        xacc_ub += xacc_interval[0].sup - xacc_interval[0].sup * zs[i]
-
-    gurobi_model.addConstr(theta >= theta_lb, name=f"theta_guard1")
-    gurobi_model.addConstr(theta <= theta_ub, name=f"theta_guard2")
-    gurobi_model.addConstr(theta_dot >= theta_dot_lb, name=f"theta_dot_guard1")
-    gurobi_model.addConstr(theta_dot <= theta_dot_ub, name=f"theta_dot_guard2")
-
-    gurobi_model.addConstr(thetaacc >= thetaacc_lb, name=f"thetaacc_guard1")
-    gurobi_model.addConstr(thetaacc <= thetaacc_ub, name=f"thetaacc_guard2")
-    gurobi_model.addConstr(xacc >= xacc_lb, name=f"xacc_guard1")
-    gurobi_model.addConstr(xacc <= xacc_ub, name=f"xacc_guard2")
-
-    gurobi_model.update()
-    gurobi_model.optimize()
-    # assert gurobi_model.status == 2, "LP wasn't optimally solved"
+    thetaacc = solver.add_variables(1)
+    xacc = solver.add_variables(1)
+    zs = solver.add_variables(k, lb=0, ub=1, integer=True)
+    solver.add_constraints(np.ones((1, k)), zs, "=", k - 1)
+    # columns of the table are theta, theta_dot, thetaacc, xacc
+    lbs = np.array([[entry[0].inf for entry in row] for row in sin_cos_table]).reshape(k, 4)
+    ubs = np.array([[entry[0].sup for entry in row] for row in sin_cos_table]).reshape(k, 4)
+    for j, var in enumerate([input[2], input[3], thetaacc[0], xacc[0]]):
+        variables = np.concatenate([[var], zs])
+        # var >= sum_i l_i - l_i * z_i  <=>  var + sum_i l_i * z_i >= sum_i l_i
+        solver.add_constraints(np.concatenate([[1], lbs[:, j]])[None, :], variables, ">", lbs[:, j].sum())
+        solver.add_constraints(np.concatenate([[1], ubs[:, j]])[None, :], variables, "<", ubs[:, j].sum())
     return thetaacc, xacc
 
 
+def generate_angle_limits(solver: solver_backend.SolverBackend, x):
+    """-2 <= theta_dot <= 2 and -pi/2 <= theta <= pi/2"""
+    solver.add_constraints(np.eye(2), x[2:4], "<", [math.pi / 2, 2])
+    solver.add_constraints(np.eye(2), x[2:4], ">", [-math.pi / 2, -2])
+
+
 #
 # def post(x, nn, output_flag, t, template):
 #     post = []
@@ -410,59 +318,38 @@ def post_milp(x, nn, output_flag, t, template):
     chosen_action = 0
     case = 0  # positive
 
-    gurobi_model = grb.Model()
-    gurobi_model.setParam('OutputFlag', output_flag)
-    gurobi_model.setParam('Threads', 2)
-    input = generate_input_region(gurobi_model, template, x)
-    gurobi_model.addConstr(input[3] <= 2)
-    gurobi_model.addConstr(input[3] >= -2)
-    gurobi_model.addConstr(input[2] >= -math.pi / 2)
-    gurobi_model.addConstr(input[2] <= math.pi / 2)
-    max_theta, min_theta, max_theta_dot, min_theta_dot = get_theta_bounds(gurobi_model, input)
+    solver = new_solver(output_flag, threads=2)
+    input = generate_input_region(solver, template, x)
+    generate_angle_limits(solver, input)
+    max_theta, min_theta, max_theta_dot, min_theta_dot = get_theta_bounds(solver, input)
     sin_cos_table = get_sin_cos_table(max_theta, min_theta, max_theta_dot, min_theta_dot, action=chosen_action)
     # gurobi_model.addConstr(input[2] >= 0)  # positive case
-    feasible_action = generate_nn_guard(gurobi_model, input, nn, action_ego=chosen_action)
+    feasible_action = generate_nn_guard(solver, input, nn, action_ego=chosen_action)
     if feasible_action:
-        thetaacc, xacc = generate_angle_milp(gurobi_model, input, sin_cos_table)
+        thetaacc, xacc = generate_angle_milp(solver, input, sin_cos_table)
         # apply dynamic
-        x_prime = apply_dynamic(input, gurobi_model, chosen_action, thetaacc=thetaacc, xacc=xacc)
-        # gurobi_model.addConstr(x_prime[3] <= 0.625)
-        gurobi_model.addConstr(x_prime[3] <= 2)
-        gurobi_model.addConstr(x_prime[3] >= -2)
-        gurobi_model.addConstr(x_prime[2] >= -math.pi / 2)
-        gurobi_model.addConstr(x_prime[2] <= math.pi / 2)
-        gurobi_model.update()
-        gurobi_model.optimize()
-        found_successor, x_prime_results = h_repr_to_plot(gurobi_model, template, x_prime)
+        x_prime = apply_dynamic(input, solver, chosen_action, thetaacc=thetaacc, xacc=xacc)
+        generate_angle_limits(solver, x_prime)
+        found_successor, x_prime_results = h_repr_to_plot(solver, template, x_prime)
         if found_successor:
             post.append(tuple(x_prime_results))
 
     # positive case action 1
     chosen_action = 1
     case = 0  # positive
-    gurobi_model = grb.Model()
-    gurobi_model.setParam('OutputFlag', output_flag)
-    gurobi_model.setParam('Threads', 2)
-    input = generate_input_region(gurobi_model, template, x)
-    gurobi_model.addConstr(input[3] <= 2)
-    gurobi_model.addConstr(input[3] >= -2)
-    gurobi_model.addConstr(input[2] >= -math.pi / 2)
-    gurobi_model.addConstr(input[2] <= math.pi / 2)
-    max_theta, min_theta, max_theta_dot, min_theta_dot = get_theta_bounds(gurobi_model, input)
+    solver = new_solver(output_flag, threads=2)
+    input = generate_input_region(solver, template, x)
+    generate_angle_limits(solver, input)
+    max_theta, min_theta, max_theta_dot, min_theta_dot = get_theta_bounds(solver, input)
     sin_cos_table = get_sin_cos_table(max_theta, min_theta, max_theta_dot, min_theta_dot, action=chosen_action)
     # gurobi_model.addConstr(input[2] >= 0)  # positive case
-    feasible_action = generate_nn_guard(gurobi_model, input, nn, action_ego=chosen_action)
+    feasible_action = generate_nn_guard(solver, input, nn, action_ego=chosen_action)
     if feasible_action:
-        thetaacc, xacc = generate_angle_milp(gurobi_model, input, sin_cos_table)
+        thetaacc, xacc = generate_angle_milp(solver, input, sin_cos_table)
         # apply dynamic
-        x_prime = apply_dynamic(input, gurobi_model, chosen_action, thetaacc=thetaacc, xacc=xacc)
-        gurobi_model.addConstr(x_prime[3] <= 2)
-        gurobi_model.addConstr(x_prime[3] >= -2)
-        gurobi_model.addConstr(x_prime[2] >= -math.pi / 2)
-        gurobi_model.addConstr(x_prime[2] <= math.pi / 2)
-        gurobi_model.update()
-        gurobi_model.optimize()
-        found_successor, x_prime_results = h_repr_to_plot(gurobi_model, template, x_prime)
+        x_prime = apply_dynamic(input, solver, chosen_action, thetaacc=thetaacc, xacc=xacc)
+        generate_angle_limits(solver, x_prime)
+        found_successor, x_prime_results = h_repr_to_plot(solver, template, x_prime)
         if found_successor:
             post.append(tuple(x_prime_results))
 
@@ -507,49 +394,37 @@ def post_milp(x, nn, output_flag, t, template):
     return post
 
 
-def make_reverse_var(gurobi_model, input):
-    z = gurobi_model.addMVar(shape=env_input_size, lb=float("-inf"), name="input_positive")
-    gurobi_model.addConstr(z[0] == input[0])
-    gurobi_model.addConstr(z[1] == input[1])
-    gurobi_model.addConstr(z[2] == -input[2])
-    gurobi_model.addConstr(z[3] == input[3])
-    gurobi_model.update()
-    return z
+def make_reverse_var(solver: solver_backend.SolverBackend, input):
+    return Experiment.generate_linear_dynamic(solver, input, np.diag([1, 1, -1, 1]))
 
 
-def make_positive_case(gurobi_model, input, case):
+def make_positive_case(solver: solver_backend.SolverBackend, input, case):
     if case == 0:
-        gurobi_model.addConstr(input[2] >= 0)
+        solver.add_constraints(np.array([[1]]), input[2:3], ">", 0)
         return True, input
     else:
-        gurobi_model.addConstr(input[2] <= 0)  # mirror input in case of negative angle
-        z = gurobi_model.addMVar(shape=env_input_size, lb=float("-inf"), name="input_positive")
-        gurobi_model.addConstr(z[0] == -input[0])
-        gurobi_model.addConstr(z[1] == -input[1])
-        gurobi_model.addConstr(z[2] == -input[2])
-        gurobi_model.addConstr(z[3] == -input[3])
-
-    gurobi_model.update()
-    gurobi_model.optimize()
-    return gurobi_model.status == 2, z
-
-
-def get_theta_bounds(gurobi_model, input):
-    gurobi_model.setObjective(input[2].sum(), grb.GRB.MAXIMIZE)
-    gurobi_model.optimize()
-    max_theta = gurobi_model.getVars()[2].X
-
-    gurobi_model.setObjective(input[2].sum(), grb.GRB.MINIMIZE)
-    gurobi_model.optimize()
-    min_theta = gurobi_model.getVars()[2].X
-
-    gurobi_model.setObjective(input[3].sum(), grb.GRB.MAXIMIZE)
-    gurobi_model.optimize()
-    max_theta_dot = gurobi_model.getVars()[3].X
-
-    gurobi_model.setObjective(input[3].sum(), grb.GRB.MINIMIZE)
-    gurobi_model.optimize()
-    min_theta_dot = gurobi_model.getVars()[3].X
+        solver.add_constraints(np.array([[1]]), input[2:3], "<", 0)  # mirror input in case of negative angle
+        z = Experiment.generate_linear_dynamic(solver, input, -np.eye(env_input_size))
+
+    return solver.optimize() == solver_backend.OPTIMAL, z
+
+
+def get_theta_bounds(solver: solver_backend.SolverBackend, input):
+    solver.set_objective(input[2:3], 1, solver_backend.MAXIMIZE)
+    solver.optimize()
+    max_theta = solver.objective_value
+
+    solver.set_objective(input[2:3], 1, solver_backend.MINIMIZE)
+    solver.optimize()
+    min_theta = solver.objective_value
+
+    solver.set_objective(input[3:4], 1, solver_backend.MAXIMIZE)
+    solver.optimize()
+    max_theta_dot = solver.objective_value
+
+    solver.set_objective(input[3:4], 1, solver_backend.MINIMIZE)
+    solver.optimize()
+    min_theta_dot = solver.objective_value
     return max_theta, min_theta, max_theta_dot, min_theta_dot
 
 
@@ -598,8 +473,8 @@ def e(n, i):
     return np.array(result)
 
 
-def h_repr_to_plot(gurobi_model, template, x_prime):
-    x_prime_results = optimise(template, gurobi_model, x_prime)  # h representation
+def h_repr_to_plot(solver, template, x_prime):
+    x_prime_results = optimise(template, solver, x_prime)  # h representation
     return x_prime_results is not None, x_prime_results
 
 
@@ -1,5 +1,4 @@
 import numpy as np
-import gurobi as grb
 import pypoman
 import ray
 import torch
@@ -7,91 +6,48 @@ import torch
 from agents.dqn.train_DQN_car import get_dqn_car_trainer, get_apex_dqn_car_trainer
 from agents.ppo.train_PPO_car import get_PPO_trainer
 from agents.ray_utils import convert_DQN_ray_policy_to_sequential, convert_ray_policy_to_sequential
+from polyhedra.experiments_nn_analysis import Experiment
 from polyhedra.graph_explorer import GraphExplorer
 from polyhedra.net_methods import generate_nn_torch
 import functools
 from polyhedra.plot_utils import show_polygon_list, show_polygon_list2
+from utility import solver_backend
 
+lp_backend = None  # solver used by the MILP encodings, see utility.solver_backend
 
-def generate_input_region(gurobi_model, templates, boundaries):
-    input = gurobi_model.addMVar(shape=6, lb=float("-inf"), name="input")
-    for j, template in enumerate(templates):
-        gurobi_model.update()
-        multiplication = 0
-        for i in range(6):
-            multiplication += template[i] * input[i]
-        gurobi_model.addConstr(multiplication <= boundaries[j], name=f"input_constr_{j}")
-    return input
 
+def new_solver(output_flag=False):
+    return solver_backend.get_backend(lp_backend, output_flag=output_flag)
 
-def generate_mock_guard(gurobi_model: grb.Model, input, action_ego=0, t=0):
+
+def generate_input_region(solver, templates, boundaries):
+    return Experiment.generate_input_region(solver, templates, boundaries, 6)
+
+
+def generate_mock_guard(solver: solver_backend.SolverBackend, input, action_ego=0, t=0):
+    # rows over (x_lead, x_ego, v_lead, v_ego)
+    distance = np.array([[1, -1, 0, 0]])
+    v_ego = np.array([[0, 0, 0, 1]])
     if action_ego == 0:  # decelerate
         if t == 0:
-            gurobi_model.addConstr(input[3] >= 36, name=f"cond2_{t}")
+            solver.add_constraints(v_ego, input[:4], ">", 36)
         else:
-            gurobi_model.addConstr((input[0] - input[1]) <= 20, name=f"cond1_{t}")
+            solver.add_constraints(distance, input[:4], "<", 20)
     else:  # accelerate
         epsilon = 1e-4
-        gurobi_model.addConstr(input[3] <= 36 - epsilon, name=f"cond2_{t}")
-        gurobi_model.addConstr((input[0] - input[1]) >= 20 + epsilon, name=f"cond1_{t}")
-
-
-def generate_nn_guard(gurobi_model: grb.Model, input, nn: torch.nn.Sequential, action_ego=0):
-    gurobi_vars = []
-    gurobi_vars.append(input)
-    for i, layer in enumerate(nn):
-
-        # print(layer)
-        if type(layer) is torch.nn.Linear:
-            v = gurobi_model.addMVar(lb=float("-inf"), shape=(layer.out_features), name=f"layer_{i}")
-            lin_expr = layer.weight.data.numpy() @ gurobi_vars[-1]
-            if layer.bias is not None:
-                lin_expr = lin_expr + layer.bias.data.numpy()
-            gurobi_model.addConstr(v == lin_expr, name=f"linear_constr_{i}")
-            gurobi_vars.append(v)
-            # gurobi_model.update()
-            # gurobi_model.optimize()
-            # assert gurobi_model.status == 2, "LP wasn't optimally solved"
-        elif type(layer) is torch.nn.ReLU:
-            v = gurobi_model.addMVar(lb=float("-inf"), shape=gurobi_vars[-1].shape, name=f"layer_{i}")  # same shape as previous
-            z = gurobi_model.addMVar(lb=0, ub=1, shape=gurobi_vars[-1].shape, vtype=grb.GRB.INTEGER, name=f"relu_{i}")
-            M = 10e6
-            # gurobi_model.addConstr(v == grb.max_(0, gurobi_vars[-1]))
-            gurobi_model.addConstr(v >= gurobi_vars[-1], name=f"relu_constr_1_{i}")
-            gurobi_model.addConstr(v <= gurobi_vars[-1] + M * z, name=f"relu_constr_2_{i}")
-            gurobi_model.addConstr(v >= 0, name=f"relu_constr_3_{i}")
-            gurobi_model.addConstr(v <= M - M * z, name=f"relu_constr_4_{i}")
-            gurobi_vars.append(v)
-            # gurobi_model.update()
-            # gurobi_model.optimize()
-            # assert gurobi_model.status == 2, "LP wasn't optimally solved"
-            """
-            y = Relu(x)
-            0 <= z <= 1, z is integer
-            y >= x
-            y <= x + Mz
-            y >= 0
-            y <= M - Mz"""
-    # gurobi_model.update()
-    # gurobi_model.optimize()
-    # assert gurobi_model.status == 2, "LP wasn't optimally solved"
-    # gurobi_model.setObjective(v[action_ego].sum(), grb.GRB.MAXIMIZE)  # maximise the output
-    last_layer = gurobi_vars[-1]
-    if action_ego == 0:
-        gurobi_model.addConstr(last_layer[0] >= last_layer[1], name="last_layer")
-    else:
-        gurobi_model.addConstr(last_layer[1] >= last_layer[0], name="last_layer")
-    gurobi_model.update()
-    gurobi_model.optimize()
-    # assert gurobi_model.status == 2, "LP wasn't optimally solved"
-    return gurobi_model.status == 2
+        solver.add_constraints(v_ego, input[:4], "<", 36 - epsilon)
+        solver.add_constraints(distance, input[:4], ">", 20 + epsilon)
+
+
+def generate_nn_guard(solver: solver_backend.SolverBackend, input, nn: torch.nn.Sequential, action_ego=0):
+    return Experiment.generate_nn_guard(solver, input, nn, action_ego=action_ego)
 
 
-def apply_dynamic(input, gurobi_model: grb.Model, action_ego=0, t=0):
+def apply_dynamic(input, solver: solver_backend.SolverBackend, action_ego=0, t=0):
     '''
 
     :param input:
-    :param gurobi_model:
+    :param solver:
     :param action_ego:
     :param t:
     :return:
@@ -102,13 +58,6 @@ def apply_dynamic(input, gurobi_model: grb.Model, action_ego=0, t=0):
 
     '''
 
-    x_lead = input[0]
-    x_ego = input[1]
-    v_lead = input[2]
-    v_ego = input[3]
-    a_lead = input[4]
-    a_ego = input[5]
-    z = gurobi_model.addMVar(shape=(6,), lb=float("-inf"), name=f"x_prime_{t}")
     const_acc = 3
     dt = .1  # seconds
     if action_ego == 0:
@@ -117,51 +66,45 @@ def apply_dynamic(input, gurobi_model: grb.Model, action_ego=0, t=0):
         acceleration = const_acc
     else:
         acceleration = 0
-    a_ego_prime = acceleration
-    v_ego_prime = v_ego + a_ego * dt
-    v_lead_prime = v_lead + a_lead * dt
-    x_lead_prime = x_lead + v_lead_prime * dt
-    x_ego_prime = x_ego + v_ego_prime * dt
-    # delta_x_prime = (x_lead + (v_lead + (a_lead + 0) * dt) * dt) - (x_ego + (v_ego + (a_ego + acceleration) * dt) * dt)
-    # delta_v_prime = (v_lead + (a_lead + 0) * dt) - (v_ego + (a_ego + acceleration) * dt)
-    gurobi_model.addConstr(z[0] == x_lead_prime, name=f"dyna_constr_1_{t}")
-    gurobi_model.addConstr(z[1] == x_ego_prime, name=f"dyna_constr_2_{t}")
-    gurobi_model.addConstr(z[2] == v_lead_prime, name=f"dyna_constr_3_{t}")
-    gurobi_model.addConstr(z[3] == v_ego_prime, name=f"dyna_constr_4_{t}")
-    gurobi_model.addConstr(z[4] == a_lead, name=f"dyna_constr_5_{t}")  # no change in a_lead
-    gurobi_model.addConstr(z[5] == a_ego_prime, name=f"dyna_constr_6_{t}")
-    return z
-
-
-def optimise(templates, gurobi_model: grb.Model, x_prime):
+    # (x_lead, x_ego, v_lead, v_ego, a_lead, a_ego) -> the same variables one step later
+    matrix = np.array([[1, 0, dt, 0, dt * dt, 0],  # x_lead + v_lead_prime * dt
+                       [0, 1, 0, dt, 0, dt * dt],  # x_ego + v_ego_prime * dt
+                       [0, 0, 1, 0, dt, 0],  # v_lead + a_lead * dt
+                       [0, 0, 0, 1, 0, dt],  # v_ego + a_ego * dt
+                       [0, 0, 0, 0, 1, 0],  # no change in a_lead
+                       [0, 0, 0, 0, 0, 0]])
+    offset = np.array([0, 0, 0, 0, 0, acceleration])
+    return Experiment.generate_linear_dynamic(solver, input[:6], matrix, offset)
+
+
+def optimise(templates, solver: solver_backend.SolverBackend, x_prime):
     results = []
     for template in templates:
-        gurobi_model.update()
-        gurobi_model.setObjective(sum((template[i] * x_prime[i]) for i in range(6)), grb.GRB.MAXIMIZE)
-        gurobi_model.optimize()
-        # print_model(gurobi_model)
-        if gurobi_model.status != 2:
+        solver.set_objective(x_prime[:6], np.asarray(template, dtype=float)[:6], solver_backend.MAXIMIZE)
+        if solver.optimize() != solver_backend.OPTIMAL:
             return None
-        result = gurobi_model.ObjVal
+        result = solver.objective_value
         results.append(result)
     print(results)
     return np.array(results)
 
 
-def print_model(gurobi_model):
+def print_model(solver: solver_backend.SolverBackend, input, x_prime):
+    input_values = solver.values(input)
+    x_prime_values = solver.values(x_prime)
     print("----------------------------")
-    print(f'x_lead:{gurobi_model.getVarByName("input[0]").X}')
-    print(f'x_ego:{gurobi_model.getVarByName("input[1]").X}')
-    print(f'v_lead:{gurobi_model.getVarByName("input[2]").X}')
-    print(f'v_ego:{gurobi_model.getVarByName("input[3]").X}')
-    print(f'y_lead:{gurobi_model.getVarByName("input[4]").X}')
-    print(f'y_ego:{gurobi_model.getVarByName("input[5]").X}')
-    print(f'x_lead_prime:{gurobi_model.getVarByName("x_prime[0]").X}')
-    print(f'x_ego_prime:{gurobi_model.getVarByName("x_prime[1]").X}')
-    print(f'v_lead_prime:{gurobi_model.getVarByName("x_prime[2]").X}')
-    print(f'v_ego_prime:{gurobi_model.getVarByName("x_prime[3]").X}')
-    print(f'y_lead_prime:{gurobi_model.getVarByName("x_prime[4]").X}')
-    print(f'y_ego_prime:{gurobi_model.getVarByName("x_prime[5]").X}')
+    print(f'x_lead:{input_values[0]}')
+    print(f'x_ego:{input_values[1]}')
+    print(f'v_lead:{input_values[2]}')
+    print(f'v_ego:{input_values[3]}')
+    print(f'y_lead:{input_values[4]}')
+    print(f'y_ego:{input_values[5]}')
+    print(f'x_lead_prime:{x_prime_values[0]}')
+    print(f'x_ego_prime:{x_prime_values[1]}')
+    print(f'v_lead_prime:{x_prime_values[2]}')
+    print(f'v_ego_prime:{x_prime_values[3]}')
+    print(f'y_lead_prime:{x_prime_values[4]}')
+    print(f'y_ego_prime:{x_prime_values[5]}')
     print("----------------------------")
 
 
@@ -196,15 +139,14 @@ def main():
         nn = generate_nn_torch(six_dim=True, min_distance=20, max_distance=22)  # min_speed=30,max_speed=36
     else:
         nn = None
-    gurobi_model = grb.Model()
-    gurobi_model.setParam('OutputFlag', output_flag)
+    solver = new_solver(output_flag)
     graph = GraphExplorer(None)
 
     input_boundaries, template = get_template(0)
 
-    input = generate_input_region(gurobi_model, template, input_boundaries)
+    input = generate_input_region(solver, template, input_boundaries)
     _, template = get_template(1)
-    x_results = optimise(template, gurobi_model, input)
+    x_results = optimise(template, solver, input)
     # input_boundaries, template = get_template(1)
     if x_results is None:
         print("Model unsatisfiable")
@@ -258,60 +200,49 @@ def post(x, graph, mode, nn, output_flag, t, template, timestep_container):
     post = []
     if mode == 0:
         # deceleration 1
-        gurobi_model = grb.Model()
-        gurobi_model.setParam('OutputFlag', output_flag)
-        input = generate_input_region(gurobi_model, template, x)
-        generate_mock_guard(gurobi_model, input, 0, t=0)
+        solver = new_solver(output_flag)
+        input = generate_input_region(solver, template, x)
+        generate_mock_guard(solver, input, 0, t=0)
         # apply dynamic
-        x_prime = apply_dynamic(input, gurobi_model, 0, t=t)  # 0
-        found_successor, x_prime_results = h_repr_to_plot(graph, gurobi_model, template, timestep_container, x_prime)
+        x_prime = apply_dynamic(input, solver, 0, t=t)  # 0
+        found_successor, x_prime_results = h_repr_to_plot(graph, solver, template, timestep_container, x_prime)
         if found_successor:
             post.append(tuple(x_prime_results))
         # # deceleration 2
-        gurobi_model = grb.Model()
-        gurobi_model.setParam('OutputFlag', output_flag)
-        input = generate_input_region(gurobi_model, template, x)
-        generate_mock_guard(gurobi_model, input, 0, t=1)  # # apply dynamic
-        x_prime = apply_dynamic(input, gurobi_model, 0, t=t)  # 0
-        found_successor, x_prime_results = h_repr_to_plot(graph, gurobi_model, template, timestep_container, x_prime)
+        solver = new_solver(output_flag)
+        input = generate_input_region(solver, template, x)
+        generate_mock_guard(solver, input, 0, t=1)  # # apply dynamic
+        x_prime = apply_dynamic(input, solver, 0, t=t)  # 0
+        found_successor, x_prime_results = h_repr_to_plot(graph, solver, template, timestep_container, x_prime)
         if found_successor:
             post.append(tuple(x_prime_results))
         # # acceleration
-        gurobi_model = grb.Model()
-        gurobi_model.setParam('OutputFlag', output_flag)
-        input = generate_input_region(gurobi_model, template, x)
-        generate_mock_guard(gurobi_model, input, 1)  # # apply dynamic  #
-        x_prime = apply_dynamic(input, gurobi_model, 1, t=t)  # 1
-        found_successor, x_prime_results = h_repr_to_plot(graph, gurobi_model, template, timestep_container, x_prime)
+        solver = new_solver(output_flag)
+        input = generate_input_region(solver, template, x)
+        generate_mock_guard(solver, input, 1)  # # apply dynamic  #
+        x_prime = apply_dynamic(input, solver, 1, t=t)  # 1
+        found_successor, x_prime_results = h_repr_to_plot(graph, solver, template, timestep_container, x_prime)
         if found_successor:
             post.append(tuple(x_prime_results))
     if mode == 1 or mode == 2:
         # deceleration
-        gurobi_model = grb.Model()
-        gurobi_model.setParam('OutputFlag', output_flag)
-        # gurobi_model.setParam('OptimalityTol', 1e-9)
-        # gurobi_model.setParam('FeasibilityTol', 1e-9)
-        # gurobi_model.setParam('IntFeasTol', 1e-9)
-        input = generate_input_region(gurobi_model, template, x)
-        feasible = generate_nn_guard(gurobi_model, input, nn, action_ego=0)
+        solver = new_solver(output_flag)
+        input = generate_input_region(solver, template, x)
+        feasible = generate_nn_guard(solver, input, nn, action_ego=0)
         if feasible:
             # apply dynamic
-            x_prime = apply_dynamic(input, gurobi_model, 0, t=t)
-            found_successor, x_prime_results = h_repr_to_plot(graph, gurobi_model, template, timestep_container, x_prime)
+            x_prime = apply_dynamic(input, solver, 0, t=t)
+            found_successor, x_prime_results = h_repr_to_plot(graph, solver, template, timestep_container, x_prime)
             if found_successor:
                 post.append(tuple(x_prime_results))
         # # acceleration
-        gurobi_model = grb.Model()
-        gurobi_model.setParam('OutputFlag', output_flag)
-        # gurobi_model.setParam('OptimalityTol', 1e-9)
-        # gurobi_model.setParam('FeasibilityTol', 1e-9)
-        # gurobi_model.setParam('IntFeasTol', 1e-9)
-        input = generate_input_region(gurobi_model, template, x)
-        feasible = generate_nn_guard(gurobi_model, input, nn, action_ego=1)
+        solver = new_solver(output_flag)
+        input = generate_input_region(solver, template, x)
+        feasible = generate_nn_guard(solver, input, nn, action_ego=1)
         if feasible:
             # apply dynamic
-            x_prime = apply_dynamic(input, gurobi_model, 1, t=t)
-            found_successor, x_prime_results = h_repr_to_plot(graph, gurobi_model, template, timestep_container, x_prime)
+            x_prime = apply_dynamic(input, solver, 1, t=t)
+            found_successor, x_prime_results = h_repr_to_plot(graph, solver, template, timestep_container, x_prime)
             if found_successor:
                 post.append(tuple(x_prime_results))
     return post
@@ -428,8 +359,8 @@ def e(n, i):
     return np.array(result)
 
 
-def h_repr_to_plot(graph, gurobi_model, template, vertices_list, x_prime):
-    x_prime_results = optimise(template, gurobi_model, x_prime)  # h representation
+def h_repr_to_plot(graph, solver, template, vertices_list, x_prime):
+    x_prime_results = optimise(template, solver, x_prime)  # h representation
     added = False
     if x_prime_results is not None:
         x_prime_tuple = tuple(x_prime_results)
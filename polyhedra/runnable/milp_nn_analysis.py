@@ -6,7 +6,6 @@ from rtree import index
 import torch
 import torch.nn
 import numpy as np
-import gurobi as grb
 import pypoman
 from sklearn.decomposition import PCA
 from sklearn.preprocessing import StandardScaler
@@ -14,6 +13,7 @@ from sklearn.preprocessing import StandardScaler
 from agents.dqn.train_DQN_car import get_dqn_car_trainer
 from agents.ray_utils import convert_DQN_ray_policy_to_sequential
 from mosaic.utils import compute_trace_polygons, PolygonSort
+from polyhedra.experiments_nn_analysis import Experiment
 from polyhedra.graph_explorer import GraphExplorer
 from polyhedra.net_methods import generate_nn_torch, generate_mock_input
 import plotly.graph_objects as go
@@ -22,129 +22,92 @@ import networkx as nx
 
 from polyhedra.plot_utils import show_polygon_list, show_polygon_list2
 from polyhedra.runnable.nn_analysis import analyse_input
+from utility import solver_backend
 
+lp_backend = None  # solver used by the MILP encodings, see utility.solver_backend
 
-def generate_input_region(gurobi_model, templates, boundaries):
-    input = gurobi_model.addMVar(shape=6, lb=float("-inf"), name="input")
-    for j, template in enumerate(templates):
-        gurobi_model.update()
-        multiplication = 0
-        for i in range(6):
-            multiplication += template[i] * input[i]
-        gurobi_model.addConstr(multiplication >= boundaries[j], name=f"input_constr_{j}")
+
+def new_solver(output_flag=False):
+    return solver_backend.get_backend(lp_backend, output_flag=output_flag)
+
+
+def generate_input_region(solver: solver_backend.SolverBackend, templates, boundaries):
+    input = solver.add_variables(6)
+    solver.add_constraints(np.asarray(templates)[:, :6], input, ">", np.asarray(boundaries, dtype=float)[:len(templates)])
     return input
 
 
-def generate_mock_guard(gurobi_model: grb.Model, input, nn: torch.nn.Sequential, action_ego=0):
-    gurobi_vars = []
-    gurobi_vars.append(input)
+def generate_mock_guard(solver: solver_backend.SolverBackend, input, nn: torch.nn.Sequential, action_ego=0):
+    solver_vars = []
+    solver_vars.append(input)
     for i, layer in enumerate(nn):
 
         # print(layer)
         if type(layer) is torch.nn.Linear:
-            v = gurobi_model.addMVar(lb=float("-inf"), shape=(layer.out_features), name=f"layer_{i}")
-            lin_expr = layer.weight.data.numpy() @ gurobi_vars[-1]
-            if layer.bias is not None:
-                lin_expr = lin_expr + layer.bias.data.numpy()
-            gurobi_model.addConstr(v == lin_expr)
-            gurobi_vars.append(v)
-            gurobi_model.update()
-            gurobi_model.optimize()
-            assert gurobi_model.status == 2, "LP wasn't optimally solved"
+            bias = layer.bias.data.numpy() if layer.bias is not None else 0
+            v = Experiment.generate_linear_dynamic(solver, solver_vars[-1], layer.weight.data.numpy(), bias)
+            solver_vars.append(v)
+            assert solver.optimize() == solver_backend.OPTIMAL, "LP wasn't optimally solved"
         elif type(layer) is torch.nn.ReLU:
-            v = gurobi_model.addMVar(lb=float("-inf"), shape=gurobi_vars[-1].shape, name=f"layer_{i}")  # same shape as previous
-            z = gurobi_model.addMVar(lb=0, ub=1, shape=gurobi_vars[-1].shape, vtype=grb.GRB.INTEGER, name=f"relu_{i}")
-            M = 10e6
-            # gurobi_model.addConstr(v == grb.max_(0, gurobi_vars[-1]))
-            gurobi_model.addConstr(v >= gurobi_vars[-1])
-            gurobi_model.addConstr(v <= gurobi_vars[-1] + M * z)
-            gurobi_model.addConstr(v >= 0)
-            gurobi_model.addConstr(v <= M - M * z)
-            gurobi_vars.append(v)
-            gurobi_model.update()
-            gurobi_model.optimize()
-            assert gurobi_model.status == 2, "LP wasn't optimally solved"
-            """
-            y = Relu(x)
-            0 <= z <= 1, z is integer
-            y >= x
-            y <= x + Mz
-            y >= 0
-            y <= M - Mz"""
+            v = Experiment.generate_relu(solver, solver_vars[-1])
+            solver_vars.append(v)
+            assert solver.optimize() == solver_backend.OPTIMAL, "LP wasn't optimally solved"
     # gurobi_model.setObjective(v[0].sum(), grb.GRB.MINIMIZE)
-    gurobi_model.update()
-    gurobi_model.optimize()
-    assert gurobi_model.status == 2, "LP wasn't optimally solved"
+    assert solver.optimize() == solver_backend.OPTIMAL, "LP wasn't optimally solved"
     # gurobi_model.setObjective(v[action_ego].sum(), grb.GRB.MAXIMIZE)  # maximise the output
-    last_layer = gurobi_vars[-1]
+    last_layer = solver_vars[-1]
     if action_ego == 0:
-        gurobi_model.addConstr(last_layer[0] >= last_layer[1])
+        solver.add_constraints(np.array([[1, -1]]), last_layer[:2], ">", 0)
     else:
-        gurobi_model.addConstr(last_layer[1] >= last_layer[0])
-    gurobi_model.update()
-    gurobi_model.optimize()
-    # assert gurobi_model.status == 2, "LP wasn't optimally solved"
-    return gurobi_model.status == 2
-
-def apply_dynamic(input, gurobi_model: grb.Model, action_ego=0, t=0):
-    x_lead = input[0]
-    x_ego = input[1]
-    v_lead = input[2]
-    v_ego = input[3]
-    y_lead = input[4]
-    y_ego = input[5]
-    z = gurobi_model.addMVar(shape=(6,), lb=float("-inf"), name=f"x_prime_{t}")
+        solver.add_constraints(np.array([[-1, 1]]), last_layer[:2], ">", 0)
+    return solver.optimize() == solver_backend.OPTIMAL
+
+def apply_dynamic(input, solver: solver_backend.SolverBackend, action_ego=0, t=0):
     a_ego = 1
     dt = .1
     if action_ego == 0:
         acceleration = -a_ego
     else:
         acceleration = a_ego
-    y_ego_prime = y_ego + acceleration
-    v_ego_prime = v_ego + (y_ego + acceleration) * dt
-    v_lead_prime = v_lead + y_lead * dt
-    x_lead_prime = x_lead + (v_lead + (y_lead + 0) * dt) * dt
-    x_ego_prime = x_ego + (v_ego + (y_ego + acceleration) * dt) * dt
-    # delta_x_prime = (x_lead + (v_lead + (y_lead + 0) * dt) * dt) - (x_ego + (v_ego + (y_ego + acceleration) * dt) * dt)
-    # delta_v_prime = (v_lead + (y_lead + 0) * dt) - (v_ego + (y_ego + acceleration) * dt)
-    gurobi_model.addConstr(z[0] == x_lead_prime, name=f"dyna_constr_1_{t}")
-    gurobi_model.addConstr(z[1] == x_ego_prime, name=f"dyna_constr_2_{t}")
-    gurobi_model.addConstr(z[2] == v_lead_prime, name=f"dyna_constr_3_{t}")
-    gurobi_model.addConstr(z[3] == v_ego_prime, name=f"dyna_constr_4_{t}")
-    gurobi_model.addConstr(z[4] == y_lead, name=f"dyna_constr_5_{t}")  # no change in y_lead
-    gurobi_model.addConstr(z[5] == y_ego_prime, name=f"dyna_constr_6_{t}")
-    return z
-
-
-def optimise(templates, gurobi_model: grb.Model, x_prime):
+    # (x_lead, x_ego, v_lead, v_ego, y_lead, y_ego) -> the same variables one step later
+    matrix = np.array([[1, 0, dt, 0, dt * dt, 0],  # x_lead + (v_lead + (y_lead + 0) * dt) * dt
+                       [0, 1, 0, dt, 0, dt * dt],  # x_ego + (v_ego + (y_ego + acceleration) * dt) * dt
+                       [0, 0, 1, 0, dt, 0],  # v_lead + y_lead * dt
+                       [0, 0, 0, 1, 0, dt],  # v_ego + (y_ego + acceleration) * dt
+                       [0, 0, 0, 0, 1, 0],  # no change in y_lead
+                       [0, 0, 0, 0, 0, 1]])  # y_ego + acceleration
+    offset = np.array([0, acceleration * dt * dt, 0, acceleration * dt, 0, acceleration])
+    return Experiment.generate_linear_dynamic(solver, input[:6], matrix, offset)
+
+
+def optimise(templates, solver: solver_backend.SolverBackend, x_prime):
     results = []
     for template in templates:
-        gurobi_model.update()
-        gurobi_model.setObjective(sum((template[i] * x_prime[i]) for i in range(6)), grb.GRB.MINIMIZE)
-        gurobi_model.optimize()
-        # print_model(gurobi_model)
-        if gurobi_model.status != 2:
+        solver.set_objective(x_prime[:6], np.asarray(template, dtype=float)[:6], solver_backend.MINIMIZE)
+        if solver.optimize() != solver_backend.OPTIMAL:
             return None
-        result = gurobi_model.ObjVal
+        result = solver.objective_value
         results.append(result)
     print(results)
     return np.array(results)
 
 
-def print_model(gurobi_model):
+def print_model(solver: solver_backend.SolverBackend, input, x_prime):
+    input_values = solver.values(input)
+    x_prime_values = solver.values(x_prime)
     print("----------------------------")
-    print(f'x_lead:{gurobi_model.getVarByName("input[0]").X}')
-    print(f'x_ego:{gurobi_model.getVarByName("input[1]").X}')
-    print(f'v_lead:{gurobi_model.getVarByName("input[2]").X}')
-    print(f'v_ego:{gurobi_model.getVarByName("input[3]").X}')
-    print(f'y_lead:{gurobi_model.getVarByName("input[4]").X}')
-    print(f'y_ego:{gurobi_model.getVarByName("input[5]").X}')
-    print(f'x_lead_prime:{gurobi_model.getVarByName("x_prime[0]").X}')
-    print(f'x_ego_prime:{gurobi_model.getVarByName("x_prime[1]").X}')
-    print(f'v_lead_prime:{gurobi_model.getVarByName("x_prime[2]").X}')
-    print(f'v_ego_prime:{gurobi_model.getVarByName("x_prime[3]").X}')
-    print(f'y_lead_prime:{gurobi_model.getVarByName("x_prime[4]").X}')
-    print(f'y_ego_prime:{gurobi_model.getVarByName("x_prime[5]").X}')
+    print(f'x_lead:{input_values[0]}')
+    print(f'x_ego:{input_values[1]}')
+    print(f'v_lead:{input_values[2]}')
+    print(f'v_ego:{input_values[3]}')
+    print(f'y_lead:{input_values[4]}')
+    print(f'y_ego:{input_values[5]}')
+    print(f'x_lead_prime:{x_prime_values[0]}')
+    print(f'x_ego_prime:{x_prime_values[1]}')
+    print(f'v_lead_prime:{x_prime_values[2]}')
+    print(f'v_ego_prime:{x_prime_values[3]}')
+    print(f'y_lead_prime:{x_prime_values[4]}')
+    print(f'y_ego_prime:{x_prime_values[5]}')
     print("----------------------------")
 
 
@@ -153,8 +116,7 @@ def main():
     nn = generate_nn_torch(six_dim=True)
 
     res = nn(torch.tensor([90,30,20,30,0,0],dtype=torch.float64))
-    gurobi_model = grb.Model()
-    gurobi_model.setParam('OutputFlag', False)
+    solver = new_solver()
     # optimise in a direction
     template = []
     for dimension in range(6):
@@ -171,8 +133,8 @@ def main():
     root = tuple(input_boundaries)
     graph.root = root
     graph.store_boundary(root)
-    input = generate_input_region(gurobi_model, template, input_boundaries)
-    x_results = optimise(template, gurobi_model, input)
+    input = generate_input_region(solver, template, input_boundaries)
+    x_results = optimise(template, solver, input)
     if x_results is None:
         print("Model unsatisfiable")
         return
@@ -185,23 +147,21 @@ def main():
         for fringe_element in fringe:
             found_successor = False
             # deceleration
-            gurobi_model = grb.Model()
-            gurobi_model.setParam('OutputFlag', False)
-            input = generate_input_region(gurobi_model, template, fringe_element)
-            feasible = generate_mock_guard(gurobi_model, input, nn, action_ego=0)
+            solver = new_solver()
+            input = generate_input_region(solver, template, fringe_element)
+            feasible = generate_mock_guard(solver, input, nn, action_ego=0)
             if feasible:
                 # apply dynamic
-                x_prime = apply_dynamic(input, gurobi_model, 0, t=t)
-                found_successor = h_repr_to_plot(found_successor, fringe_element, graph, gurobi_model, template, timestep_container, x_prime)
+                x_prime = apply_dynamic(input, solver, 0, t=t)
+                found_successor = h_repr_to_plot(found_successor, fringe_element, graph, solver, template, timestep_container, x_prime)
             # # acceleration
-            gurobi_model = grb.Model()
-            gurobi_model.setParam('OutputFlag', False)
-            input = generate_input_region(gurobi_model, template, fringe_element)
-            feasible = generate_mock_guard(gurobi_model, input, nn, action_ego=1)
+            solver = new_solver()
+            input = generate_input_region(solver, template, fringe_element)
+            feasible = generate_mock_guard(solver, input, nn, action_ego=1)
             if feasible:
                 # apply dynamic
-                x_prime = apply_dynamic(input, gurobi_model, 1, t=t)
-                found_successor = h_repr_to_plot(found_successor, fringe_element, graph, gurobi_model, template, timestep_container, x_prime)
+                x_prime = apply_dynamic(input, solver, 1, t=t)
+                found_successor = h_repr_to_plot(found_successor, fringe_element, graph, solver, template, timestep_container, x_prime)
             if not found_successor:
                 graph.graph.nodes[fringe_element]["ignore"] = True
         vertices_list.append(timestep_container)
@@ -209,8 +169,8 @@ def main():
     show_polygon_list2(vertices_list)
 
 
-def h_repr_to_plot(found_successor, fringe, graph, gurobi_model, template, vertices_list, x_prime):
-    x_prime_results = optimise(template, gurobi_model, x_prime)  # h representation
+def h_repr_to_plot(found_successor, fringe, graph, solver, template, vertices_list, x_prime):
+    x_prime_results = optimise(template, solver, x_prime)  # h representation
     if x_prime_results is not None:
         x_prime_tuple = tuple(x_prime_results)
         found_successor = True
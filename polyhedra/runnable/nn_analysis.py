@@ -1,67 +1,47 @@
 import torch
 import torch.nn
 import numpy as np
-import gurobi as grb
+from polyhedra.experiments_nn_analysis import Experiment
 from polyhedra.net_methods import generate_nn_torch, generate_mock_input
+from utility import solver_backend
+
+lp_backend = None  # solver used by the MILP encodings, see utility.solver_backend
 
 
 def analyse_input(nn: torch.nn.Sequential):
-    gurobi_model = grb.Model()
-    gurobi_model.setParam('OutputFlag', False)
-    v = gurobi_model.addMVar(shape=(2,), lb=float("-inf"), name="input")
-    gurobi_vars = []
-    gurobi_vars.append(v)
+    solver = solver_backend.get_backend(lp_backend)
+    v = solver.add_variables(2)
+    solver_vars = []
+    solver_vars.append(v)
     for i, layer in enumerate(nn):
 
         print(layer)
         if type(layer) is torch.nn.Linear:
-            v = gurobi_model.addMVar(lb=float("-inf"), shape=(layer.out_features), name=f"layer_{i}")
-            lin_expr = layer.weight.data.numpy() @ gurobi_vars[-1] + layer.bias.data.numpy()
-            gurobi_model.addConstr(v == lin_expr)
-            gurobi_vars.append(v)
-            gurobi_model.update()
-            gurobi_model.optimize()
-            assert gurobi_model.status == 2, "LP wasn't optimally solved"
+            v = Experiment.generate_linear_dynamic(solver, solver_vars[-1], layer.weight.data.numpy(), layer.bias.data.numpy())
+            solver_vars.append(v)
+            assert solver.optimize() == solver_backend.OPTIMAL, "LP wasn't optimally solved"
         elif type(layer) is torch.nn.ReLU:
-            v = gurobi_model.addMVar(lb=float("-inf"), shape=gurobi_vars[-1].shape, name=f"layer_{i}")  # same shape as previous
-            z = gurobi_model.addMVar(lb=0, ub=1, shape=gurobi_vars[-1].shape, vtype=grb.GRB.INTEGER, name=f"relu_{i}")
-            M = 10e6
-            # gurobi_model.addConstr(v == grb.max_(0, gurobi_vars[-1]))
-            gurobi_model.addConstr(v >= gurobi_vars[-1])
-            gurobi_model.addConstr(v <= gurobi_vars[-1] + M * z)
-            gurobi_model.addConstr(v >= 0)
-            gurobi_model.addConstr(v <= M - M * z)
-            gurobi_vars.append(v)
-            gurobi_model.update()
-            gurobi_model.optimize()
-            assert gurobi_model.status == 2, "LP wasn't optimally solved"
-            """
-            y = Relu(x)
-            0 <= z <= 1, z is integer
-            y >= x
-            y <= x + Mz
-            y >= 0
-            y <= M - Mz"""
+            v = Experiment.generate_relu(solver, solver_vars[-1])
+            solver_vars.append(v)
+            assert solver.optimize() == solver_backend.OPTIMAL, "LP wasn't optimally solved"
     # gurobi_model.setObjective(v[0].sum(), grb.GRB.MINIMIZE)
-    gurobi_model.update()
-    gurobi_model.optimize()
-    assert gurobi_model.status == 2, "LP wasn't optimally solved"
-    # print_gurobi(gurobi_model)
-    return gurobi_model, v
+    assert solver.optimize() == solver_backend.OPTIMAL, "LP wasn't optimally solved"
+    # print_solution(solver, v)
+    return solver, v
 
 
-def print_gurobi(gurobi_model):
-    for var in gurobi_model.getVars():
-        print(f"{var.varName}: {var.X}")
-    print(f"Objective value: {gurobi_model.objVal}")
+def print_solution(solver: solver_backend.SolverBackend, x):
+    for i, value in zip(x, solver.values(x)):
+        print(f"x_{i}: {value}")
+    print(f"Objective value: {solver.objective_value}")
 
 
 if __name__ == '__main__':
     nn = generate_nn_torch()
     model, y = analyse_input(nn)
-    model.setObjective(y[0].sum(), grb.GRB.MINIMIZE)  # minimise the output
+    model.set_objective(y[0:1], 1, solver_backend.MINIMIZE)  # minimise the output
     model.optimize()
-    print_gurobi(model)
-    model.setObjective(y[0].sum(), grb.GRB.MAXIMIZE)  # maximise the output
+    print_solution(model, y)
+    model.set_objective(y[0:1], 1, solver_backend.MAXIMIZE)  # maximise the output
     model.optimize()
-    print_gurobi(model)
+    print_solution(model, y)
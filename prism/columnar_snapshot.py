@@ -0,0 +1,173 @@
+"""
+Columnar snapshot of the abstract MDP stored by StateStorage.
+Every attribute of the graph is saved as a separate .npy file inside a folder so that post-hoc analysis can open them memory-mapped
+and compute statistics with numpy without materialising the networkx graph.
+"""
+import json
+import os
+from typing import List, Tuple
+
+import numpy as np
+
+FLAG_FAIL = 1
+FLAG_HALF_FAIL = 2
+FLAG_IGNORE = 4
+NO_ACTION = -1
+NODE_FLAGS = {"fail": FLAG_FAIL, "half_fail": FLAG_HALF_FAIL, "ignore": FLAG_IGNORE}
+NODE_COLUMNS = ["lb", "ub"]  # float node attributes, NaN when missing
+EDGE_COLUMNS = ["p", "p_lb", "p_ub"]  # float edge attributes, NaN when missing
+
+
+def node_to_row(node) -> Tuple[np.ndarray, object]:
+    """Returns the bounds as a [d,2] array and the action of a node, nodes can be HyperRectangle(_action) or (interval tuple, action)"""
+    if hasattr(node, "intervals"):
+        bounds = np.array([(interval.left_bound(), interval.right_bound()) for interval in node.intervals], dtype=np.float64)
+        return bounds, getattr(node, "action", None)
+    interval, action = node
+    return np.array(interval, dtype=np.float64), action
+
+
+def save_columnar(graph, root, folder_path: str):
+    """
+    Writes the graph as a set of columns in folder_path:
+    bounds.npy [N,d,2], action.npy [N], flags.npy [N], lb.npy/ub.npy [N], edge_src.npy/edge_dst.npy [E], edge_sticky.npy [E], p.npy/p_lb.npy/p_ub.npy [E]
+    """
+    os.makedirs(folder_path, exist_ok=True)
+    n_nodes = graph.number_of_nodes()
+    n_edges = graph.number_of_edges()
+    mapping = dict()
+    bool_actions = True
+    columns = {"action": np.full(n_nodes, NO_ACTION, dtype=np.int8), "flags": np.zeros(n_nodes, dtype=np.uint8)}
+    for name in NODE_COLUMNS:
+        columns[name] = np.full(n_nodes, np.nan, dtype=np.float64)
+    for i, node in enumerate(graph.nodes()):
+        mapping[node] = i
+        bounds, action = node_to_row(node)
+        if i == 0:
+            # the shape of the bounds is only known once the first node is seen
+            columns["bounds"] = np.lib.format.open_memmap(os.path.join(folder_path, "bounds.npy"), mode="w+", dtype=np.float64, shape=(n_nodes,) + bounds.shape)
+        columns["bounds"][i] = bounds
+        if action is not None:
+            bool_actions = bool_actions and isinstance(action, (bool, np.bool_))
+            columns["action"][i] = int(action)
+        attributes = graph.nodes[node]
+        for name, flag in NODE_FLAGS.items():
+            if attributes.get(name):
+                columns["flags"][i] |= flag
+        for name in NODE_COLUMNS:
+            if attributes.get(name) is not None:
+                columns[name][i] = attributes[name]
+    if n_nodes != 0:
+        columns["bounds"].flush()
+    else:
+        np.save(os.path.join(folder_path, "bounds.npy"), np.empty((0, 0, 2), dtype=np.float64))
+    for name in ["action", "flags"] + NODE_COLUMNS:
+        np.save(os.path.join(folder_path, f"{name}.npy"), columns[name])
+    edge_src = np.empty(n_edges, dtype=np.int64)
+    edge_dst = np.empty(n_edges, dtype=np.int64)
+    edge_sticky = np.zeros(n_edges, dtype=np.bool_)
+    edge_columns = {name: np.full(n_edges, np.nan, dtype=np.float64) for name in EDGE_COLUMNS}
+    for j, (parent, successor, eattr) in enumerate(graph.edges(data=True)):
+        edge_src[j] = mapping[parent]
+        edge_dst[j] = mapping[successor]
+        edge_sticky[j] = eattr.get("a") is not None
+        for name in EDGE_COLUMNS:
+            if eattr.get(name) is not None:
+                edge_columns[name][j] = eattr[name]
+    np.save(os.path.join(folder_path, "edge_src.npy"), edge_src)
+    np.save(os.path.join(folder_path, "edge_dst.npy"), edge_dst)
+    np.save(os.path.join(folder_path, "edge_sticky.npy"), edge_sticky)
+    for name in EDGE_COLUMNS:
+        np.save(os.path.join(folder_path, f"{name}.npy"), edge_columns[name])
+    meta = {"n_nodes": n_nodes, "n_edges": n_edges, "root": mapping.get(root, -1) if root is not None else -1, "bool_actions": bool_actions}
+    with open(os.path.join(folder_path, "meta.json"), "w") as f:
+        json.dump(meta, f)
+    print(f"Columnar snapshot saved ({n_nodes} nodes, {n_edges} edges)")
+
+
+class ColumnarMDP:
+    """Read-only view over a columnar snapshot, every column is opened lazily and memory-mapped"""
+
+    def __init__(self, folder_path: str):
+        self.folder_path = folder_path
+        with open(os.path.join(folder_path, "meta.json")) as f:
+            meta = json.load(f)
+        self.n_nodes = meta["n_nodes"]
+        self.n_edges = meta["n_edges"]
+        self.root = meta["root"]
+        self.bool_actions = meta["bool_actions"]
+        self._columns = dict()
+        self._indptr = None
+        self._successors = None
+
+    def column(self, name: str) -> np.ndarray:
+        if name not in self._columns:
+            self._columns[name] = np.load(os.path.join(self.folder_path, f"{name}.npy"), mmap_mode="r")
+        return self._columns[name]
+
+    def has_flag(self, flag: int) -> np.ndarray:
+        return (self.column("flags") & flag) != 0
+
+    def csr(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Compressed sparse row adjacency: the successors of node i are successors[indptr[i]:indptr[i+1]]"""
+        if self._indptr is None:
+            edge_src = self.column("edge_src")
+            order = np.argsort(edge_src, kind="stable")
+            self._successors = np.asarray(self.column("edge_dst"))[order]
+            self._indptr = np.zeros(self.n_nodes + 1, dtype=np.int64)
+            np.cumsum(np.bincount(edge_src, minlength=self.n_nodes), out=self._indptr[1:])
+        return self._indptr, self._successors
+
+    def out_degree(self) -> np.ndarray:
+        return np.bincount(self.column("edge_src"), minlength=self.n_nodes)
+
+    def depths(self, source: int = None) -> np.ndarray:
+        """Breadth first shortest path length from source (root by default), -1 for unreachable nodes"""
+        source = self.root if source is None else source
+        indptr, successors = self.csr()
+        depth = np.full(self.n_nodes, -1, dtype=np.int64)
+        if source < 0:
+            return depth
+        depth[source] = 0
+        frontier = np.array([source], dtype=np.int64)
+        level = 0
+        while len(frontier) != 0:
+            level += 1
+            starts = indptr[frontier]
+            counts = indptr[frontier + 1] - starts
+            # indices of all the successors of the frontier without a python loop
+            offsets = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+            next_nodes = np.unique(successors[offsets])
+            next_nodes = next_nodes[depth[next_nodes] == -1]
+            depth[next_nodes] = level
+            frontier = next_nodes
+        return depth
+
+    def action(self, i: int):
+        value = int(self.column("action")[i])
+        if value == NO_ACTION:
+            return None
+        return bool(value) if self.bool_actions else value
+
+    def node(self, i: int):
+        """The node i in the (interval tuple, action) form used by the plotting utilities"""
+        bounds = self.column("bounds")[i]
+        return tuple((float(lb), float(ub)) for lb, ub in bounds), self.action(i)
+
+    def get_n_states(self, horizon: int) -> List[int]:
+        """Columnar equivalent of unroll_methods.get_n_states"""
+        depth = self.depths()
+        even_depth = depth[(depth >= 0) & (depth % 2 == 0)]
+        return [int((even_depth < t * 2).sum()) for t in range(1, horizon + 1)]
+
+    def get_property_at_timestep(self, t: int, properties: List[str]):
+        """Columnar equivalent of unroll_methods.get_property_at_timestep, only the selected nodes are materialised"""
+        indices = np.nonzero(self.depths() == t)[0]
+        columns = []
+        for name in properties:
+            if name in NODE_FLAGS:
+                columns.append(self.has_flag(NODE_FLAGS[name])[indices])
+            else:
+                values = np.asarray(self.column(name)[indices])
+                columns.append([None if np.isnan(x) else float(x) for x in values])
+        return [tuple([self.node(i)] + [column[k] for column in columns]) for k, i in enumerate(indices)]
@@ -0,0 +1,89 @@
+from typing import Callable, Dict, List, Tuple
+
+from py4j.java_collections import ListConverter
+from py4j.java_gateway import JavaGateway
+
+from utility.standard_progressbar import StandardProgressBar
+
+Choices = List[Tuple[object, List[Tuple[object, float]]]]  # [(action label, [(successor, probability)])]
+
+
+class PrismSession:
+    """
+    Long-lived connection to the PRISM gateway which keeps the explicit MDP on the java side in sync with the graph.
+    Every node keeps the same prism index for the lifetime of the session, so after the first upload only the states whose choices changed
+    (or which entered/left the horizon) are cleared and sent again.
+    """
+
+    def __init__(self):
+        self.gateway = None
+        self.mdp = None
+        self.mapping: Dict[object, int] = dict()  # node -> prism state index
+        self.n_states = 0  # number of states allocated on the java side
+        self.uploaded = set()  # nodes whose choices are currently in the java model
+
+    def invalidate(self):
+        """Forget the java model, the next sync resets it and uploads everything again"""
+        self.mdp = None
+        self.mapping = dict()
+        self.n_states = 0
+        self.uploaded = set()
+
+    def connect(self):
+        if self.gateway is None:
+            self.gateway = JavaGateway()
+        if self.mdp is None:
+            self.mdp = self.gateway.entry_point.reset_mdp()
+        return self.mdp, self.gateway
+
+    def index(self, node) -> int:
+        index = self.mapping.get(node)
+        if index is None:
+            index = len(self.mapping)
+            self.mapping[node] = index
+        return index
+
+    def sync(self, graph, reachable: set, dirty: set, choices_fn: Callable[[object, dict], Choices]):
+        """
+        Updates the java model in place
+        :param graph: the networkx graph of the StateStorage
+        :param reachable: the states which have to be in the model (descendants of the root within the horizon), all of them get a prism index
+        :param dirty: states whose outgoing edges changed (or which were removed) since the previous sync
+        :param choices_fn: generates the choices of a state from its successors
+        """
+        mdp, gateway = self.connect()
+        to_clear = [node for node in self.uploaded if node not in reachable or node in dirty]
+        to_upload = [node for node in reachable if node not in self.uploaded or node in dirty]
+        choices = []
+        for parent_id in to_upload:
+            self.index(parent_id)
+            parent_choices = choices_fn(parent_id, graph.adj[parent_id])
+            for action, distribution in parent_choices:
+                for successor_id, p in distribution:
+                    self.index(successor_id)
+            choices.append((parent_id, parent_choices))
+        if len(self.mapping) > self.n_states:
+            gateway.entry_point.add_states(len(self.mapping) - self.n_states)
+            self.n_states = len(self.mapping)
+        for node in to_clear:
+            mdp.clearState(self.mapping[node])
+            self.uploaded.discard(node)
+        with StandardProgressBar(prefix="Updating Prism ", max_value=len(choices) + 1).start() as bar:
+            for parent_id, parent_choices in choices:
+                for action, distribution_items in parent_choices:
+                    distribution = gateway.newDistribution()
+                    for successor_id, p in distribution_items:
+                        distribution.add(int(self.mapping[successor_id]), p)
+                    mdp.addActionLabelledChoice(int(self.mapping[parent_id]), distribution, action)
+                self.uploaded.add(parent_id)
+                bar.update(bar.value + 1)
+        print(f"Prism delta update: {len(to_clear)} states cleared, {len(choices)} states uploaded, {self.n_states} states in the model")
+        return mdp, gateway
+
+    def check(self, terminal_states: list, half_terminal_states: list):
+        """:return: the min probability of reaching terminal_states and the max probability of reaching half_terminal_states, indexed by prism state"""
+        terminal_states_java = ListConverter().convert([self.mapping[x] for x in terminal_states], self.gateway._gateway_client)
+        half_terminal_states_java = ListConverter().convert([self.mapping[x] for x in half_terminal_states], self.gateway._gateway_client)
+        solution_min = list(self.gateway.entry_point.check_state_list(terminal_states_java, True))
+        solution_max = list(self.gateway.entry_point.check_state_list(half_terminal_states_java, False))
+        return solution_min, solution_max
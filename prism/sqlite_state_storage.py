@@ -0,0 +1,350 @@
+import pickle
+import sqlite3
+from collections import OrderedDict, namedtuple
+from typing import Tuple, List
+
+from py4j.java_collections import ListConverter
+from py4j.java_gateway import JavaGateway
+
+from mosaic.hyperrectangle import HyperRectangle
+from prism.columnar_snapshot import FLAG_FAIL, FLAG_HALF_FAIL, FLAG_IGNORE, NODE_FLAGS
+from prism.state_storage import StateStorage
+from utility.standard_progressbar import StandardProgressBar
+
+ParentAction = namedtuple("ParentAction", ["action"])  # stands in for the parent node in StateStorage._choices_PPO
+
+
+def node_to_action(node):
+    """Nodes can be HyperRectangle(_action) or (interval tuple, action)"""
+    if hasattr(node, "intervals"):
+        return getattr(node, "action", None)
+    if isinstance(node, tuple) and len(node) == 2:
+        return node[1]
+    return None
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS nodes (id INTEGER PRIMARY KEY, key BLOB UNIQUE NOT NULL, has_action INTEGER NOT NULL, flags INTEGER NOT NULL DEFAULT 0,
+                                  lb REAL, ub REAL, depth INTEGER);
+CREATE TABLE IF NOT EXISTS edges (src INTEGER NOT NULL, dst INTEGER NOT NULL, p REAL, a TEXT, p_lb REAL, p_ub REAL, PRIMARY KEY (src, dst)) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS edges_dst ON edges (dst);
+CREATE INDEX IF NOT EXISTS nodes_depth ON nodes (depth);
+CREATE INDEX IF NOT EXISTS nodes_flags ON nodes (flags);
+CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value BLOB);
+"""
+EDGE_ATTRIBUTES = ["p", "a", "p_lb", "p_ub"]
+NODE_ATTRIBUTES = ["lb", "ub"]
+BATCH_SIZE = 500  # maximum number of parameters in a single IN (...) query
+
+
+class SQLiteStateStorage:
+    """
+    Disk-backed alternative to StateStorage for graphs that do not fit in memory.
+    Nodes are identified by their pickled bytes, a small LRU cache keeps the ids of the most recently used (frontier) nodes.
+    Depths from the root are stored in the database and recomputed level by level with set-based queries.
+    """
+
+    def __init__(self, db_path: str, cache_size: int = 100000):
+        self.db_path = db_path
+        self.cache_size = cache_size
+        self.connection = sqlite3.connect(db_path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+        self.id_cache = OrderedDict()  # node -> id
+        self.root = self._load_root()
+
+    def _load_root(self):
+        row = self.connection.execute("SELECT value FROM meta WHERE name = 'root'").fetchone()
+        return pickle.loads(row[0]) if row is not None else None
+
+    def set_root(self, root):
+        self.root = root
+        self.connection.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('root', ?)", (pickle.dumps(root),))
+        self._node_ids([root])
+
+    def reset(self):
+        print("Resetting the StateStorage")
+        self.connection.executescript("DROP TABLE IF EXISTS nodes; DROP TABLE IF EXISTS edges; DROP TABLE IF EXISTS meta;")
+        self.connection.executescript(SCHEMA)
+        self.connection.commit()
+        self.id_cache = OrderedDict()
+        self.root = None
+
+    def _cache(self, node, node_id):
+        self.id_cache[node] = node_id
+        self.id_cache.move_to_end(node)
+        if len(self.id_cache) > self.cache_size:
+            self.id_cache.popitem(last=False)
+
+    def _node_ids(self, nodes, create=True) -> List[int]:
+        """Returns the ids of the nodes, creating the missing ones with batched inserts. Ids of nodes not in the database are None if not create"""
+        result = dict()
+        missing = []
+        for node in nodes:
+            node_id = self.id_cache.get(node)
+            if node_id is not None:
+                self.id_cache.move_to_end(node)
+                result[node] = node_id
+            elif node not in result:
+                result[node] = None
+                missing.append(node)
+        if len(missing) != 0:
+            keys = {pickle.dumps(node, protocol=pickle.HIGHEST_PROTOCOL): node for node in missing}
+            if create:
+                self.connection.executemany("INSERT OR IGNORE INTO nodes (key, has_action) VALUES (?, ?)",
+                                            [(key, int(node_to_action(node) is not None)) for key, node in keys.items()])
+            key_list = list(keys.keys())
+            for i in range(0, len(key_list), BATCH_SIZE):
+                batch = key_list[i:i + BATCH_SIZE]
+                for node_id, key in self.connection.execute(f"SELECT id, key FROM nodes WHERE key IN ({','.join('?' * len(batch))})", batch):
+                    node = keys[bytes(key)]
+                    result[node] = node_id
+                    self._cache(node, node_id)
+        return [result[node] for node in nodes]
+
+    def _add_edges(self, edges: List[Tuple[HyperRectangle, HyperRectangle, dict]]):
+        if len(edges) == 0:
+            return
+        ids = self._node_ids([x for parent, successor, _ in edges for x in (parent, successor)])
+        rows = [(ids[2 * i], ids[2 * i + 1]) + tuple(eattr.get(name) for name in EDGE_ATTRIBUTES) for i, (_, _, eattr) in enumerate(edges)]
+        self.connection.executemany(f"INSERT OR REPLACE INTO edges (src, dst, {', '.join(EDGE_ATTRIBUTES)}) VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+    def store_successor_multi(self, items: List[Tuple[HyperRectangle, HyperRectangle]]):
+        # first element is parent
+        self._add_edges([(parent, successor, {"p": 1.0}) for parent, successor in items])
+
+    def store_successor_prob(self, items: List[Tuple[HyperRectangle, HyperRectangle, dict]]):
+        self._add_edges(items)
+
+    def store_sticky_successors(self, successor: HyperRectangle, sticky_successor: HyperRectangle, parent: HyperRectangle):
+        # we use a="a" to mark the successors belonging to the same distribution (as opposed to the successors of the split operation)
+        self._add_edges([(parent, successor, {"p": 0.8, "a": "a"}), (parent, sticky_successor, {"p": 0.2, "a": "a"})])
+
+    def remove_edges(self, edges: List[Tuple[HyperRectangle, HyperRectangle]]):
+        ids = self._node_ids([x for edge in edges for x in edge], create=False)
+        rows = [(ids[2 * i], ids[2 * i + 1]) for i in range(len(edges)) if ids[2 * i] is not None and ids[2 * i + 1] is not None]
+        self.connection.executemany("DELETE FROM edges WHERE src = ? AND dst = ?", rows)
+
+    def set_node_attributes(self, items: List[Tuple[HyperRectangle, dict]]):
+        ids = self._node_ids([node for node, _ in items])
+        flag_rows = []
+        value_rows = {name: [] for name in NODE_ATTRIBUTES}
+        for node_id, (node, attributes) in zip(ids, items):
+            flags = 0
+            for name, value in attributes.items():
+                if name in NODE_FLAGS:
+                    if value:
+                        flags |= NODE_FLAGS[name]
+                elif name in NODE_ATTRIBUTES:
+                    value_rows[name].append((value, node_id))
+                else:
+                    raise Exception(f"Attribute {name} is not supported by SQLiteStateStorage")
+            if flags != 0:
+                flag_rows.append((flags, node_id))
+        self.connection.executemany("UPDATE nodes SET flags = flags | ? WHERE id = ?", flag_rows)
+        for name, rows in value_rows.items():
+            self.connection.executemany(f"UPDATE nodes SET {name} = ? WHERE id = ?", rows)
+
+    def mark_as_ignore(self, states: List[HyperRectangle]):
+        self.set_node_attributes([(item, {'ignore': True}) for item in states])
+
+    def mark_as_half_fail(self, fail_states: List[HyperRectangle]):
+        self.set_node_attributes([(item, {'half_fail': True}) for item in fail_states])
+
+    def mark_as_fail(self, fail_states: List[HyperRectangle]):
+        self.set_node_attributes([(item, {'fail': True}) for item in fail_states])
+
+    @staticmethod
+    def _row_to_attributes(flags, lb, ub) -> dict:
+        attributes = {name: True for name, flag in NODE_FLAGS.items() if flags & flag}
+        if lb is not None:
+            attributes['lb'] = lb
+        if ub is not None:
+            attributes['ub'] = ub
+        return attributes
+
+    def get_node_attributes(self, node) -> dict:
+        node_id = self._node_ids([node], create=False)[0]
+        if node_id is None:
+            raise KeyError(node)
+        return self._row_to_attributes(*self.connection.execute("SELECT flags, lb, ub FROM nodes WHERE id = ?", (node_id,)).fetchone())
+
+    def nodes_with_attributes(self):
+        """Streams the nodes which have been assigned a probability, the others are never candidates for refinement"""
+        for key, flags, lb, ub in self.connection.execute("SELECT key, flags, lb, ub FROM nodes WHERE lb IS NOT NULL"):
+            yield pickle.loads(key), self._row_to_attributes(flags, lb, ub)
+
+    def predecessors(self, node) -> list:
+        node_id = self._node_ids([node], create=False)[0]
+        return [pickle.loads(key) for key, in self.connection.execute("SELECT n.key FROM edges e JOIN nodes n ON e.src = n.id WHERE e.dst = ?", (node_id,))]
+
+    def get_edge_data(self, parent, successor) -> dict:
+        ids = self._node_ids([parent, successor], create=False)
+        row = self.connection.execute(f"SELECT {', '.join(EDGE_ATTRIBUTES)} FROM edges WHERE src = ? AND dst = ?", ids).fetchone()
+        if row is None:
+            return None
+        return {name: value for name, value in zip(EDGE_ATTRIBUTES, row) if value is not None}
+
+    def recompute_depths(self):
+        """Breadth first search from the root, one set-based UPDATE per level"""
+        self.connection.execute("UPDATE nodes SET depth = NULL")
+        root_id = self._node_ids([self.root])[0]
+        self.connection.execute("UPDATE nodes SET depth = 0 WHERE id = ?", (root_id,))
+        level = 0
+        while True:
+            updated = self.connection.execute("UPDATE nodes SET depth = ? WHERE depth IS NULL AND id IN (SELECT e.dst FROM edges e JOIN nodes n ON e.src = n.id WHERE n.depth = ?)",
+                                              (level + 1, level)).rowcount
+            if updated == 0:
+                break
+            level += 1
+        self.connection.commit()
+
+    def shortest_path_length(self):
+        self.recompute_depths()
+        return DepthView(self)
+
+    def get_leaves(self, path_length, unsafe_threshold, horizon):
+        """The path_length argument is kept for compatibility with StateStorage, depths are read from the database"""
+        query = "SELECT key, depth, lb, ub FROM nodes WHERE flags & ? = 0 AND has_action = 0 AND ub IS NOT NULL AND depth IS NOT NULL AND depth <= ? " \
+                "AND NOT EXISTS (SELECT 1 FROM edges WHERE src = nodes.id)"
+        return [(pickle.loads(key), depth, lb, ub) for key, depth, lb, ub in self.connection.execute(query, (FLAG_FAIL | FLAG_HALF_FAIL | FLAG_IGNORE, horizon))]
+
+    def get_terminal_states_ids(self, half=False, max_depth=None):
+        """Returns the database ids of the (half) terminal states reachable within max_depth"""
+        flag = FLAG_FAIL | FLAG_HALF_FAIL if half else FLAG_FAIL
+        query = "SELECT id FROM nodes WHERE flags & ? != 0 AND depth IS NOT NULL" + (" AND depth <= ?" if max_depth is not None else "")
+        return [node_id for node_id, in self.connection.execute(query, (flag, max_depth) if max_depth is not None else (flag,))]
+
+    def remove_unreachable(self) -> int:
+        self.recompute_depths()
+        self.connection.execute("DELETE FROM edges WHERE src IN (SELECT id FROM nodes WHERE depth IS NULL) OR dst IN (SELECT id FROM nodes WHERE depth IS NULL)")
+        removed = self.connection.execute("DELETE FROM nodes WHERE depth IS NULL").rowcount
+        self.connection.commit()
+        self.id_cache = OrderedDict()
+        print(f"removed {removed} unreachable nodes")
+        return removed
+
+    def _database_size(self) -> int:
+        return self.connection.execute("PRAGMA page_count").fetchone()[0] * self.connection.execute("PRAGMA page_size").fetchone()[0]
+
+    def compact(self) -> dict:
+        """
+        Same as StateStorage.compact, additionally renumbers the node ids so that they are contiguous again (they are used as prism state indices)
+        and vacuums the database file
+        """
+        n_edges = self.connection.execute("SELECT COUNT(*) FROM edges").fetchone()[0]
+        n_ignored = self.connection.execute("SELECT COUNT(*) FROM nodes WHERE flags & ? != 0", (FLAG_IGNORE,)).fetchone()[0]
+        size_before = self._database_size()
+        removed = self.remove_unreachable()
+        # renumber through negative ids to avoid transient primary key collisions
+        self.connection.executescript("""
+            CREATE TEMP TABLE remap AS SELECT id AS old, -ROW_NUMBER() OVER (ORDER BY id) AS new FROM nodes;
+            CREATE INDEX temp.remap_old ON remap (old);
+            UPDATE nodes SET id = (SELECT new FROM remap WHERE old = nodes.id);
+            UPDATE nodes SET id = -id - 1;
+            UPDATE edges SET src = (SELECT new FROM remap WHERE old = edges.src), dst = (SELECT new FROM remap WHERE old = edges.dst);
+            UPDATE edges SET src = -src - 1, dst = -dst - 1;
+            DROP TABLE remap;
+        """)
+        self.connection.commit()
+        self.id_cache = OrderedDict()
+        self.connection.execute("VACUUM")
+        stats = {"removed_nodes": removed,
+                 "removed_ignored_nodes": n_ignored - self.connection.execute("SELECT COUNT(*) FROM nodes WHERE flags & ? != 0", (FLAG_IGNORE,)).fetchone()[0],
+                 "removed_edges": n_edges - self.connection.execute("SELECT COUNT(*) FROM edges").fetchone()[0], "reclaimed_bytes": size_before - self._database_size()}
+        print(f"Compaction removed {stats['removed_nodes']} nodes ({stats['removed_ignored_nodes']} ignored) and {stats['removed_edges']} edges, "
+              f"reclaimed ~{stats['reclaimed_bytes'] / 2 ** 20:.1f} MiB")
+        return stats
+
+    def save_state(self, folder_path=None, compact=False):
+        """The database is always on disk, saving only commits the pending transaction"""
+        self.connection.commit()
+        if compact:
+            self.connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        print("Mdp Saved")
+
+    def load_state(self, folder_path=None):
+        self.root = self._load_root()
+        print("Mdp Loaded")
+        return self.root is not None
+
+    def recreate_prism(self, max_t: int = None):
+        return self._recreate_prism(max_t, ppo=False)
+
+    def recreate_prism_PPO(self, max_t: int = None):
+        return self._recreate_prism(max_t, ppo=True)
+
+    def _recreate_prism(self, max_t, ppo: bool):
+        self.recompute_depths()
+        gateway = JavaGateway()
+        mdp = gateway.entry_point.reset_mdp()
+        n_states = self.connection.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM nodes").fetchone()[0]  # prism state i is the node with id i
+        gateway.entry_point.add_states(n_states)
+        max_depth = max_t * 2 if max_t is not None else None  # limit descendants to depth max_t
+        depth_filter = " AND n.depth <= ?" if max_depth is not None else ""
+        parameters = (max_depth,) if max_depth is not None else ()
+        n_descendants = self.connection.execute(f"SELECT COUNT(*) FROM nodes n WHERE n.depth IS NOT NULL{depth_filter}", parameters).fetchone()[0]
+        query = f"SELECT e.src, n.key, n.has_action, e.dst, e.p, e.a, e.p_lb, e.p_ub FROM edges e JOIN nodes n ON e.src = n.id WHERE n.depth IS NOT NULL{depth_filter} ORDER BY e.src"
+        choices_fn = StateStorage._choices_PPO if ppo else StateStorage._choices
+        with StandardProgressBar(prefix="Updating Prism ", max_value=n_descendants + 1).start() as bar:
+            current_src = None
+            successors = dict()
+            for src, key, has_action, dst, p, a, p_lb, p_ub in self.connection.execute(query, parameters):
+                if src != current_src:
+                    if current_src is not None:
+                        self._add_choices(gateway, mdp, current_src, choices_fn(parent, successors))
+                        bar.update(bar.value + 1)
+                    current_src, successors = src, dict()
+                    parent = ParentAction(node_to_action(pickle.loads(key)) if ppo and has_action else None)
+                successors[dst] = {"p": p, "a": a, "p_lb": p_lb, "p_ub": p_ub}
+            if current_src is not None:
+                self._add_choices(gateway, mdp, current_src, choices_fn(parent, successors))
+        terminal_states_java = ListConverter().convert(self.get_terminal_states_ids(max_depth=max_depth), gateway._gateway_client)
+        half_terminal_states_java = ListConverter().convert(self.get_terminal_states_ids(half=True, max_depth=max_depth), gateway._gateway_client)
+        # get probabilities from prism to encounter a terminal state
+        solution_min = list(gateway.entry_point.check_state_list(terminal_states_java, True))
+        solution_max = list(gateway.entry_point.check_state_list(half_terminal_states_java, False))
+        # update the probabilities in the database
+        descendants = [node_id for node_id, in self.connection.execute(f"SELECT n.id FROM nodes n WHERE n.depth IS NOT NULL{depth_filter}", parameters)]
+        self.connection.executemany("UPDATE nodes SET lb = ?, ub = ? WHERE id = ?", [(solution_min[node_id], solution_max[node_id], node_id) for node_id in descendants])
+        self.connection.commit()
+        print("Prism updated with new data")
+        self.prism_needs_update = False
+        return mdp, gateway
+
+    @staticmethod
+    def _add_choices(gateway, mdp, src: int, choices: list):
+        """Uploads the choices generated by StateStorage._choices or _choices_PPO, successors are database ids"""
+        for action, distribution_items in choices:
+            distribution = gateway.newDistribution()
+            for dst, p in distribution_items:
+                distribution.add(int(dst), p)
+            mdp.addActionLabelledChoice(int(src), distribution, action)
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
+
+
+class DepthView:
+    """Read-only mapping node -> depth backed by the database, used in place of the dictionary returned by nx.shortest_path_length"""
+
+    def __init__(self, storage: SQLiteStateStorage):
+        self.storage = storage
+
+    def get(self, node, default=None):
+        node_id = self.storage._node_ids([node], create=False)[0]
+        if node_id is None:
+            return default
+        depth = self.storage.connection.execute("SELECT depth FROM nodes WHERE id = ?", (node_id,)).fetchone()[0]
+        return default if depth is None else depth
+
+    def __getitem__(self, node):
+        depth = self.get(node)
+        if depth is None:
+            raise KeyError(node)
+        return depth
+
+    def __contains__(self, node):
+        return self.get(node) is not None
@@ -1,64 +1,190 @@
 import os
+import pickle
+import sys
 from collections import defaultdict
 from typing import Tuple, List
 
 import networkx as nx
-from py4j.java_collections import ListConverter
-from py4j.java_gateway import JavaGateway
 
 from mosaic.hyperrectangle import HyperRectangle, HyperRectangle_action
 from utility.standard_progressbar import StandardProgressBar
 import tempfile
 import mosaic.utils
+import prism.columnar_snapshot
+import prism.prism_session
+
+
+def graph_memory(graph: nx.DiGraph) -> int:
+    """Approximate size in bytes of the adjacency and attribute dictionaries of the graph, the nodes themselves are not counted"""
+    size = sys.getsizeof(graph._node) + sys.getsizeof(graph._succ) + sys.getsizeof(graph._pred)
+    for node, attributes in graph._node.items():
+        size += sys.getsizeof(attributes) + sys.getsizeof(graph._succ[node]) + sys.getsizeof(graph._pred[node])
+        size += sum(sys.getsizeof(eattr) for eattr in graph._succ[node].values())
+    return size
 
 
 class StateStorage:
-    def __init__(self):
+    def __init__(self, compaction_ratio: float = 0.5, max_pending_mutations: int = 1000000):
+        """
+        :param compaction_ratio: when the number of mutations appended to the log since the last snapshot exceeds this fraction of the graph size
+        (nodes + edges), the next save_state writes a full snapshot and truncates the log
+        :param max_pending_mutations: when more mutations than this are waiting for a save_state, they are dropped and the next save writes a full snapshot
+        """
         self.graph: nx.DiGraph = nx.DiGraph()
         self.root = None
+        self.compaction_ratio = compaction_ratio
+        self.max_pending_mutations = max_pending_mutations
+        self.pending_mutations = []  # mutations not yet written to disk: List[Tuple[str, list]]
+        self.n_pending_mutations = 0
+        self.n_logged_mutations = 0  # mutations in the log file since the last snapshot
+        self.snapshot_path = None  # the snapshot the log refers to
+        self.prism_session = prism.prism_session.PrismSession()  # kept across recreate_prism calls
+        self.prism_choices_fn = None
+        self.prism_dirty = set()  # states whose choices changed since the last update of prism
 
     def reset(self):
         print("Resetting the StateStorage")
         self.graph = nx.DiGraph()
         self.root = None
+        self.pending_mutations = []
+        self.n_pending_mutations = 0
+        self.n_logged_mutations = 0
+        self.snapshot_path = None
+        self.prism_session.invalidate()
+        self.prism_dirty = set()
+
+    def _log_mutation(self, operation: str, items: list):
+        """Record a graph mutation so that the next save_state can append it to the log instead of rewriting the whole graph"""
+        if len(items) != 0:
+            if self.snapshot_path is not None:  # without a snapshot the next save_state writes the whole graph anyway
+                self.pending_mutations.append((operation, items))
+                self.n_pending_mutations += len(items)
+                if self.n_pending_mutations > self.max_pending_mutations:  # stop logging, the next save_state writes a full snapshot
+                    self.pending_mutations = []
+                    self.n_pending_mutations = 0
+                    self.snapshot_path = None
+            if operation == "add_edges" or operation == "remove_edges":
+                self.prism_dirty.update(item[0] for item in items)
+            elif operation == "remove_nodes":
+                self.prism_dirty.update(items)
+
+    def _apply_mutation(self, operation: str, items: list):
+        """Replay a mutation read from the log, must mirror what the public methods do to the graph"""
+        if operation == "add_edges":
+            self.graph.add_edges_from(items)
+        elif operation == "remove_edges":
+            self.graph.remove_edges_from(items)
+        elif operation == "remove_nodes":
+            self.graph.remove_nodes_from(items)
+        elif operation == "node_attributes":
+            for node, attributes in items:
+                self.graph.add_node(node)
+                self.graph.nodes[node].update(attributes)
+        else:
+            raise Exception(f"Unknown mutation {operation}")
 
     def store_successor_multi(self, items: List[Tuple[HyperRectangle, HyperRectangle]]):
         # first element is parent
 
         self.graph.add_edges_from(items, p=1.0)
+        self._log_mutation("add_edges", [(parent, successor, {"p": 1.0}) for parent, successor in items])
 
     def store_successor_prob(self, items: List[Tuple[HyperRectangle, HyperRectangle, dict]]):
         for item in items:
             parent, successor, properties = item
             self.graph.add_edge(parent, successor, **properties)
+        self._log_mutation("add_edges", [(parent, successor, dict(properties)) for parent, successor, properties in items])
 
     def store_sticky_successors(self, successor: HyperRectangle, sticky_successor: HyperRectangle, parent: HyperRectangle):
         # we use a="a" to mark the successors belonging to the same distribution (as opposed to the successors of the split operation)
         self.graph.add_edge(parent, successor, p=0.8, a="a")
         self.graph.add_edge(parent, sticky_successor, p=0.2, a="a")  # same action
+        self._log_mutation("add_edges", [(parent, successor, {"p": 0.8, "a": "a"}), (parent, sticky_successor, {"p": 0.2, "a": "a"})])
 
-    def save_state(self, folder_path):
-        nx.write_gpickle(self.graph, folder_path)
-        print("Mdp Saved")
+    def remove_edges(self, edges: List[Tuple[HyperRectangle, HyperRectangle]]):
+        self.graph.remove_edges_from(edges)
+        self._log_mutation("remove_edges", list(edges))
+
+    def set_node_attributes(self, items: List[Tuple[HyperRectangle, dict]]):
+        """Update the attributes of the given nodes, only the values that actually change are recorded in the log"""
+        changed = []
+        for node, attributes in items:
+            self.graph.add_node(node)
+            node_attributes = self.graph.nodes[node]
+            delta = {key: value for key, value in attributes.items() if key not in node_attributes or node_attributes[key] != value}
+            if len(delta) != 0:
+                node_attributes.update(delta)
+                changed.append((node, delta))
+        self._log_mutation("node_attributes", changed)
+
+    def mark_as_ignore(self, states: List[HyperRectangle]):
+        self.set_node_attributes([(item, {'ignore': True}) for item in states])
+
+    def save_state(self, folder_path, compact=False):
+        """
+        Saves the graph to folder_path. The first save (or a compaction) writes a full snapshot, the following ones only append the mutations
+        performed since the previous save to folder_path.log, so the cost of a checkpoint is proportional to the work done in the meantime.
+        :param compact: force a full snapshot and truncate the log
+        """
+        log_path = f"{folder_path}.log"
+        graph_size = self.graph.number_of_nodes() + self.graph.number_of_edges()
+        n_pending = self.n_pending_mutations
+        if compact or folder_path != self.snapshot_path or not os.path.exists(folder_path) or self.n_logged_mutations + n_pending > self.compaction_ratio * graph_size:
+            # write the snapshot aside and swap it in, a crash while writing leaves the previous snapshot and its log intact
+            tmp_path = f"{folder_path}.tmp"
+            nx.write_gpickle(self.graph, tmp_path)
+            os.replace(tmp_path, folder_path)
+            if os.path.exists(log_path):
+                os.remove(log_path)
+            self.n_logged_mutations = 0
+            self.snapshot_path = folder_path
+            print("Mdp Saved")
+        else:
+            with open(log_path, 'ab') as f:
+                pickle.dump(self.pending_mutations, f, protocol=pickle.HIGHEST_PROTOCOL)
+            self.n_logged_mutations += n_pending
+            print(f"Mdp Saved ({n_pending} mutations appended to the log)")
+        self.pending_mutations = []
+        self.n_pending_mutations = 0
 
     def load_state(self, folder_path):
         if os.path.exists(folder_path):
             self.graph = nx.read_gpickle(folder_path)
+            self.pending_mutations = []
+            self.n_pending_mutations = 0
+            self.n_logged_mutations = 0
+            log_path = f"{folder_path}.log"
+            if os.path.exists(log_path):
+                with open(log_path, 'rb') as f:
+                    while True:
+                        try:
+                            mutations = pickle.load(f)
+                        except EOFError:
+                            break
+                        except pickle.UnpicklingError:
+                            print("Truncated record found at the end of the log, ignoring it")
+                            break
+                        for operation, items in mutations:
+                            self._apply_mutation(operation, items)
+                            self.n_logged_mutations += len(items)
+                print(f"Replayed {self.n_logged_mutations} mutations from the log")
+            self.snapshot_path = folder_path
+            self.prism_session.invalidate()
             print("Mdp Loaded")
             return True
         else:
             print(f"{folder_path} does not exist")
             return False
 
+    def save_columnar(self, folder_path):
+        """Saves the graph as memory-mappable numpy columns, to be opened with prism.columnar_snapshot.ColumnarMDP"""
+        prism.columnar_snapshot.save_columnar(self.graph, self.root, folder_path)
+
     def mark_as_half_fail(self, fail_states: List[HyperRectangle]):
-        for item in fail_states:
-            self.graph.add_node(item)
-            self.graph.nodes[item]['half_fail'] = True
+        self.set_node_attributes([(item, {'half_fail': True}) for item in fail_states])
 
     def mark_as_fail(self, fail_states: List[HyperRectangle]):
-        for item in fail_states:
-            self.graph.add_node(item)
-            self.graph.nodes[item]['fail'] = True
+        self.set_node_attributes([(item, {'fail': True}) for item in fail_states])
 
     def get_terminal_states_ids(self, half=False, dict_filter=None):
         result = []
@@ -77,91 +203,100 @@ class StateStorage:
         # return list([x[0] for x in possible_fail_states if x[1]])
         return result
 
-    def remove_unreachable(self):
-        descendants = list(nx.algorithms.descendants(self.graph, self.root))  # descendants from 0
-        descendants.insert(0, self.root)
-        descendants_dict = defaultdict(bool)
-        for descendant in descendants:
-            descendants_dict[descendant] = True
-        to_remove = []
-        for parent_id, successors in self.graph.adjacency():  # generate the edges
-            if not descendants_dict[parent_id]:
-                to_remove.append(parent_id)
-        for id in to_remove:
-            print(f"removed {id}")
-            self.graph.remove_node(id)
-
-    def get_leaves(self, shortest_path, unsafe_threshold, horizon):
-        leaves = [(interval, len(shortest_path[interval]) - 1, attributes.get('lb'), attributes.get('ub')) for interval, attributes in self.graph.nodes.data() if
+    def remove_unreachable(self, verbose=True) -> list:
+        reachable = nx.algorithms.descendants(self.graph, self.root)  # descendants from 0
+        reachable.add(self.root)
+        to_remove = [node for node in self.graph.nodes if node not in reachable]
+        if verbose:
+            for id in to_remove:
+                print(f"removed {id}")
+        self.graph.remove_nodes_from(to_remove)
+        self._log_mutation("remove_nodes", to_remove)
+        return to_remove
+
+    def compact(self) -> dict:
+        """
+        Garbage-collects the nodes which can not be reached from the root anymore, together with their edges.
+        This removes the parents replaced by perform_split (marked as ignore and unlinked from their predecessors) and every subtree left hanging below them.
+        Ignored nodes which are still reachable are kept because their bounds are part of the distribution of their parent.
+        :return: statistics about the reclaimed nodes, edges and (approximate) memory in bytes
+        """
+        n_edges = self.graph.number_of_edges()
+        memory_before = graph_memory(self.graph)
+        n_ignored = sum(1 for _, ignore in self.graph.nodes.data("ignore") if ignore)
+        removed = self.remove_unreachable(verbose=False)
+        self.prism_session.invalidate()  # renumber the prism states from scratch
+        stats = {"removed_nodes": len(removed), "removed_ignored_nodes": n_ignored - sum(1 for _, ignore in self.graph.nodes.data("ignore") if ignore),
+                 "removed_edges": n_edges - self.graph.number_of_edges(), "reclaimed_bytes": memory_before - graph_memory(self.graph)}
+        print(f"Compaction removed {stats['removed_nodes']} nodes ({stats['removed_ignored_nodes']} ignored) and {stats['removed_edges']} edges, "
+              f"reclaimed ~{stats['reclaimed_bytes'] / 2 ** 20:.1f} MiB")
+        return stats
+
+    def shortest_path_length(self):
+        """Length of the shortest path from the root for every reachable node"""
+        return nx.shortest_path_length(self.graph, source=self.root)
+
+    def nodes_with_attributes(self):
+        return self.graph.nodes.data()
+
+    def get_node_attributes(self, node) -> dict:
+        return self.graph.nodes[node]
+
+    def predecessors(self, node) -> list:
+        return list(self.graph.predecessors(node))
+
+    def get_edge_data(self, parent, successor) -> dict:
+        return self.graph.get_edge_data(parent, successor)
+
+    def get_leaves(self, path_length, unsafe_threshold, horizon):
+        leaves = [(interval, path_length[interval], attributes.get('lb'), attributes.get('ub')) for interval, attributes in self.graph.nodes.data() if
                   self.graph.out_degree(interval) == 0 and not attributes.get('half_fail') and not attributes.get('fail') and interval.action is None and not attributes.get(
-                      'ignore') and attributes.get('ub') is not None and interval in shortest_path and len(shortest_path[interval]) - 1 <= horizon]
+                      'ignore') and attributes.get('ub') is not None and interval in path_length and path_length[interval] <= horizon]
         return leaves
 
     def recreate_prism(self, max_t: int = None):
-        gateway = JavaGateway()
-        mdp = gateway.entry_point.reset_mdp()
-        gateway.entry_point.add_states(self.graph.number_of_nodes())
-        path_length = nx.shortest_path_length(self.graph, source=self.root)
-        # descendants = list(path_length.keys())  # descendants from 0
-        # descendants.insert(0, self.root)
-        descendants_dict = defaultdict(bool)
-        descendants_true = []  # = list(descendants_dict.keys())
-        for descendant in path_length.keys():
-            if max_t is None or path_length[descendant] <= max_t * 2:  # limit descendants to depth max_t
-                descendants_dict[descendant] = True
-                descendants_true.append(descendant)
-        to_remove = []
-        mapping = dict(zip(self.graph.nodes(), range(self.graph.number_of_nodes())))
-        with StandardProgressBar(prefix="Updating Prism ", max_value=len(descendants_dict) + 1).start() as bar:
-            for parent_id, successors in self.graph.adjacency():  # generate the edges
-                if descendants_dict[parent_id]:
-                    if len(successors.items()) != 0:  # filter out non-reachable states
-                        values = set()  # extract action names
-                        for successor_id, eattr in successors.items():
-                            values.add(eattr.get("a"))
-                        group_by_action = [(x, [(successor_id, eattr) for successor_id, eattr in successors.items() if eattr.get("a") == x]) for x in values]  # group successors by action names
-                        for action, successors_grouped in group_by_action:
-
-                            if action is None:  # a new action for each successor
-                                for successor_id, eattr in successors_grouped:
-                                    distribution = gateway.newDistribution()
-                                    distribution.add(int(mapping[successor_id]), 1.0)
-                                    mdp.addActionLabelledChoice(int(mapping[parent_id]), distribution, action)
-                            else:
-                                distribution = gateway.newDistribution()
-                                for successor_id, eattr in successors_grouped:
-                                    p = eattr.get("p")
-                                    assert p is not None
-                                    distribution.add(int(mapping[successor_id]), p)
-                                mdp.addActionLabelledChoice(int(mapping[parent_id]), distribution, action)  # int(mapping[successor_id])
-                    else:
-                        # zero successors
-                        pass
-                    bar.update(bar.value + 1)  # else:  # print(f"Non descending item found")  # to_remove.append(parent_id)  # pass
-        # for id in to_remove:
-        # print(f"removed {id}")
-        # self.graph.remove_node(id)
-        terminal_states = [mapping[x] for x in self.get_terminal_states_ids(dict_filter=descendants_dict)]
-        half_terminal_states = [mapping[x] for x in self.get_terminal_states_ids(half=True, dict_filter=descendants_dict)]
-        terminal_states_java = ListConverter().convert(terminal_states, gateway._gateway_client)
-        half_terminal_states_java = ListConverter().convert(half_terminal_states, gateway._gateway_client)
-        # get probabilities from prism to encounter a terminal state
-        solution_min = list(gateway.entry_point.check_state_list(terminal_states_java, True))
-        solution_max = list(gateway.entry_point.check_state_list(half_terminal_states_java, False))
-        # update the probabilities in the graph
-        with StandardProgressBar(prefix="Updating probabilities in the graph ", max_value=len(descendants_true)) as bar:
-            for descendant in descendants_true:
-                self.graph.nodes[descendant]['ub'] = solution_max[mapping[descendant]]
-                self.graph.nodes[descendant]['lb'] = solution_min[mapping[descendant]]
-                bar.update(bar.value + 1)
-        print("Prism updated with new data")
-        self.prism_needs_update = False
-        return mdp, gateway
+        return self._update_prism(max_t, self._choices)
 
     def recreate_prism_PPO(self, max_t: int = None):
-        gateway = JavaGateway()
-        mdp = gateway.entry_point.reset_mdp()
-        gateway.entry_point.add_states(self.graph.number_of_nodes())
+        return self._update_prism(max_t, self._choices_PPO)
+
+    @staticmethod
+    def _choices(parent_id, successors: dict) -> prism.prism_session.Choices:
+        values = set()  # extract action names
+        for successor_id, eattr in successors.items():
+            values.add(eattr.get("a"))
+        choices = []
+        for action in values:  # group successors by action names
+            successors_grouped = [(successor_id, eattr) for successor_id, eattr in successors.items() if eattr.get("a") == action]
+            if action is None:  # a new action for each successor
+                for successor_id, eattr in successors_grouped:
+                    choices.append((action, [(successor_id, 1.0)]))
+            else:
+                distribution = []
+                for successor_id, eattr in successors_grouped:
+                    p = eattr.get("p")
+                    assert p is not None
+                    distribution.append((successor_id, p))
+                choices.append((action, distribution))
+        return choices
+
+    @staticmethod
+    def _choices_PPO(parent_id: HyperRectangle_action, successors: dict) -> prism.prism_session.Choices:
+        if len(successors) == 0:  # leaves have no choices, prism treats them as deadlock states
+            return []
+        distribution = []
+        for successor in successors:
+            eattr = successors[successor]
+            p = (eattr.get("p_ub") + eattr.get("p_lb")) / 2
+            assert p is not None
+            distribution.append((successor, p))
+        if parent_id.action is None:  # action choice (probabilistic)
+            return [(parent_id.action, distribution)]
+        else:  # action transition
+            return [(parent_id.action, [item]) for item in distribution]
+
+    def _update_prism(self, max_t, choices_fn):
+        """Sends to prism only the states changed since the previous call, then updates the probabilities in the graph"""
         path_length = nx.shortest_path_length(self.graph, source=self.root)
         descendants_dict = defaultdict(bool)
         descendants_true = []
@@ -169,50 +304,22 @@ class StateStorage:
             if max_t is None or path_length[descendant] <= max_t * 2:  # limit descendants to depth max_t
                 descendants_dict[descendant] = True
                 descendants_true.append(descendant)
-        to_remove = []
-        mapping = dict(zip(self.graph.nodes(), range(self.graph.number_of_nodes())))
-        with StandardProgressBar(prefix="Updating Prism ", max_value=len(descendants_dict) + 1).start() as bar:
-            for parent_id, successors in self.graph.adjacency():  # generate the edges
-                if descendants_dict[parent_id]:
-                    if len(successors.items()) != 0:  # filter out non-reachable states
-                        if parent_id.action is None:  # action choice (probabilistic)
-                            distribution = gateway.newDistribution()
-                            successor: HyperRectangle_action
-                            for successor in successors:
-                                eattr = successors[successor]
-                                p = (eattr.get("p_ub")+eattr.get("p_lb"))/2
-                                assert p is not None
-                                distribution.add(int(mapping[successor]), p)
-                            mdp.addActionLabelledChoice(int(mapping[parent_id]), distribution, parent_id.action)
-                        else:  # action transition
-                            for successor in successors:
-                                distribution = gateway.newDistribution()
-                                eattr = successors[successor]
-                                p = (eattr.get("p_ub")+eattr.get("p_lb"))/2
-                                assert p is not None
-                                distribution.add(int(mapping[successor]), p)
-                                mdp.addActionLabelledChoice(int(mapping[parent_id]), distribution, parent_id.action)
-
-                    else:
-                        # zero successors
-                        pass
-                    bar.update(bar.value + 1)  # else:  # print(f"Non descending item found")  # to_remove.append(parent_id)  # pass
-        # for id in to_remove:
-        # print(f"removed {id}")
-        # self.graph.remove_node(id)
-        terminal_states = [mapping[x] for x in self.get_terminal_states_ids(dict_filter=descendants_dict)]
-        half_terminal_states = [mapping[x] for x in self.get_terminal_states_ids(half=True, dict_filter=descendants_dict)]
-        terminal_states_java = ListConverter().convert(terminal_states, gateway._gateway_client)
-        half_terminal_states_java = ListConverter().convert(half_terminal_states, gateway._gateway_client)
+        if self.prism_choices_fn is not choices_fn:  # switching between recreate_prism and recreate_prism_PPO
+            self.prism_session.invalidate()
+            self.prism_choices_fn = choices_fn
+        mdp, gateway = self.prism_session.sync(self.graph, set(descendants_true), self.prism_dirty, choices_fn)
+        self.prism_dirty = set()
         # get probabilities from prism to encounter a terminal state
-        solution_min = list(gateway.entry_point.check_state_list(terminal_states_java, True))
-        solution_max = list(gateway.entry_point.check_state_list(half_terminal_states_java, False))
+        solution_min, solution_max = self.prism_session.check(self.get_terminal_states_ids(dict_filter=descendants_dict),
+                                                              self.get_terminal_states_ids(half=True, dict_filter=descendants_dict))
         # update the probabilities in the graph
+        mapping = self.prism_session.mapping
         with StandardProgressBar(prefix="Updating probabilities in the graph ", max_value=len(descendants_true)) as bar:
+            probabilities = []
             for descendant in descendants_true:
-                self.graph.nodes[descendant]['ub'] = solution_max[mapping[descendant]]
-                self.graph.nodes[descendant]['lb'] = solution_min[mapping[descendant]]
+                probabilities.append((descendant, {'ub': solution_max[mapping[descendant]], 'lb': solution_min[mapping[descendant]]}))
                 bar.update(bar.value + 1)
+            self.set_node_attributes(probabilities)
         print("Prism updated with new data")
         self.prism_needs_update = False
         return mdp, gateway
@@ -0,0 +1,30 @@
+from collections import namedtuple
+from unittest import TestCase
+from unittest.mock import MagicMock
+
+import networkx as nx
+
+from prism.prism_session import PrismSession
+from prism.state_storage import StateStorage
+
+Node = namedtuple("Node", ["name", "action"])
+
+
+class TestPrismSession(TestCase):
+    def test_sync_leaves_have_no_choices(self):
+        root = Node("root", None)
+        left, right = Node("left", 0), Node("right", 1)
+        leaf_left, leaf_right = Node("leaf_left", None), Node("leaf_right", None)
+        graph = nx.DiGraph()
+        graph.add_edge(root, left, p=0.3, p_lb=0.2, p_ub=0.4)
+        graph.add_edge(root, right, p=0.7, p_lb=0.6, p_ub=0.8)
+        graph.add_edge(left, leaf_left, p=1.0, p_lb=1.0, p_ub=1.0)
+        graph.add_edge(right, leaf_right, p=1.0, p_lb=1.0, p_ub=1.0)
+        for choices_fn, n_root_choices in ((StateStorage._choices, 2), (StateStorage._choices_PPO, 1)):
+            session = PrismSession()
+            session.gateway = MagicMock()
+            session.sync(graph, set(graph.nodes), set(), choices_fn)
+            states = [call.args[0] for call in session.mdp.addActionLabelledChoice.call_args_list]
+            assert session.mapping[leaf_left] not in states and session.mapping[leaf_right] not in states
+            assert sorted(states) == sorted([session.mapping[root]] * n_root_choices + [session.mapping[left], session.mapping[right]])
+            assert session.uploaded == set(graph.nodes)
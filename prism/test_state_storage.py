@@ -0,0 +1,172 @@
+import os
+import tempfile
+from unittest import TestCase, mock
+
+from prism.columnar_snapshot import ColumnarMDP
+from prism.state_storage import StateStorage
+
+
+class TestStateStorageLog(TestCase):
+    def test_log_replay(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "nx_graph.p")
+            storage = StateStorage(compaction_ratio=10)
+            storage.store_successor_multi([("root", "a"), ("root", "b")])
+            storage.save_state(path)  # first save is a snapshot
+            assert not os.path.exists(f"{path}.log")
+            storage.store_sticky_successors("c", "d", "a")
+            storage.mark_as_fail(["c"])
+            storage.remove_edges([("root", "b")])
+            storage.set_node_attributes([("a", {"lb": 0.1, "ub": 0.5})])
+            storage.save_state(path)
+            assert os.path.exists(f"{path}.log")
+
+            loaded = StateStorage()
+            assert loaded.load_state(path)
+            assert set(loaded.graph.edges) == set(storage.graph.edges)
+            assert loaded.graph.nodes["c"]["fail"]
+            assert loaded.graph.nodes["a"]["ub"] == 0.5
+            assert loaded.graph.edges["a", "d"]["p"] == 0.2
+
+    def test_compaction(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "nx_graph.p")
+            storage = StateStorage(compaction_ratio=0)
+            storage.store_successor_multi([("root", "a")])
+            storage.save_state(path)
+            storage.store_successor_multi([("a", "b")])
+            storage.save_state(path)  # exceeds the ratio, rewrites the snapshot
+            assert not os.path.exists(f"{path}.log")
+            loaded = StateStorage()
+            loaded.load_state(path)
+            assert loaded.graph.has_edge("a", "b")
+
+    def test_interrupted_snapshot(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "nx_graph.p")
+            storage = StateStorage(compaction_ratio=10)
+            storage.store_successor_multi([("root", "a")])
+            storage.save_state(path)
+            storage.store_successor_multi([("a", "b")])
+            storage.save_state(path)  # appended to the log
+            storage.store_successor_multi([("b", "c")])
+
+            def crash(graph, tmp_path):
+                open(tmp_path, "wb").write(b"partial")
+                raise KeyboardInterrupt()
+
+            with mock.patch("prism.state_storage.nx.write_gpickle", side_effect=crash), self.assertRaises(KeyboardInterrupt):
+                storage.save_state(path, compact=True)
+            loaded = StateStorage()
+            assert loaded.load_state(path)  # the previous snapshot and its log are intact
+            assert set(loaded.graph.edges) == {("root", "a"), ("a", "b")}
+            storage.save_state(path, compact=True)
+            assert not os.path.exists(f"{path}.log") and not os.path.exists(f"{path}.tmp")
+
+    def test_compact(self):
+        with tempfile.TemporaryDirectory() as folder:
+            storage = StateStorage()
+            storage.root = "root"
+            storage.store_successor_multi([("root", "a"), ("a", "b"), ("b", "c")])
+            storage.save_state(os.path.join(folder, "nx_graph.p"))
+            storage.store_successor_prob([("root", "b1", {"p": 1.0}), ("root", "b2", {"p": 1.0})])  # split of b
+            storage.remove_edges([("a", "b")])
+            storage.mark_as_ignore(["b"])
+            stats = storage.compact()
+            assert stats["removed_nodes"] == 2 and stats["removed_ignored_nodes"] == 1 and stats["removed_edges"] == 1
+            assert set(storage.graph.nodes) == {"root", "a", "b1", "b2"}
+            assert ("remove_nodes", ["b", "c"]) in storage.pending_mutations
+
+    def test_pending_mutations_bounded(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "nx_graph.p")
+            storage = StateStorage(compaction_ratio=10, max_pending_mutations=3)
+            storage.store_successor_multi([("root", "a"), ("root", "b")])
+            assert storage.pending_mutations == []  # nothing to append to before the first snapshot
+            storage.save_state(path)
+            storage.store_successor_multi([("a", "c"), ("a", "d")])
+            assert storage.n_pending_mutations == 2
+            storage.store_successor_multi([("b", "e"), ("b", "f")])
+            assert storage.pending_mutations == [] and storage.snapshot_path is None
+            storage.store_successor_multi([("c", "g")])
+            assert storage.pending_mutations == []
+            storage.save_state(path)  # full snapshot
+            assert not os.path.exists(f"{path}.log")
+            loaded = StateStorage()
+            loaded.load_state(path)
+            assert set(loaded.graph.edges) == set(storage.graph.edges)
+
+    def test_columnar_snapshot(self):
+        with tempfile.TemporaryDirectory() as folder:
+            storage = StateStorage()
+            root = (((0.0, 1.0), (0.0, 1.0)), None)
+            left = (((0.0, 0.5), (0.0, 1.0)), True)
+            right = (((0.5, 1.0), (0.0, 1.0)), False)
+            successor = (((0.2, 0.7), (0.1, 1.0)), None)
+            storage.root = root
+            storage.store_successor_multi([(root, left), (root, right)])
+            storage.store_sticky_successors(successor, successor, left)
+            storage.set_node_attributes([(successor, {"lb": 0.25, "ub": 0.75})])
+            storage.mark_as_fail([right])
+            storage.save_columnar(folder)
+
+            mdp = ColumnarMDP(folder)
+            assert list(mdp.depths()) == [0, 1, 1, 2]
+            assert mdp.get_n_states(2) == [1, 2]
+            assert mdp.get_property_at_timestep(2, ["lb", "ub"]) == [(successor, 0.25, 0.75)]
+            assert mdp.get_property_at_timestep(1, ["fail"])[1] == (right, True)
+
+    def test_columnar_snapshot_empty(self):
+        with tempfile.TemporaryDirectory() as folder:
+            storage = StateStorage()
+            storage.save_columnar(folder)
+
+            mdp = ColumnarMDP(folder)
+            assert mdp.n_nodes == 0 and mdp.n_edges == 0
+            for name in ["bounds", "action", "flags", "lb", "ub", "edge_src", "edge_dst", "edge_sticky", "p", "p_lb", "p_ub"]:
+                assert len(mdp.column(name)) == 0, name
+            assert list(mdp.depths()) == [] and list(mdp.out_degree()) == []
+            assert mdp.get_property_at_timestep(0, ["lb", "ub"]) == []
+
+    def test_sqlite_storage(self):
+        from prism.sqlite_state_storage import SQLiteStateStorage
+        with tempfile.TemporaryDirectory() as folder:
+            storage = SQLiteStateStorage(os.path.join(folder, "mdp.sqlite"), cache_size=2)
+            root = (((0.0, 1.0),), None)
+            left = (((0.0, 0.5),), True)
+            right = (((0.5, 1.0),), False)
+            successor = (((0.2, 0.7),), None)
+            storage.set_root(root)
+            storage.store_successor_multi([(root, left), (root, right)])
+            storage.store_sticky_successors(successor, successor, left)
+            storage.set_node_attributes([(successor, {"lb": 0.25, "ub": 0.75})])
+            storage.mark_as_fail([right])
+            path_length = storage.shortest_path_length()
+            assert path_length[successor] == 2 and right in path_length
+            assert storage.get_leaves(path_length, 0.1, 4) == [(successor, 2, 0.25, 0.75)]
+            assert storage.get_node_attributes(right) == {"fail": True}
+            assert storage.predecessors(successor) == [left]
+            assert storage.get_edge_data(left, successor) == {"p": 0.2, "a": "a"}
+            storage.save_state()
+            storage.close()
+            loaded = SQLiteStateStorage(os.path.join(folder, "mdp.sqlite"))
+            assert loaded.root == root
+
+    def test_sqlite_recreate_prism(self):
+        from prism.sqlite_state_storage import SQLiteStateStorage
+        with tempfile.TemporaryDirectory() as folder, mock.patch("prism.sqlite_state_storage.JavaGateway") as java_gateway, mock.patch("prism.sqlite_state_storage.ListConverter"):
+            storage = SQLiteStateStorage(os.path.join(folder, "mdp.sqlite"))
+            root = (((0.0, 1.0),), None)
+            left = (((0.0, 0.5),), True)
+            right = (((0.5, 1.0),), False)
+            successor = (((0.2, 0.7),), None)
+            storage.set_root(root)
+            storage.store_successor_multi([(root, left), (root, right)])
+            storage.store_sticky_successors(successor, successor, left)
+            java_gateway.return_value.entry_point.check_state_list.return_value = [0.5] * 5  # prism state i is the node with id i, ids start from 1
+            mdp, gateway = storage.recreate_prism()
+            root_id, left_id, right_id, successor_id = storage._node_ids([root, left, right, successor], create=False)
+            choices = [(call.args[0], call.args[2]) for call in mdp.addActionLabelledChoice.call_args_list]
+            assert sorted(choices, key=str) == sorted([(root_id, None), (root_id, None), (left_id, "a")], key=str)  # right and successor are leaves
+            assert storage.get_node_attributes(root) == {"lb": 0.5, "ub": 0.5}
+            storage.close()
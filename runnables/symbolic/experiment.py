@@ -16,7 +16,11 @@ from datetime import datetime
 from symbolic.unroll_methods import get_n_states
 
 
-def experiment(env_name="cartpole", horizon: int = 8, abstract: bool = True, rounding: int = 3, *, folder_path="/home/edoardo/Development/SafeDRL/save", max_iterations=-1, load_only=False):
+def experiment(env_name="cartpole", horizon: int = 8, abstract: bool = True, rounding: int = 3, *, folder_path="/home/edoardo/Development/SafeDRL/save", max_iterations=-1, load_only=False,
+               compaction_interval: int = 10):
+    """
+    :param compaction_interval: garbage-collect the nodes made unreachable by the splits every compaction_interval iterations (0 disables it)
+    """
     gym.logger.set_level(40)
     os.chdir(os.path.expanduser("~/Development") + "/SafeDRL")
     local_mode = False
@@ -59,7 +63,7 @@ def experiment(env_name="cartpole", horizon: int = 8, abstract: bool = True, rou
                 remainings.append(interval)
             assigned_intervals, ignore_intervals = unroll_methods.assign_action_to_blank_intervals(remainings, explorer, verification_model, n_workers,
                                                                                                    rounding)  # compute the action in each single state
-            storage.graph.add_edges_from([(storage.root, x) for x in assigned_intervals], p=1.0)  # assign single intervals as direct successors of root
+            storage.store_successor_multi([(storage.root, x) for x in assigned_intervals])  # assign single intervals as direct successors of root
             next_to_compute = unroll_methods.compute_successors(env_class, assigned_intervals, n_workers, rounding, storage)  # compute successors and store result in graph
             storage.save_state(f"{folder_path}/nx_graph_{environment_name}_e{rounding}_{env_type}.p")
     if not load_only:
@@ -69,6 +73,8 @@ def experiment(env_name="cartpole", horizon: int = 8, abstract: bool = True, rou
         time_from_last_save = time.time()
         while True:
             print(f"Iteration {iterations}")
+            if compaction_interval > 0 and iterations != 0 and iterations % compaction_interval == 0:
+                storage.compact()
             split_performed = unroll_methods.probability_iteration(storage, rtree, precision, rounding, env_class, n_workers, explorer, verification_model, state_size, horizon=horizon,
                                                                    allow_assign_actions=True, allow_merge=abstract)
             if time.time() - time_from_last_save >= 60 * 2:
@@ -82,7 +88,9 @@ def experiment(env_name="cartpole", horizon: int = 8, abstract: bool = True, rou
                 break
             iterations += 1
         # %%
-        storage.save_state(f"{folder_path}/nx_graph_{environment_name}_e{rounding}_{env_type}.p")
+        storage.compact()
+        storage.save_state(f"{folder_path}/nx_graph_{environment_name}_e{rounding}_{env_type}.p", compact=True)
+        storage.save_columnar(f"{folder_path}/columnar_{environment_name}_e{rounding}_{env_type}")  # for post-hoc analysis with prism.columnar_snapshot.ColumnarMDP
         rtree.save_to_file(f"{folder_path}/union_states_total_{environment_name}_e{rounding}_{env_type}.p")
         print(f"End time: {datetime.now():%d/%m/%Y %H:%M:%S}")
     return storage, rtree
@@ -0,0 +1,34 @@
+from unittest import TestCase
+
+import torch
+
+from plnn.verification_network import VerificationNetwork
+
+
+class TestVerificationNetwork(TestCase):
+    def test_get_boundaries_batch(self):
+        torch.manual_seed(0)
+        base_network = torch.nn.Sequential(torch.nn.Linear(4, 16), torch.nn.ReLU(), torch.nn.Linear(16, 2))
+        net = VerificationNetwork(base_network)
+        lower = torch.rand(8, 4) - 0.5
+        domains = torch.stack([lower, lower + 0.1], dim=1)  # [B,2,d]
+        upper_bound, lower_bound = net.get_boundaries_batch(domains, 1)
+        assert upper_bound.shape == (8,) and lower_bound.shape == (8,)
+        samples = domains[:, 0, :].unsqueeze(1) + (domains[:, 1, :] - domains[:, 0, :]).unsqueeze(1) * torch.rand(8, 100, 4)
+        outputs = net.forward_verif(samples.reshape(-1, 4), 1).reshape(8, 100)
+        assert bool((outputs >= lower_bound.unsqueeze(1) - 1e-5).all())
+        assert bool((outputs <= upper_bound.unsqueeze(1) + 1e-5).all())
+
+    def test_get_upper_bounds_batch(self):
+        torch.manual_seed(0)
+        base_network = torch.nn.Sequential(torch.nn.Linear(4, 16), torch.nn.ReLU(), torch.nn.Linear(16, 2))
+        net = VerificationNetwork(base_network)
+        lower = torch.rand(8, 4) - 0.5
+        domains = torch.stack([lower, lower + 0.1], dim=-1)  # [B,d,2]
+        points, values = net.get_upper_bounds_batch(domains, 1)
+        assert points.shape == (8, 4) and values.shape == (8,)
+        assert bool((points >= domains[:, :, 0]).all()) and bool((points <= domains[:, :, 1]).all())
+        assert torch.allclose(net.forward_verif(points, 1).squeeze(1), values)
+        samples = domains[:, :, 0].unsqueeze(1) + (domains[:, :, 1] - domains[:, :, 0]).unsqueeze(1) * torch.rand(8, 1000, 4)
+        outputs = net.forward_verif(samples.reshape(-1, 4), 1).reshape(8, 1000)
+        assert bool((values <= outputs.min(dim=1)[0] + 1e-5).all())
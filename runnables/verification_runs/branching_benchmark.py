@@ -0,0 +1,18 @@
+"""Compares the branching strategies of plnn.branching (and the neuron splits of the symbolic explorer) by number of domains and wall time needed to cover the same cartpole domain"""
+import time
+
+from mosaic.hyperrectangle import HyperRectangle
+from plnn.branching import STRATEGIES, NEURON
+from utility.domain_explorers_load import generateCartpoleDomainExplorer
+
+rounding = 3
+precision = 10 ** (-rounding)
+explorer, verification_model, env, s, state_size, env_class = generateCartpoleDomainExplorer(precision, rounding, sym=True)
+domain = HyperRectangle.from_tuple(((-0.05, 0.05), (-0.05, 0.05), (-0.05, 0.05), (-0.05, 0.05)))
+results = dict()
+for branching in STRATEGIES + (NEURON,):
+    explorer.branching = branching
+    start = time.time()
+    stats = explorer.explore(verification_model, [domain], n_workers=1, debug=False)
+    results[branching] = (stats["n_states"], time.time() - start)
+    print(f"{branching}: {stats['n_states']} domains in {results[branching][1]:.2f}s (safe:{stats['safe_relative_percentage']:.3%}, unsafe:{stats['unsafe_relative_percentage']:.3%})")
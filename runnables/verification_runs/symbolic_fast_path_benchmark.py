@@ -0,0 +1,30 @@
+"""Compares the scripted symbolic interval propagation with the Interval_network one on the cartpole and pendulum policies (time and largest difference)"""
+import time
+
+import torch
+
+import plnn.interval_network_cache
+from plnn.interval_network_cache import get_interval_network, interval_bounds
+from symbolic.symbolic_interval import Symbolic_interval
+from utility.domain_explorers_load import generateCartpoleDomainExplorer, generatePendulumDomainExplorer
+
+rounding = 3
+precision = 10 ** (-rounding)
+n_repeats = 10
+for name, generate in (("cartpole", generateCartpoleDomainExplorer), ("pendulum", generatePendulumDomainExplorer)):
+    explorer, verification_model, env, s, state_size, env_class = generate(precision, rounding, sym=True)
+    inet = get_interval_network(verification_model.base_network, 1)
+    for batch_size in (100, 1000, 10000):
+        lower = torch.rand(batch_size, state_size, dtype=torch.float64) * 2 - 1
+        upper = lower + 0.05
+        results = dict()
+        for scripted in (False, True):
+            plnn.interval_network_cache.use_scripted = scripted
+            for _ in range(3):  # warm up the TorchScript profiling executor
+                interval_bounds(inet, Symbolic_interval(lower=lower, upper=upper))
+            start = time.time()
+            for _ in range(n_repeats):
+                u, l = interval_bounds(inet, Symbolic_interval(lower=lower, upper=upper))
+            results[scripted] = ((time.time() - start) / n_repeats, u, l)
+        difference = max((results[False][1] - results[True][1]).abs().max().item(), (results[False][2] - results[True][2]).abs().max().item())
+        print(f"{name} batch {batch_size}: Interval_network {results[False][0]:.4f}s, scripted {results[True][0]:.4f}s, largest difference {difference:.2e}")
@@ -170,13 +170,27 @@ class Symbolic_interval(Interval):
 
     * :attr:`edep` keeps the error dependency introduced by each
       overestimated nodes.
+
+    * :attr:`edep_budget` is the maximum number of error terms kept in
+      edep for each sample, the smallest ones are consolidated into
+      edep_proj by consolidate_edep. None keeps all of them.
+
+    * :attr:`edep_proj` keeps the consolidated error terms as an
+      independent error range for each node (None if there are none).
+
+    * :attr:`outward_rounding` adds a bound on the floating point error
+      of every linear layer (see rounding_error) to edep_proj, which
+      keeps the bounds sound in low precision (e.g. float32).
     '''
 
-    def __init__(self, lower, upper, epsilon=0, norm="linf", use_cuda=False):
+    def __init__(self, lower, upper, epsilon=0, norm="linf", use_cuda=False, edep_budget=None, outward_rounding=False):
         assert lower.shape[0] == upper.shape[0], "each symbolic" + "should have the same shape"
 
         Interval.__init__(self, lower, upper)
         self.use_cuda = use_cuda
+        self.edep_budget = edep_budget
+        self.edep_proj = None
+        self.outward_rounding = outward_rounding
         self.shape = list(self.c.shape[1:])
         self.n = list(self.c[0].reshape(-1).size())[0]
         self.input_size = self.n
@@ -217,6 +231,8 @@ class Symbolic_interval(Interval):
             # print("sym e1", e)
             for i in range(len(self.edep)):
                 e = e + self.edep_ind[i].t().mm(self.edep[i].abs())  # print("sym e2", e)
+        if self.edep_proj is not None:
+            e = e + self.edep_proj.abs()
 
         self.l = self.c - e
         self.u = self.c + e
@@ -232,6 +248,8 @@ class Symbolic_interval(Interval):
 
         for i in range(len(self.edep)):
             self.edep[i] = self.edep[i].reshape(-1, self.n)
+        if self.edep_proj is not None:
+            self.edep_proj = self.edep_proj.reshape(self.batch_size, self.n)
 
     '''Convert the extended layer back to the shape stored in `shape`.
     '''
@@ -242,6 +260,8 @@ class Symbolic_interval(Interval):
 
         for i in range(len(self.edep)):
             self.edep[i] = self.edep[i].reshape(tuple([-1] + self.shape))
+        if self.edep_proj is not None:
+            self.edep_proj = self.edep_proj.reshape(tuple([-1] + self.shape))
 
     '''Calculate the wrost case of the analyzed output ranges.
     Return the upper bound of other output dependency minus target's
@@ -268,6 +288,11 @@ class Symbolic_interval(Interval):
             edep_t = self.edep[i].masked_select((self.edep_ind[i].mm(kk.type_as(self.edep_ind[i]))).type_as(kk)).view(-1, 1)
             self.edep[i] = self.edep[i] - edep_t
 
+        if self.edep_proj is not None:
+            edep_proj_t = self.edep_proj.masked_select(kk)
+            self.edep_proj = self.edep_proj + edep_proj_t.view(-1, 1)
+            self.edep_proj = self.edep_proj * (1 - kk).type_as(self.edep_proj)
+
         self.concretize()
 
         return self.u
@@ -275,10 +300,10 @@ class Symbolic_interval(Interval):
 
 class mix_interval(Symbolic_interval):
 
-    def __init__(self, lower, upper, epsilon=0, norm="linf", use_cuda=False):
+    def __init__(self, lower, upper, epsilon=0, norm="linf", use_cuda=False, edep_budget=None):
         assert lower.shape[0] == upper.shape[0], "each symbolic" + "should have the same shape"
 
-        Symbolic_interval.__init__(self, lower, upper)
+        Symbolic_interval.__init__(self, lower, upper, edep_budget=edep_budget)
         self.use_cuda = use_cuda
         self.shape = list(self.c.shape[1:])
         self.n = list(self.c[0].reshape(-1).size())[0]
@@ -324,6 +349,8 @@ class mix_interval(Symbolic_interval):
             # print("sym e1", e)
             for i in range(len(self.edep)):
                 e = e + self.edep_ind[i].t().mm(self.edep[i].abs())  # print("sym e2", e)
+        if self.edep_proj is not None:
+            e = e + self.edep_proj.abs()
 
         self.l = self.c - e
         self.u = self.c + e
@@ -342,6 +369,8 @@ class mix_interval(Symbolic_interval):
 
         for i in range(len(self.edep)):
             self.edep[i] = self.edep[i].reshape(-1, self.n)
+        if self.edep_proj is not None:
+            self.edep_proj = self.edep_proj.reshape(self.batch_size, self.n)
 
         self.nc = self.nc.reshape(self.batch_size, self.n)
         self.ne = self.ne.reshape(self.batch_size, self.n)
@@ -357,6 +386,8 @@ class mix_interval(Symbolic_interval):
 
         for i in range(len(self.edep)):
             self.edep[i] = self.edep[i].reshape(tuple([-1] + self.shape))
+        if self.edep_proj is not None:
+            self.edep_proj = self.edep_proj.reshape(tuple([-1] + self.shape))
 
         self.nc = self.nc.reshape(tuple([-1] + self.shape))
         self.ne = self.ne.reshape(tuple([-1] + self.shape))
@@ -388,6 +419,11 @@ class mix_interval(Symbolic_interval):
             edep_t = self.edep[i].masked_select((self.edep_ind[i].mm(kk.type_as(self.edep_ind[i]))).type_as(kk)).view(-1, 1)
             self.edep[i] = self.edep[i] - edep_t
 
+        if self.edep_proj is not None:
+            edep_proj_t = self.edep_proj.masked_select(kk)
+            self.edep_proj = self.edep_proj + edep_proj_t.view(-1, 1)
+            self.edep_proj = self.edep_proj * (1 - kk).type_as(self.edep_proj)
+
         self.concretize()
 
         return self.u
@@ -472,13 +508,18 @@ class Symbolic_interval_proj1(Interval):
 
     * :attr:`edep` keeps the error dependency introduced by each
       overestimated nodes.
+
+    * :attr:`edep_budget` is the maximum number of error terms kept in
+      edep for each sample, the smallest ones are consolidated into
+      idep_proj by consolidate_edep. None keeps all of them.
     '''
 
-    def __init__(self, lower, upper, proj=None, proj_ind=None, use_cuda=False):
+    def __init__(self, lower, upper, proj=None, proj_ind=None, use_cuda=False, edep_budget=None):
         assert lower.shape[0] == upper.shape[0], "each symbolic" + "should have the same shape"
 
         Interval.__init__(self, lower, upper)
         self.use_cuda = use_cuda
+        self.edep_budget = edep_budget
         self.shape = list(self.c.shape[1:])
         self.n = list(self.c[0].reshape(-1).size())[0]
         self.input_size = self.n
@@ -771,8 +812,96 @@ class gen_sym(Symbolic_interval):
             # print("sym e1", e)
             for i in range(len(self.edep)):
                 e = e + self.edep_ind[i].t().mm(self.edep[i].abs())  # print("sym e2", e)
+        if self.edep_proj is not None:
+            e = e + self.edep_proj.abs()
 
         self.l = self.c - e
         self.u = self.c + e
 
         return self
+
+
+'''Consolidation of the error dependencies.
+
+Every ReLU layer with overestimated nodes adds one error term (a row of
+edep) per overestimated node, and every following layer and concretize
+pay for all of them. When a sample has more than ix.edep_budget terms,
+its largest ones (by l1 norm) are kept and the others are replaced by
+the sum of their absolute values as an independent error range for
+each node, which contains them. It is propagated like idep_proj of
+Symbolic_interval_proj1 (and added to it for that class): the bounds of
+the current layer are unchanged and the following ones stay sound, only
+the correlation of the consolidated errors across nodes is lost. The
+remaining terms are kept in a single edep block.
+'''
+
+
+def consolidate_edep(ix):
+    budget = ix.edep_budget
+    if budget is None or len(ix.edep) == 0:
+        return ix
+    sample = torch.cat([edep_ind.argmax(dim=1) for edep_ind in ix.edep_ind])
+    counts = torch.bincount(sample, minlength=ix.batch_size)
+    if int(counts.max().item()) <= budget:
+        return ix
+    edep = torch.cat([e.reshape(-1, ix.n) for e in ix.edep])
+    # rank of each term among the ones of its sample, by decreasing magnitude
+    order = torch.argsort(edep.abs().sum(dim=1), descending=True)
+    order = order[torch.sort(sample[order], stable=True)[1]]
+    start = torch.cumsum(counts, dim=0) - counts
+    rank = torch.empty_like(order)
+    rank[order] = torch.arange(order.size(0), device=order.device) - start[sample[order]]
+    keep = rank < budget
+    consolidated = edep.new_zeros((ix.batch_size, ix.n)).index_add_(0, sample[~keep], edep[~keep].abs())
+    if isinstance(ix, Symbolic_interval_proj1):
+        ix.idep_proj = ix.idep_proj + consolidated.view(ix.idep_proj.shape)
+    elif ix.edep_proj is None:
+        ix.edep_proj = consolidated
+    else:
+        ix.edep_proj = ix.edep_proj + consolidated.view(ix.edep_proj.shape)
+    edep_ind = ix.edep_ind[0].new_zeros((int(keep.sum().item()), ix.batch_size))
+    edep_ind = edep_ind.scatter_(1, sample[keep][:, None], 1)
+    ix.edep = [edep[keep].reshape([-1] + list(ix.edep[0].shape[1:]))]
+    ix.edep_ind = [edep_ind]
+    return ix
+
+
+'''Bound on the floating point error of a linear layer.
+
+* :attr:`magnitude` bounds the absolute value of the inputs [B, k] and
+  n_terms is the number of terms summed for each output (k plus the
+  input and error dependencies of the symbolic intervals).
+With the unit roundoff u of the dtype, the error of a sum of n products
+is at most gamma_n = n * u / (1 - n * u) times the sum of their absolute
+values. The bound is doubled as a margin for the rounding of the bound
+itself and of the ReLU relaxation.
+'''
+
+
+def rounding_error(magnitude, weight, bias, n_terms):
+    unit_roundoff = torch.finfo(magnitude.dtype).eps / 2
+    n = n_terms + 4
+    gamma = n * unit_roundoff / (1 - n * unit_roundoff)
+    error = magnitude.matmul(weight.abs().t())
+    if bias is not None:
+        error = error + bias.abs()
+    return 2 * gamma * error
+
+
+'''Casts the bounds of a box to dtype rounding them outward.
+
+* :attr:`lower` and :attr:`upper` are tensors of the same shape.
+Rounding to nearest can move a bound inside the box, so the cast box
+would not contain the original one and a verdict on it would not hold
+at the edges of the original domain. A bound that landed inside is
+moved to the next representable value towards -inf (lower) or +inf
+(upper).
+'''
+
+
+def outward_cast(lower, upper, dtype):
+    lower_cast = lower.to(dtype)
+    upper_cast = upper.to(dtype)
+    lower_cast = torch.where(lower_cast.to(lower.dtype) > lower, torch.nextafter(lower_cast, torch.full_like(lower_cast, -np.inf)), lower_cast)
+    upper_cast = torch.where(upper_cast.to(upper.dtype) < upper, torch.nextafter(upper_cast, torch.full_like(upper_cast, np.inf)), upper_cast)
+    return lower_cast, upper_cast
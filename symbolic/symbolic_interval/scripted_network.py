@@ -0,0 +1,90 @@
+'''
+Scripted symbolic interval propagation for Linear/ReLU networks.
+
+It computes the same bounds as propagating a Symbolic_interval through
+an Interval_network made of Interval_Dense, Interval_ReLU and
+Interval_Flatten layers (flat inputs only), without the isinstance
+dispatch of the interval layers. The error dependencies are kept as a
+dense [B, m, n] tensor instead of the edep/edep_ind lists, so there is
+no [m, B] index matrix: each ReLU layer adds as many error terms as the
+largest number of unstable nodes of a sample (padded with zeros). The
+transposed weights are prepared once per network and the whole loop is
+compiled with TorchScript.
+'''
+
+from typing import List, Tuple
+
+import torch
+
+from .symbolic_network import Interval_Dense, Interval_ReLU, Interval_Flatten
+
+
+@torch.jit.script
+def symbolic_linear_relu(lower: torch.Tensor, upper: torch.Tensor, weights: List[torch.Tensor], biases: List[torch.Tensor],
+                         relu_after: List[bool]) -> Tuple[torch.Tensor, torch.Tensor]:
+    c = (upper + lower) / 2
+    e = ((upper - lower) / 2).unsqueeze(2)
+    idep = torch.eye(c.shape[1], dtype=c.dtype, device=c.device).unsqueeze(0)
+    edep = torch.zeros((c.shape[0], 0, c.shape[1]), dtype=c.dtype, device=c.device)
+    lower_bound = lower
+    upper_bound = upper
+    for i in range(len(weights)):
+        c = torch.addmm(biases[i], c, weights[i])
+        idep = idep.matmul(weights[i])
+        edep = edep.matmul(weights[i])
+        radius = (idep * e).abs().sum(dim=1) + edep.abs().sum(dim=1)
+        lower_bound = c - radius
+        upper_bound = c + radius
+        if relu_after[i]:
+            # same relaxation as Interval_ReLU for Symbolic_interval
+            lower_clamped = lower_bound.clamp(max=0)
+            upper_clamped = torch.max(upper_bound.clamp(min=0), lower_clamped + 1e-8)
+            mask = upper_clamped / (upper_clamped - lower_clamped)
+            unstable = (lower_bound < 0) & (upper_bound > 0)
+            appr_err = torch.where(unstable, mask * (-lower_clamped) / 2.0, torch.zeros_like(mask))
+            c = c * mask + appr_err
+            idep = idep * mask.unsqueeze(1)
+            # one error term per unstable node, padded to the largest number of unstable nodes of a sample
+            n_unstable = int(unstable.sum(dim=1).max())
+            order = torch.argsort(unstable.to(torch.int8), dim=1, descending=True)[:, :n_unstable]
+            error_rows = torch.zeros((c.shape[0], n_unstable, c.shape[1]), dtype=c.dtype, device=c.device)
+            error_rows = error_rows.scatter_(2, order.unsqueeze(2), appr_err.gather(1, order).unsqueeze(2))
+            edep = torch.cat([edep * mask.unsqueeze(1), error_rows], dim=1)
+    return lower_bound, upper_bound
+
+
+def scripted_parameters(inet):
+    '''The (transposed weights, biases, relu_after) of a Linear/ReLU
+    Interval_network, cached on it. None if it has other layers.
+    '''
+    if hasattr(inet, "_scripted_parameters"):
+        return inet._scripted_parameters
+    weights, biases, relu_after = [], [], []
+    supported = True
+    for layer in inet.net:
+        if isinstance(layer, Interval_Dense) and isinstance(layer.layer, torch.nn.Linear):
+            weight = layer.layer.weight.detach()
+            weights.append(weight.t().contiguous())
+            biases.append(layer.layer.bias.detach() if layer.layer.bias is not None else weight.new_zeros(weight.shape[0]))
+            relu_after.append(False)
+        elif isinstance(layer, Interval_ReLU) and len(relu_after) != 0 and not relu_after[-1]:
+            relu_after[-1] = True
+        elif not isinstance(layer, Interval_Flatten):
+            supported = False
+            break
+    inet._scripted_parameters = (weights, biases, relu_after) if supported and len(weights) != 0 else None
+    return inet._scripted_parameters
+
+
+def scripted_bounds(inet, lower, upper):
+    '''
+    :return: the lower and upper bounds [B, n] of the output of inet for the input boxes [lower, upper], None if inet is not a Linear/ReLU network
+    '''
+    parameters = scripted_parameters(inet)
+    if parameters is None or lower.dim() != 2:
+        return None
+    weights, biases, relu_after = parameters
+    if weights[0].dtype != lower.dtype or weights[0].device != lower.device:
+        return None
+    with torch.no_grad():
+        return symbolic_linear_relu(lower, upper, weights, biases, relu_after)
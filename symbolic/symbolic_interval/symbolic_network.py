@@ -22,7 +22,7 @@ import torch.nn.functional as F
 from torch.autograd import Variable
 
 from .interval import Interval, Symbolic_interval, mix_interval, Inverse_interval, Center_symbolic_interval
-from .interval import Symbolic_interval_proj1, Symbolic_interval_proj2, gen_sym
+from .interval import Symbolic_interval_proj1, Symbolic_interval_proj2, gen_sym, consolidate_edep, rounding_error
 import time
 
 
@@ -77,6 +77,75 @@ class Interval_network(nn.Module):
         return ix
         '''
 
+    '''Backward (CROWN-style) linear bound propagation.
+
+    * :attr:`lower` and `upper` are the bounds [B, n] of the input box.
+    A forward symbolic interval pass gives the pre-activation bounds of
+    every ReLU, then the linear relaxation of the network is propagated
+    backward from the output of the last linear layer. When the output
+    has only a few rows (e.g. the property layer) this is both cheaper
+    and tighter than the forward idep. The result is intersected with
+    the forward bounds and the layers after the last linear layer (e.g.
+    Softmax) are applied to it. Only Linear/ReLU/Flatten networks on
+    flat inputs are supported.
+    '''
+
+    def backward_bounds(self, lower, upper):
+        layers = list(self.net)
+        last_dense = max(i for i, layer in enumerate(layers) if isinstance(layer, Interval_Dense))
+        ix = Symbolic_interval(lower=lower, upper=upper, use_cuda=lower.is_cuda)
+        pre_bounds = dict()  # index of the ReLU -> bounds of its input
+        for i, layer in enumerate(layers[:last_dense + 1]):
+            if isinstance(layer, Interval_ReLU):
+                pre_bounds[i] = (ix.l, ix.u)
+            elif not isinstance(layer, (Interval_Dense, Interval_Flatten)):
+                raise Exception('Type of layer not supported')
+            ix = layer(ix)
+        forward_l, forward_u = ix.l, ix.u
+
+        weight = layers[last_dense].layer.weight
+        bias = layers[last_dense].layer.bias
+        lambda_l = weight.unsqueeze(0).expand(lower.shape[0], -1, -1)  # [B, m, n] coefficients of the lower bound
+        lambda_u = lambda_l
+        bias_l = torch.zeros(lower.shape[0], weight.shape[0], dtype=weight.dtype, device=weight.device)
+        if bias is not None:
+            bias_l = bias_l + bias
+        bias_u = bias_l
+        for i in reversed(range(last_dense)):
+            layer = layers[i]
+            if isinstance(layer, Interval_Dense):
+                if layer.layer.bias is not None:
+                    bias_l = bias_l + lambda_l.matmul(layer.layer.bias)
+                    bias_u = bias_u + lambda_u.matmul(layer.layer.bias)
+                lambda_l = lambda_l.matmul(layer.layer.weight)
+                lambda_u = lambda_u.matmul(layer.layer.weight)
+            elif isinstance(layer, Interval_ReLU):
+                l, u = pre_bounds[i]
+                unstable = (l < 0) & (u > 0)
+                active = (l >= 0).type_as(l)
+                # upper relaxation a <= slope * z + intercept, lower relaxation a >= alpha * z
+                slope = torch.where(unstable, u / (u - l).clamp(min=1e-12), active)
+                intercept = torch.where(unstable, -l * slope, torch.zeros_like(l))
+                alpha = torch.where(unstable, (u > -l).type_as(l), active)
+                slope, intercept, alpha = slope.unsqueeze(1), intercept.unsqueeze(1), alpha.unsqueeze(1)
+                bias_l = bias_l + (lambda_l.clamp(max=0) * intercept).sum(dim=2)
+                lambda_l = lambda_l.clamp(min=0) * alpha + lambda_l.clamp(max=0) * slope
+                bias_u = bias_u + (lambda_u.clamp(min=0) * intercept).sum(dim=2)
+                lambda_u = lambda_u.clamp(min=0) * slope + lambda_u.clamp(max=0) * alpha
+
+        center = ((lower + upper) / 2).type_as(weight).unsqueeze(-1)
+        radius = ((upper - lower) / 2).type_as(weight).unsqueeze(-1)
+        backward_l = lambda_l.matmul(center).squeeze(-1) - lambda_l.abs().matmul(radius).squeeze(-1) + bias_l
+        backward_u = lambda_u.matmul(center).squeeze(-1) + lambda_u.abs().matmul(radius).squeeze(-1) + bias_u
+        result_l = torch.max(backward_l, forward_l)
+        result_u = torch.min(backward_u, forward_u)
+        if last_dense + 1 < len(layers):
+            ix = Symbolic_interval(lower=result_l, upper=result_u, use_cuda=lower.is_cuda)
+            for layer in layers[last_dense + 1:]:
+                ix = layer(ix)
+            result_l, result_u = ix.l, ix.u
+        return result_l, result_u
+
 
 class Interval_Dense(nn.Module):
     def __init__(self, layer, first_layer=False, wc_matrix=None):
@@ -103,6 +172,8 @@ class Interval_Dense(nn.Module):
             ix.idep = F.linear(ix.idep, self.layer.weight)
             for i in range(len(ix.edep)):
                 ix.edep[i] = F.linear(ix.edep[i], self.layer.weight)
+            if ix.edep_proj is not None:
+                ix.edep_proj = F.linear(ix.edep_proj, self.layer.weight.abs())
             ix.shape = list(ix.c.shape[1:])
             ix.n = list(ix.c[0].view(-1).size())[0]
 
@@ -129,10 +200,18 @@ class Interval_Dense(nn.Module):
 
         if (isinstance(ix, Symbolic_interval)):  # normally we use this layer
             # print (ix.c.shape, self.layer.weight.shape)
+            if ix.outward_rounding:
+                # the inputs of the layer are within the bounds of the previous one (the ReLU relaxation does not widen them)
+                n_terms = self.layer.in_features + ix.input_size + sum(int(edep_ind.sum(dim=0).max().item()) for edep_ind in ix.edep_ind)
+                error = rounding_error(torch.max(ix.l.abs(), ix.u.abs()).reshape(ix.batch_size, -1), self.layer.weight, self.layer.bias, n_terms)
             ix.c = F.linear(ix.c, self.layer.weight, bias=self.layer.bias)
             ix.idep = F.linear(ix.idep, self.layer.weight)
             for i in range(len(ix.edep)):
                 ix.edep[i] = F.linear(ix.edep[i], self.layer.weight)
+            if ix.edep_proj is not None:
+                ix.edep_proj = F.linear(ix.edep_proj, self.layer.weight.abs())
+            if ix.outward_rounding:
+                ix.edep_proj = error if ix.edep_proj is None else ix.edep_proj + error
             ix.shape = list(ix.c.shape[1:])
             ix.n = list(ix.c[0].view(-1).size())[0]
             ix.concretize()
@@ -233,6 +312,8 @@ class Interval_Conv2d(nn.Module):
 
             for i in range(len(ix.edep)):
                 ix.edep[i] = F.conv2d(ix.edep[i], self.layer.weight, stride=self.layer.stride, padding=self.layer.padding)
+            if ix.edep_proj is not None:
+                ix.edep_proj = F.conv2d(ix.edep_proj, self.layer.weight.abs(), stride=self.layer.stride, padding=self.layer.padding)
             ix.shape = list(ix.c.shape[1:])
             ix.n = list(ix.c[0].reshape(-1).size())[0]
 
@@ -254,6 +335,8 @@ class Interval_Conv2d(nn.Module):
 
             for i in range(len(ix.edep)):
                 ix.edep[i] = F.conv2d(ix.edep[i], self.layer.weight, stride=self.layer.stride, padding=self.layer.padding)
+            if ix.edep_proj is not None:
+                ix.edep_proj = F.conv2d(ix.edep_proj, self.layer.weight.abs(), stride=self.layer.stride, padding=self.layer.padding)
             ix.shape = list(ix.c.shape[1:])
             ix.n = list(ix.c[0].reshape(-1).size())[0]
             ix.concretize()
@@ -404,10 +487,13 @@ class Interval_ReLU(nn.Module):
                 ix.edep[i] = ix.edep[i] * ix.edep_ind[i].mm(mask)
 
             ix.idep = ix.idep * mask.view(ix.batch_size, 1, ix.n)
+            if ix.edep_proj is not None:
+                ix.edep_proj = ix.edep_proj * mask
 
             if (m != 0):
                 ix.edep = ix.edep + [error_row]
                 ix.edep_ind = ix.edep_ind + [edep_ind]
+                consolidate_edep(ix)
 
             ix.nl, ix.nu = F.relu(ix.nl), F.relu(ix.nu)
             ix.nc, ix.ne = (ix.nl + ix.nu) / 2., (ix.nu - ix.nl) / 2.
@@ -449,10 +535,13 @@ class Interval_ReLU(nn.Module):
                 ix.edep[i] = ix.edep[i] * ix.edep_ind[i].mm(mask)
 
             ix.idep = ix.idep * mask.view(ix.batch_size, 1, ix.n)
+            if ix.edep_proj is not None:
+                ix.edep_proj = ix.edep_proj * mask
 
             if (m != 0):
                 ix.edep = ix.edep + [error_row]
                 ix.edep_ind = ix.edep_ind + [edep_ind]
+                consolidate_edep(ix)
             return ix
 
         if (isinstance(ix, Symbolic_interval_proj1)):
@@ -493,6 +582,7 @@ class Interval_ReLU(nn.Module):
             if (m != 0):
                 ix.edep = ix.edep + [error_row]
                 ix.edep_ind = ix.edep_ind + [edep_ind]
+                consolidate_edep(ix)
 
             return ix
 
@@ -554,6 +644,30 @@ class Interval_ReLU(nn.Module):
             return ix
 
 
+'''Closed-form interval softmax.
+
+* :attr:`lower` and `upper` are the bounds [B, n] of the logits.
+The softmax of node i is the smallest when its logit is at its lower
+bound and the other ones at their upper bound, and the largest in the
+opposite case: sigmoid(l_i - logsumexp_{j!=i} u_j) and
+sigmoid(u_i - logsumexp_{j!=i} l_j). The logsumexp of all the other
+nodes is computed from prefix and suffix logcumsumexp, in O(n) and
+without cancellation.
+'''
+
+
+def interval_softmax(lower, upper):
+    return torch.sigmoid(lower - logsumexp_others(upper)), torch.sigmoid(upper - logsumexp_others(lower))
+
+
+def logsumexp_others(x):
+    ''':return: for each i, the logsumexp of x over the last dimension without x_i (-inf if x has a single element)'''
+    padding = torch.full_like(x[..., :1], -float("inf"))
+    prefix = torch.cat([padding, torch.logcumsumexp(x, dim=-1)[..., :-1]], dim=-1)
+    suffix = torch.cat([torch.logcumsumexp(x.flip(-1), dim=-1).flip(-1)[..., 1:], padding], dim=-1)
+    return torch.logaddexp(prefix, suffix)
+
+
 class Interval_Softmax(nn.Module):
     def __init__(self, layer):
         nn.Module.__init__(self)
@@ -563,19 +677,8 @@ class Interval_Softmax(nn.Module):
         # print(ix.u)
         # print(ix.l)
         if (isinstance(ix, Symbolic_interval)):
-            lower = ix.u.detach().clone().unsqueeze(1).repeat((1, ix.input_size, 1))
-            upper = ix.l.detach().clone().unsqueeze(1).repeat((1, ix.input_size, 1))
-            lower = lower - lower * torch.eye(ix.input_size)  # remove elements across diagonal
-            lower = lower + ix.l.detach().clone().unsqueeze(1).repeat((1, ix.input_size, 1)) * torch.eye(ix.input_size)  # for each element add worst case
-            upper = upper - upper * torch.eye(ix.input_size)  # remove elements across diagonal
-            upper = upper + ix.u.detach().clone().unsqueeze(1).repeat((1, ix.input_size, 1)) * torch.eye(ix.input_size)
-            lower_softmax = torch.nn.functional.softmax(lower, 2)
-            upper_softmax = torch.nn.functional.softmax(upper, 2)
-            lower_masked = lower_softmax * torch.eye(ix.input_size)
-            upper_masked = upper_softmax * torch.eye(ix.input_size)
-            lower_result = torch.sum(lower_masked, dim=1)
-            upper_result = torch.sum(upper_masked, dim=1)
-            ix.update_lu(lower_result, upper_result)
+            lower, upper = interval_softmax(ix.l.detach(), ix.u.detach())
+            ix.update_lu(lower, upper)
             return ix
 
         if (isinstance(ix, Symbolic_interval_proj1)):
@@ -668,27 +771,8 @@ class Interval_Softmax(nn.Module):
             return ix
 
         if (isinstance(ix, Interval)):
-            '''
-            lower = ix.l.clamp(max=0)
-            upper = ix.u.clamp(min=0)
-            upper = torch.max(upper, lower + 1e-8)
-            mask = upper / (upper - lower)
-
-            ix.mask.append(mask)
-            '''
-            lower = ix.u.detach().clone().unsqueeze(1).repeat((1, ix.input_size, 1))
-            upper = ix.l.detach().clone().unsqueeze(1).repeat((1, ix.input_size, 1))
-            lower = lower - lower * torch.eye(ix.input_size)  # remove elements across diagonal
-            lower = lower + ix.l.detach().clone() * torch.eye(ix.input_size)  # for each element add worst case
-            upper = upper - upper * torch.eye(ix.input_size)  # remove elements across diagonal
-            upper = upper + ix.u.detach().clone() * torch.eye(ix.input_size)
-            lower_softmax = torch.nn.functional.softmax(lower, 2)
-            upper_softmax = torch.nn.functional.softmax(upper, 2)
-            lower_masked = lower_softmax * torch.eye(ix.input_size)
-            upper_masked = upper_softmax * torch.eye(ix.input_size)
-            lower_result = torch.sum(lower_masked, dim=1)
-            upper_result = torch.sum(upper_masked, dim=1)
-            ix.update_lu(lower_result, upper_result)
+            lower, upper = interval_softmax(ix.l.detach(), ix.u.detach())
+            ix.update_lu(lower, upper)
             return ix
 
 
@@ -0,0 +1,25 @@
+from unittest import TestCase
+
+import torch
+
+from symbolic.symbolic_interval import Interval_network, Symbolic_interval
+
+
+class TestConsolidateEdep(TestCase):
+    def test_budget(self):
+        torch.manual_seed(0)
+        layers = [torch.nn.Linear(3, 16)]
+        for _ in range(4):
+            layers.extend([torch.nn.ReLU(), torch.nn.Linear(16, 16)])
+        network = torch.nn.Sequential(*layers).double()
+        inet = Interval_network(network, None)
+        lower = torch.rand(8, 3, dtype=torch.float64)
+        upper = lower + 0.5
+        exact = inet(Symbolic_interval(lower=lower, upper=upper))
+        consolidated = inet(Symbolic_interval(lower=lower, upper=upper, edep_budget=4))
+        assert len(consolidated.edep) == 1 and int(consolidated.edep_ind[0].sum(dim=0).max().item()) <= 4
+        assert sum(edep.shape[0] for edep in exact.edep) > consolidated.edep[0].shape[0]
+        assert bool((consolidated.l <= exact.l + 1e-9).all()) and bool((consolidated.u >= exact.u - 1e-9).all())
+        samples = lower.unsqueeze(1) + torch.rand(8, 1000, 3, dtype=torch.float64) * (upper - lower).unsqueeze(1)
+        outputs = network(samples)
+        assert bool((outputs >= consolidated.l.unsqueeze(1) - 1e-9).all()) and bool((outputs <= consolidated.u.unsqueeze(1) + 1e-9).all())
@@ -0,0 +1,31 @@
+from unittest import TestCase
+
+import torch
+
+from symbolic.symbolic_interval import Interval_network, Symbolic_interval
+from symbolic.symbolic_interval.symbolic_network import interval_softmax
+
+
+class TestIntervalSoftmax(TestCase):
+    def test_closed_form(self):
+        torch.manual_seed(0)
+        lower = torch.randn(10, 5, dtype=torch.float64) * 20
+        upper = lower + torch.rand(10, 5, dtype=torch.float64) * 5
+        softmax_lower, softmax_upper = interval_softmax(lower, upper)
+        eye = torch.eye(5, dtype=torch.bool)
+        # worst cases: node i at one bound and the other nodes at the opposite one
+        expected_lower = torch.softmax(torch.where(eye, lower.unsqueeze(1), upper.unsqueeze(1)), dim=2)[:, eye]
+        expected_upper = torch.softmax(torch.where(eye, upper.unsqueeze(1), lower.unsqueeze(1)), dim=2)[:, eye]
+        assert torch.allclose(softmax_lower, expected_lower) and torch.allclose(softmax_upper, expected_upper)
+        single_lower, single_upper = interval_softmax(lower[:, :1], upper[:, :1])
+        assert bool((single_lower == 1).all()) and bool((single_upper == 1).all())
+
+    def test_network(self):
+        torch.manual_seed(0)
+        network = torch.nn.Sequential(torch.nn.Linear(2, 16), torch.nn.ReLU(), torch.nn.Linear(16, 3), torch.nn.Softmax(dim=1)).double()
+        lower = torch.rand(7, 2, dtype=torch.float64)
+        upper = lower + 0.1
+        result = Interval_network(network, None)(Symbolic_interval(lower=lower, upper=upper))
+        samples = lower.unsqueeze(1) + torch.rand(7, 500, 2, dtype=torch.float64) * (upper - lower).unsqueeze(1)
+        outputs = network(samples.reshape(-1, 2)).reshape(7, 500, 3)
+        assert bool((outputs >= result.l.unsqueeze(1) - 1e-12).all()) and bool((outputs <= result.u.unsqueeze(1) + 1e-12).all())
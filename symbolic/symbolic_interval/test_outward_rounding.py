@@ -0,0 +1,34 @@
+from unittest import TestCase
+
+import torch
+
+from symbolic.symbolic_interval import Interval_network, Symbolic_interval
+from symbolic.symbolic_interval.interval import outward_cast
+
+
+class TestOutwardRounding(TestCase):
+    def test_float32_contains_float64(self):
+        torch.manual_seed(0)
+        network = torch.nn.Sequential(torch.nn.Linear(4, 64), torch.nn.ReLU(), torch.nn.Linear(64, 64), torch.nn.ReLU(), torch.nn.Linear(64, 2))
+        lower = torch.rand(20, 4) * 2 - 1
+        upper = lower + 1e-4
+        rounded = Interval_network(network, None)(Symbolic_interval(lower=lower, upper=upper, outward_rounding=True))
+        # the outputs computed in float64 on the corners of the float32 domains
+        corners = torch.stack([torch.where(torch.tensor([(i >> j) & 1 for j in range(4)], dtype=torch.bool), upper, lower) for i in range(16)], dim=1)
+        outputs = network.double()(corners.double())
+        assert bool((outputs >= rounded.l.double().unsqueeze(1)).all()) and bool((outputs <= rounded.u.double().unsqueeze(1)).all())
+        assert bool((rounded.u - rounded.l).max() < 1e-2)
+
+    def test_float64_domain_cast_outward(self):
+        torch.manual_seed(0)
+        network = torch.nn.Sequential(torch.nn.Linear(4, 64), torch.nn.ReLU(), torch.nn.Linear(64, 64), torch.nn.ReLU(), torch.nn.Linear(64, 2))
+        lower = torch.rand(20, 4, dtype=torch.float64) * 2 - 1
+        upper = lower + 1e-4 * torch.rand(20, 4, dtype=torch.float64)
+        assert bool((lower.float().double() != lower).all()) and bool((upper.float().double() != upper).all())  # not representable in float32
+        lower32, upper32 = outward_cast(lower, upper, torch.float32)
+        assert bool((lower32.double() <= lower).all()) and bool((upper32.double() >= upper).all())
+        rounded = Interval_network(network, None)(Symbolic_interval(lower=lower32, upper=upper32, outward_rounding=True))
+        # the outputs computed in float64 on the corners of the original float64 domains
+        corners = torch.stack([torch.where(torch.tensor([(i >> j) & 1 for j in range(4)], dtype=torch.bool), upper, lower) for i in range(16)], dim=1)
+        outputs = network.double()(corners)
+        assert bool((outputs >= rounded.l.double().unsqueeze(1)).all()) and bool((outputs <= rounded.u.double().unsqueeze(1)).all())
@@ -0,0 +1,23 @@
+from unittest import TestCase
+
+import torch
+
+from symbolic.symbolic_interval import Interval_network, Symbolic_interval
+from symbolic.symbolic_interval.scripted_network import scripted_bounds
+
+
+class TestScriptedNetwork(TestCase):
+    def test_same_bounds(self):
+        torch.manual_seed(0)
+        network = torch.nn.Sequential(torch.nn.Linear(4, 32), torch.nn.ReLU(), torch.nn.Linear(32, 32), torch.nn.ReLU(), torch.nn.Linear(32, 2)).double()
+        inet = Interval_network(network, None)
+        lower = torch.rand(50, 4, dtype=torch.float64) * 2 - 1
+        upper = lower + 0.2
+        expected = inet(Symbolic_interval(lower=lower, upper=upper))
+        l, u = scripted_bounds(inet, lower, upper)
+        assert torch.allclose(l, expected.l) and torch.allclose(u, expected.u)
+
+    def test_unsupported(self):
+        network = torch.nn.Sequential(torch.nn.Linear(4, 2), torch.nn.Softmax(dim=1)).double()
+        lower = torch.zeros(1, 4, dtype=torch.float64)
+        assert scripted_bounds(Interval_network(network, None), lower, lower + 1) is None
@@ -14,7 +14,6 @@ import networkx as nx
 import numpy as np
 import progressbar
 import ray
-import sympy
 from rtree import index
 from sympy.combinatorics.graycode import GrayCode
 import torch
@@ -24,10 +23,13 @@ import runnables.verification_runs.aggregate_abstract_domain
 from mosaic.hyperrectangle import HyperRectangle, HyperRectangle_action
 from mosaic.workers.AbstractStepWorker import AbstractStepWorker
 from plnn.bab_explore import DomainExplorer
+from plnn.interval_network_cache import get_interval_network, interval_bounds, FORWARD
 from plnn.verification_network import VerificationNetwork
 from prism.shared_rtree import SharedRtree
 from prism.state_storage import StateStorage
-from symbolic.symbolic_interval import Interval_network, Symbolic_interval
+from symbolic.symbolic_interval import Symbolic_interval
+from symbolic.symbolic_interval.interval import outward_cast
+from symbolic.symbolic_interval.symbolic_network import interval_softmax
 from utility.standard_progressbar import StandardProgressBar
 
 
@@ -124,14 +126,21 @@ def analysis_iteration(intervals: List[HyperRectangle], n_workers: int, rtree: S
     compute_successors(env, list_assigned_action, n_workers, rounding, storage)
 
 
-def get_interval_action_probability(intervals: List[HyperRectangle], action: int, verification_model: VerificationNetwork):
+def get_interval_action_probability(intervals: List[HyperRectangle], action: int, verification_model: VerificationNetwork, method: str = FORWARD, dtype=torch.float64):
+    """
+    :param method: the propagation method of the interval network, one of plnn.interval_network_cache.BOUND_METHODS
+    :param dtype: dtype of the propagation, the bounds are rounded outward below float64
+    """
     interval_to_numpy = np.stack([interval.to_numpy() for interval in intervals])
     sequential_nn = verification_model.base_network
-    ix2 = Symbolic_interval(lower=torch.tensor(interval_to_numpy[:,0]), upper=torch.tensor(interval_to_numpy[:,1]))
-    inet = Interval_network(sequential_nn.double(), None)
-    result_interval = inet(ix2)
-    upper_bound = result_interval.u
-    lower_bound = result_interval.l
+    lower, upper = outward_cast(torch.tensor(interval_to_numpy[:, 0], dtype=torch.float64), torch.tensor(interval_to_numpy[:, 1], dtype=torch.float64), dtype)
+    ix2 = Symbolic_interval(lower=lower, upper=upper, outward_rounding=dtype != torch.float64)
+    inet = get_interval_network(sequential_nn, None, dtype)
+    upper_bound, lower_bound = interval_bounds(inet, ix2, method)
+    if dtype != torch.float64 and isinstance(sequential_nn[-1], torch.nn.Softmax):
+        # the linear layers are rounded outward by the propagation, the softmax by the error of its exp and sum
+        margin = 2 * (upper_bound.shape[1] + 4) * torch.finfo(dtype).eps
+        upper_bound, lower_bound = (upper_bound + margin).clamp(max=1), (lower_bound - margin).clamp(min=0)
     return upper_bound, lower_bound
 
 
@@ -597,8 +606,8 @@ def probability_iteration(storage: StateStorage, rtree: SharedRtree, precision,
                           unsafe_threshold=0.8, allow_assign_actions=False, allow_merge=True, allow_refine=True):
     iteration = 0
     storage.recreate_prism(horizon * 2)
-    shortest_path = nx.shortest_path(storage.graph, source=storage.root)
-    leaves = storage.get_leaves(shortest_path, unsafe_threshold, horizon * 2)
+    path_length = storage.shortest_path_length()
+    leaves = storage.get_leaves(path_length, unsafe_threshold, horizon * 2)
     leaves = [x for x in leaves if x[1] % 2 == 0]
     max_path_length = min([x[1] for x in leaves]) if len(leaves) > 0 else horizon * 2  # longest path to a leave, only even number layers
     # storage.remove_unreachable()
@@ -612,13 +621,13 @@ def probability_iteration(storage: StateStorage, rtree: SharedRtree, precision,
             # refine states which are undecided
             candidate_length_dict = defaultdict(list)
             # get the furthest nodes that have a maximum probability less than safe_threshold
-            candidates_ids = [(interval, attributes.get('lb'), attributes.get('ub')) for interval, attributes in storage.graph.nodes.data() if (
+            candidates_ids = [(interval, attributes.get('lb'), attributes.get('ub')) for interval, attributes in storage.nodes_with_attributes() if (
                     attributes.get('lb') is not None and attributes.get('ub') > safe_threshold and not attributes.get('ignore') and not attributes.get('half_fail') and not attributes.get(
                 'fail') and interval.action is not None and not is_small(interval, precision, rounding) and attributes.get('lb') < unsafe_threshold)]
             for id, lb, ub in candidates_ids:
-                if shortest_path.get(id) is not None:
+                if path_length.get(id) is not None:
                     if lb < unsafe_threshold:
-                        candidate_length = len(shortest_path[id]) - 1
+                        candidate_length = path_length[id]
                         candidate_length_dict[candidate_length].append((id, lb, ub))
                     else:
                         lower_bound_exceeded = True
@@ -649,8 +658,8 @@ def probability_iteration_PPO(storage: StateStorage, rtree: SharedRtree, precisi
                               unsafe_threshold=0.8, allow_assign_actions=False, allow_merge=True, allow_refine=True):
     iteration = 0
     storage.recreate_prism_PPO(horizon * 2)
-    shortest_path = nx.shortest_path(storage.graph, source=storage.root)
-    leaves = storage.get_leaves(shortest_path, unsafe_threshold, horizon * 2)
+    path_length = storage.shortest_path_length()
+    leaves = storage.get_leaves(path_length, unsafe_threshold, horizon * 2)
     leaves = [x for x in leaves if x[1] % 2 == 0]
     max_path_length = min([x[1] for x in leaves]) if len(leaves) > 0 else horizon * 2  # longest path to a leave, only even number layers
     # storage.remove_unreachable()
@@ -664,13 +673,13 @@ def probability_iteration_PPO(storage: StateStorage, rtree: SharedRtree, precisi
             # refine states which are undecided
             candidate_length_dict = defaultdict(list)
             # get the furthest nodes that have a maximum probability less than safe_threshold
-            candidates_ids = [(interval, attributes.get('lb'), attributes.get('ub')) for interval, attributes in storage.graph.nodes.data() if (
+            candidates_ids = [(interval, attributes.get('lb'), attributes.get('ub')) for interval, attributes in storage.nodes_with_attributes() if (
                     attributes.get('lb') is not None and attributes.get('ub') > safe_threshold and not attributes.get('ignore') and not attributes.get('half_fail') and not attributes.get(
                 'fail') and interval.action is not None and not is_small(interval, precision, rounding) and attributes.get('lb') < unsafe_threshold)]
             for id, lb, ub in candidates_ids:
-                if shortest_path.get(id) is not None:
+                if path_length.get(id) is not None:
                     if lb < unsafe_threshold:
-                        candidate_length = len(shortest_path[id]) - 1
+                        candidate_length = path_length[id]
                         candidate_length_dict[candidate_length].append((id, lb, ub))
                     else:
                         lower_bound_exceeded = True
@@ -707,7 +716,8 @@ def perform_split(ids_split: List[HyperRectangle_action], storage: StateStorage,
     intervals_unsafe = []
     for interval in ids_split:
 
-        interval_probability = (storage.graph.nodes[interval]['lb'], storage.graph.nodes[interval]['ub'])
+        attributes = storage.get_node_attributes(interval)
+        interval_probability = (attributes['lb'], attributes['ub'])
         # if interval_probability[0] >= unsafe_threshold:  # high probability of encountering a terminal state
         #     unsafe_count += 1
         #     intervals_unsafe.append(interval)
@@ -715,22 +725,22 @@ def perform_split(ids_split: List[HyperRectangle_action], storage: StateStorage,
             safe_count += 1
             intervals_safe.append(interval)
         elif is_small(interval, precision, rounding):
-            if not storage.graph.nodes[interval].get('ignore'):
+            if not attributes.get('ignore'):
                 print(f"Interval {interval} ({interval_probability[0]},{interval_probability[1]}) is too small, considering it unsafe")
                 unsafe_count += 1
                 intervals_unsafe.append(interval)
-                storage.graph.nodes[interval]['ignore'] = True
+                storage.mark_as_ignore([interval])
         else:
             # print(f"Splitting interval {interval} ({interval_probability[0]},{interval_probability[1]})")  # split
             split_performed = True
-            predecessors = list(storage.graph.predecessors(interval))
+            predecessors = storage.predecessors(interval)
             domains = interval.split(rounding)
             for parent_id in predecessors:
-                eattr = storage.graph.get_edge_data(parent_id, interval)
+                eattr = storage.get_edge_data(parent_id, interval)
                 storage.store_successor_prob([(parent_id, domain, eattr) for domain in domains])
-                storage.graph.remove_edge(parent_id, interval)
+            storage.remove_edges([(parent_id, interval) for parent_id in predecessors])
             # storage.graph.remove_node(interval)
-            storage.graph.nodes[interval]['ignore'] = True
+            storage.mark_as_ignore([interval])
             to_analyse.extend(domains)
     print(f"Safe: {safe_count} Unsafe: {unsafe_count} To Analyse:{len(to_analyse)}")
     return split_performed, to_analyse
@@ -766,13 +776,7 @@ def get_n_states(storage: prism.state_storage.StateStorage, horizon: int):
 
 
 def softmax_interval(intervals: List[Tuple]):
-    output_values = []
-    variables = sympy.symbols(f'a0:{len(intervals)}')
-    exp_sum = sum([sympy.exp(x) for x in variables])
-    for i, interval in enumerate(intervals):
-        softmax_func = sympy.exp(variables[i]) / exp_sum
-        substitutions_ub = {variables[j]: x[1] if j == i else x[0] for j, x in enumerate(intervals)}
-        substitutions_lb = {variables[j]: x[0] if j == i else x[1] for j, x in enumerate(intervals)}
-        softmax_interval_var = (float(softmax_func.subs(substitutions_lb)), float(softmax_func.subs(substitutions_ub)))
-        output_values.append(softmax_interval_var)
-    return output_values
+    """:return: the (lower, upper) interval of the softmax of each of the given (lower, upper) logit intervals"""
+    bounds = torch.tensor(intervals, dtype=torch.float64)
+    lower, upper = interval_softmax(bounds[:, 0].unsqueeze(0), bounds[:, 1].unsqueeze(0))
+    return list(zip(lower[0].tolist(), upper[0].tolist()))
@@ -11,7 +11,8 @@ from environment.pendulum_abstract import PendulumEnv_abstract
 from plnn.verification_network_sym import SymVerificationNetwork
 
 
-def generateCartpoleDomainExplorer(precision=1e-2, rounding=6, sym=False):
+def generateCartpoleDomainExplorer(precision=1e-2, rounding=6, sym=False, dtype=torch.float64):
+    """:param dtype: dtype of the symbolic exploration (sym=True), the bounds are rounded outward below float64"""
     use_cuda = False
     seed = 1
     torch.manual_seed(seed)
@@ -27,12 +28,13 @@ def generateCartpoleDomainExplorer(precision=1e-2, rounding=6, sym=False):
         verification_model = VerificationNetwork(agent.qnetwork_local).to(device)
         explorer = DomainExplorer(1, device, precision=precision, rounding=rounding)
     else:
-        verification_model = SymVerificationNetwork(agent.qnetwork_local.sequential.cpu().double())
-        explorer = SymbolicDomainExplorer(1, device, precision=precision, rounding=rounding)
+        verification_model = SymVerificationNetwork(agent.qnetwork_local.sequential.cpu().to(dtype))
+        explorer = SymbolicDomainExplorer(1, device, precision=precision, rounding=rounding, dtype=dtype)
     return explorer, verification_model, env, s, state_size, env_class
 
 
-def generatePendulumDomainExplorer(precision=1e-2, rounding=6, sym=False):
+def generatePendulumDomainExplorer(precision=1e-2, rounding=6, sym=False, dtype=torch.float64):
+    """:param dtype: dtype of the symbolic exploration (sym=True), the bounds are rounded outward below float64"""
     use_cuda = False
     seed = 1
     torch.manual_seed(seed)
@@ -48,8 +50,8 @@ def generatePendulumDomainExplorer(precision=1e-2, rounding=6, sym=False):
         verification_model = VerificationNetwork(agent.qnetwork_local.sequential.cpu().double()).to(device)
         explorer = DomainExplorer(1, device, precision=precision, rounding=rounding)
     else:
-        verification_model = SymVerificationNetwork(agent.qnetwork_local.sequential.cpu().double())
-        explorer = SymbolicDomainExplorer(1, device, precision=precision, rounding=rounding)
+        verification_model = SymVerificationNetwork(agent.qnetwork_local.sequential.cpu().to(dtype))
+        explorer = SymbolicDomainExplorer(1, device, precision=precision, rounding=rounding, dtype=dtype)
     return explorer, verification_model, env, s, state_size, env_class
 
 
@@ -0,0 +1,233 @@
+"""
+Thin abstraction over the LP/MILP solvers used by the verification code.
+Variables and constraints are identified by integer indices, constraints are always added in matrix form A @ x (sense) b.
+Backends:
+    "gurobi": gurobipy, keeps a single model so that consecutive solves are warm started
+    "highs": HiGHS through scipy.optimize.milp, no licence needed so it can run on every core
+The default backend can be changed with the SAFEDRL_LP_BACKEND environment variable.
+"""
+import os
+
+import numpy as np
+import scipy.sparse
+
+OPTIMAL = "optimal"
+INFEASIBLE = "infeasible"
+UNKNOWN = "unknown"
+MINIMIZE = 1
+MAXIMIZE = -1
+DEFAULT_BACKEND = os.environ.get("SAFEDRL_LP_BACKEND", "gurobi")
+
+
+def get_backend(name: str = None, **kwargs) -> "SolverBackend":
+    name = DEFAULT_BACKEND if name is None else name
+    if name == "gurobi":
+        return GurobiBackend(**kwargs)
+    elif name == "highs":
+        return HighsBackend(**kwargs)
+    else:
+        raise Exception(f"Unknown solver backend {name}")
+
+
+class SolverBackend:
+    name = None
+
+    def add_variables(self, n: int, lb=-np.inf, ub=np.inf, integer=False) -> np.ndarray:
+        """:return: the indices of the new variables"""
+        raise NotImplementedError
+
+    def add_constraints(self, A, x: np.ndarray, sense: str, b) -> np.ndarray:
+        """
+        Adds the rows of A @ x (sense) b
+        :param sense: one of "<", ">", "="
+        :return: the indices of the new constraints
+        """
+        raise NotImplementedError
+
+    def set_bounds(self, x: np.ndarray, lb=None, ub=None):
+        raise NotImplementedError
+
+    def set_rhs(self, rows: np.ndarray, rhs):
+        raise NotImplementedError
+
+    def set_coefficient(self, row: int, var: int, value: float):
+        raise NotImplementedError
+
+    def set_objective(self, x: np.ndarray, coefficients, sense=MINIMIZE):
+        raise NotImplementedError
+
+    def optimize(self) -> str:
+        """:return: the status of the solution, OPTIMAL, INFEASIBLE or UNKNOWN"""
+        raise NotImplementedError
+
+    @property
+    def objective_value(self) -> float:
+        raise NotImplementedError
+
+    def values(self, x: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+
+class GurobiBackend(SolverBackend):
+    name = "gurobi"
+
+    def __init__(self, output_flag=False, threads=1):
+        import gurobipy as grb
+        self.grb = grb
+        self.model = grb.Model()
+        self.model.setParam('OutputFlag', output_flag)
+        self.model.setParam('Threads', threads)
+        self.vars = []
+        self.constrs = []
+
+    def _clip(self, values):
+        return np.clip(np.asarray(values, dtype=np.float64), -self.grb.GRB.INFINITY, self.grb.GRB.INFINITY)
+
+    def add_variables(self, n: int, lb=-np.inf, ub=np.inf, integer=False) -> np.ndarray:
+        vtype = self.grb.GRB.INTEGER if integer else self.grb.GRB.CONTINUOUS
+        new_vars = self.model.addMVar(n, lb=self._clip(np.broadcast_to(lb, n)), ub=self._clip(np.broadcast_to(ub, n)), vtype=vtype)
+        start = len(self.vars)
+        self.vars.extend(new_vars.tolist() if hasattr(new_vars, "tolist") else list(new_vars))
+        return np.arange(start, len(self.vars))
+
+    def add_constraints(self, A, x: np.ndarray, sense: str, b) -> np.ndarray:
+        A = scipy.sparse.csr_matrix(A, dtype=np.float64)
+        new_constrs = self.model.addMConstr(A, [self.vars[i] for i in x], sense, self._clip(np.broadcast_to(b, A.shape[0])))
+        start = len(self.constrs)
+        self.constrs.extend(new_constrs.tolist() if hasattr(new_constrs, "tolist") else list(new_constrs))
+        return np.arange(start, len(self.constrs))
+
+    def set_bounds(self, x: np.ndarray, lb=None, ub=None):
+        variables = [self.vars[i] for i in x]
+        if lb is not None:
+            self.model.setAttr("LB", variables, self._clip(np.broadcast_to(lb, len(variables))).tolist())
+        if ub is not None:
+            self.model.setAttr("UB", variables, self._clip(np.broadcast_to(ub, len(variables))).tolist())
+
+    def set_rhs(self, rows: np.ndarray, rhs):
+        self.model.setAttr("RHS", [self.constrs[i] for i in rows], self._clip(np.broadcast_to(rhs, len(rows))).tolist())
+
+    def set_coefficient(self, row: int, var: int, value: float):
+        self.model.chgCoeff(self.constrs[row], self.vars[var], value)
+
+    def set_objective(self, x: np.ndarray, coefficients, sense=MINIMIZE):
+        expression = self.grb.LinExpr(np.broadcast_to(coefficients, len(x)).tolist(), [self.vars[i] for i in x])
+        self.model.setObjective(expression, self.grb.GRB.MINIMIZE if sense == MINIMIZE else self.grb.GRB.MAXIMIZE)
+
+    def optimize(self) -> str:
+        self.model.optimize()
+        if self.model.status == self.grb.GRB.OPTIMAL:
+            return OPTIMAL
+        elif self.model.status == self.grb.GRB.INFEASIBLE:
+            return INFEASIBLE
+        return UNKNOWN
+
+    @property
+    def objective_value(self) -> float:
+        return self.model.ObjVal
+
+    def values(self, x: np.ndarray) -> np.ndarray:
+        return np.array(self.model.getAttr("X", [self.vars[i] for i in x]))
+
+
+class HighsBackend(SolverBackend):
+    """
+    The problem is kept in python and handed to HiGHS at every optimize, there is no warm start between solves.
+    threads is accepted for compatibility with GurobiBackend, scipy runs HiGHS on a single thread.
+    """
+    name = "highs"
+
+    def __init__(self, time_limit: float = None, output_flag=False, threads=1):
+        self.time_limit = time_limit
+        self.output_flag = output_flag
+        self.lb = []
+        self.ub = []
+        self.integrality = []
+        self.rows = []  # dict var -> coefficient for each constraint
+        self.senses = []
+        self.rhs = []
+        self.objective = dict()
+        self.objective_sense = MINIMIZE
+        self.matrix = None  # cached csr matrix of the constraints, rebuilt when the coefficients change
+        self.result = None
+
+    def add_variables(self, n: int, lb=-np.inf, ub=np.inf, integer=False) -> np.ndarray:
+        start = len(self.lb)
+        self.lb.extend(np.broadcast_to(lb, n).astype(np.float64).tolist())
+        self.ub.extend(np.broadcast_to(ub, n).astype(np.float64).tolist())
+        self.integrality.extend([1 if integer else 0] * n)
+        self.matrix = None
+        return np.arange(start, len(self.lb))
+
+    def add_constraints(self, A, x: np.ndarray, sense: str, b) -> np.ndarray:
+        A = scipy.sparse.csr_matrix(A, dtype=np.float64)
+        b = np.broadcast_to(b, A.shape[0]).astype(np.float64)
+        start = len(self.rows)
+        for i in range(A.shape[0]):
+            row = A.getrow(i)
+            self.rows.append({int(x[j]): float(value) for j, value in zip(row.indices, row.data)})
+            self.senses.append(sense)
+            self.rhs.append(float(b[i]))
+        self.matrix = None
+        return np.arange(start, len(self.rows))
+
+    def set_bounds(self, x: np.ndarray, lb=None, ub=None):
+        if lb is not None:
+            for i, value in zip(x, np.broadcast_to(lb, len(x))):
+                self.lb[i] = float(value)
+        if ub is not None:
+            for i, value in zip(x, np.broadcast_to(ub, len(x))):
+                self.ub[i] = float(value)
+
+    def set_rhs(self, rows: np.ndarray, rhs):
+        for i, value in zip(rows, np.broadcast_to(rhs, len(rows))):
+            self.rhs[i] = float(value)
+
+    def set_coefficient(self, row: int, var: int, value: float):
+        self.rows[row][int(var)] = float(value)
+        self.matrix = None
+
+    def set_objective(self, x: np.ndarray, coefficients, sense=MINIMIZE):
+        self.objective = {int(i): float(value) for i, value in zip(x, np.broadcast_to(coefficients, len(x)))}
+        self.objective_sense = sense
+
+    def _constraint_matrix(self):
+        if self.matrix is None:
+            indptr = [0]
+            indices = []
+            data = []
+            for row in self.rows:
+                indices.extend(row.keys())
+                data.extend(row.values())
+                indptr.append(len(indices))
+            self.matrix = scipy.sparse.csr_matrix((data, indices, indptr), shape=(len(self.rows), len(self.lb)))
+        return self.matrix
+
+    def optimize(self) -> str:
+        from scipy.optimize import milp, Bounds, LinearConstraint
+        c = np.zeros(len(self.lb))
+        for i, value in self.objective.items():
+            c[i] = value * self.objective_sense  # HiGHS always minimises
+        constraints = []
+        if len(self.rows) != 0:
+            senses = np.array(self.senses)
+            rhs = np.array(self.rhs)
+            row_lb = np.where(senses == "<", -np.inf, rhs)
+            row_ub = np.where(senses == ">", np.inf, rhs)
+            constraints.append(LinearConstraint(self._constraint_matrix(), row_lb, row_ub))
+        options = {"disp": bool(self.output_flag)}
+        if self.time_limit is not None:
+            options["time_limit"] = self.time_limit
+        self.result = milp(c, integrality=np.array(self.integrality), bounds=Bounds(np.array(self.lb), np.array(self.ub)), constraints=constraints, options=options)
+        if self.result.status == 0:
+            return OPTIMAL
+        elif self.result.status == 2:
+            return INFEASIBLE
+        return UNKNOWN
+
+    @property
+    def objective_value(self) -> float:
+        return self.result.fun * self.objective_sense
+
+    def values(self, x: np.ndarray) -> np.ndarray:
+        return self.result.x[np.asarray(x)]
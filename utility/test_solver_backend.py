@@ -0,0 +1,43 @@
+from unittest import TestCase
+
+import numpy as np
+
+from utility.solver_backend import MAXIMIZE, MINIMIZE, OPTIMAL, get_backend
+
+
+class TestSolverBackend(TestCase):
+    def test_modify_lp(self):
+        for name in ("gurobi", "highs"):
+            solver = get_backend(name)
+            x = solver.add_variables(2, lb=0, ub=10)
+            row = solver.add_constraints(np.array([[1.0, 1.0]]), x, ">", 1)
+            solver.set_objective(x, 1.0, MINIMIZE)
+            assert solver.optimize() == OPTIMAL and abs(solver.objective_value - 1) < 1e-9, name
+            solver.set_rhs(row, 3)  # x + y >= 3
+            assert solver.optimize() == OPTIMAL and abs(solver.objective_value - 3) < 1e-9, name
+            solver.set_coefficient(row[0], x[0], 2)  # 2x + y >= 3
+            assert solver.optimize() == OPTIMAL and abs(solver.objective_value - 1.5) < 1e-9, name
+            solver.set_bounds(x[:1], ub=1)
+            assert solver.optimize() == OPTIMAL and abs(solver.objective_value - 2) < 1e-9, name
+            assert np.allclose(solver.values(x), [1, 1]), name
+            solver.set_bounds(x, lb=[0, 4], ub=[1, 5])
+            solver.set_objective(x, [1.0, 1.0], MAXIMIZE)
+            assert solver.optimize() == OPTIMAL and abs(solver.objective_value - 6) < 1e-9, name
+
+    def test_integer_variables(self):
+        # y = max(x, 0) with a binary switch, as in the MILP encoding of the ReLUs
+        M = 10e4
+        for name in ("gurobi", "highs"):
+            for x_value in (-5.0, -1e-3, 0.0, 2.5):
+                solver = get_backend(name)
+                x = solver.add_variables(1, lb=x_value, ub=x_value)
+                y = solver.add_variables(1, lb=0)
+                w = solver.add_variables(1, lb=0)
+                z = solver.add_variables(1, lb=0, ub=1, integer=True)
+                solver.add_constraints(np.array([[1, -1, 1]]), np.concatenate([x, y, w]), "=", 0)
+                solver.add_constraints(np.array([[1, -M]]), np.concatenate([y, z]), "<", 0)
+                solver.add_constraints(np.array([[1, M]]), np.concatenate([w, z]), "<", M)
+                for sense in (MINIMIZE, MAXIMIZE):
+                    solver.set_objective(y, 1.0, sense)
+                    assert solver.optimize() == OPTIMAL, name
+                    assert abs(solver.objective_value - max(x_value, 0)) < 1e-6, (name, x_value)